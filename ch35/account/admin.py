@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from account.models import User
+from account.models import User, OutboxEmail
 
 # Register your models here.
 class UserModelAdmin(UserAdmin):
@@ -39,4 +39,14 @@ class UserModelAdmin(UserAdmin):
 
 
 # Now register the new UserModelAdmin
-admin.site.register(User, UserModelAdmin)
\ No newline at end of file
+admin.site.register(User, UserModelAdmin)
+
+class OutboxEmailModelAdmin(admin.ModelAdmin):
+    model = OutboxEmail
+    list_display = ["id", "to_email", "subject", "status", "attempts",
+                    "next_attempt_at", "sent_at"]
+    list_filter = ["status"]
+    search_fields = ["to_email"]
+
+
+admin.site.register(OutboxEmail, OutboxEmailModelAdmin)
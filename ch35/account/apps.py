@@ -1,5 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
 
 
 class AccountConfig(AppConfig):
     name = 'account'
+
+    def ready(self):
+        from account import permission_cache, user_cache
+        from account.checks import check_shared_caches
+        permission_cache.connect_signals()
+        user_cache.connect_signals()
+        checks.register(check_shared_caches, checks.Tags.caches)
+
+        if getattr(settings, 'DEFER_LAST_LOGIN', False):
+            # Swap the per-login UPDATE of last_login for a buffered bulk update
+            from django.contrib.auth.signals import user_logged_in
+            from account.last_login import defer_last_login
+            user_logged_in.disconnect(dispatch_uid='update_last_login')
+            user_logged_in.connect(defer_last_login, dispatch_uid='defer_last_login')
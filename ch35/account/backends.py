@@ -0,0 +1,107 @@
+from django.contrib.auth import user_login_failed
+from django.contrib.auth.backends import ModelBackend
+from account.models import User
+from account import permission_cache
+from account.hashing import acheck_password, amake_password
+
+# Reasons returned by authenticate_with_reason() when authentication fails
+UNKNOWN_USER = 'unknown'
+INACTIVE_USER = 'inactive'
+BAD_PASSWORD = 'bad_password'
+
+
+class EmailBackend(ModelBackend):
+    # Authenticates account.User by email with a single, case-insensitive
+    # index seek and keeps the reason for a failure, so login_view does not
+    # need its own lookup first.
+
+    def check_credentials(self, email, password):
+        # Returns (user, None) on success or (user_or_None, reason) on failure
+        user = User.objects.with_email(email).first()
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            User().set_password(password)
+            return None, UNKNOWN_USER
+        if not self.user_can_authenticate(user):
+            return user, INACTIVE_USER
+        if not user.check_password(password):
+            return user, BAD_PASSWORD
+        return user, None
+
+    async def acheck_credentials(self, email, password):
+        # Same as check_credentials() with the hashing done in the process pool
+        user = await User.objects.with_email(email).afirst()
+        if user is None:
+            await amake_password(password)
+            return None, UNKNOWN_USER
+        if not self.user_can_authenticate(user):
+            return user, INACTIVE_USER
+        if not await acheck_password(user, password):
+            return user, BAD_PASSWORD
+        return user, None
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        email = email or username
+        if email is None or password is None:
+            return None
+        user, reason = self.check_credentials(email, password)
+        if reason is None:
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, email=None, **kwargs):
+        email = email or username
+        if email is None or password is None:
+            return None
+        user, reason = await self.acheck_credentials(email, password)
+        if reason is None:
+            return user
+        return None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        # Serve the effective permission set from the shared cache so that
+        # has_perm() and template {{ perms }} checks skip the database on
+        # warm requests. The instance attribute still avoids repeated cache
+        # reads within one request.
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = permission_cache.get_permissions(
+                user_obj, lambda: super(EmailBackend, self).get_all_permissions(user_obj))
+        return user_obj._perm_cache
+
+    def has_perm(self, user_obj, perm, obj=None):
+        # Object-level: the model permission, on objects the user owns. The
+        # owner comes from the object's own row (is_owned_by()), so this is
+        # as cheap as the model-level check. Listings should filter or
+        # annotate in SQL instead, see ProductQuerySet.with_permissions().
+        if obj is None:
+            return super().has_perm(user_obj, perm)
+        is_owned_by = getattr(obj, 'is_owned_by', None)
+        return (is_owned_by is not None and is_owned_by(user_obj)
+                and super().has_perm(user_obj, perm))
+
+
+def authenticate_with_reason(request, email, password):
+    # Like django.contrib.auth.authenticate() for EmailBackend only, but it
+    # also tells the caller why authentication failed.
+    backend = EmailBackend()
+    user, reason = backend.check_credentials(email, password)
+    if reason is not None:
+        user_login_failed.send(
+            sender=__name__, credentials={'email': email}, request=request)
+        return None, reason
+    user.backend = f'{backend.__module__}.{backend.__class__.__name__}'
+    return user, None
+
+
+async def aauthenticate_with_reason(request, email, password):
+    backend = EmailBackend()
+    user, reason = await backend.acheck_credentials(email, password)
+    if reason is not None:
+        await user_login_failed.asend(
+            sender=__name__, credentials={'email': email}, request=request)
+        return None, reason
+    user.backend = f'{backend.__module__}.{backend.__class__.__name__}'
+    return user, None
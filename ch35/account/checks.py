@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core import checks
+from core.checks import is_process_local
+
+
+def check_shared_caches(app_configs, **kwargs):
+    # Invalidation has to reach every worker, see core.checks
+    errors = []
+    alias = getattr(settings, 'PERMISSION_CACHE_ALIAS', 'default')
+    if is_process_local(alias):
+        errors.append(checks.Error(
+            f"PERMISSION_CACHE_ALIAS '{alias}' is a per-process local memory cache.",
+            hint="Revoked permissions and groups would keep working in the other worker "
+                 "processes until PERMISSION_CACHE_TIMEOUT. Point it at a cache all "
+                 "processes share (file based, database, memcached, redis).",
+            id='account.E001',
+        ))
+    alias = getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')
+    if ('account.middleware.CachedAuthenticationMiddleware' in settings.MIDDLEWARE
+            and is_process_local(alias)):
+        errors.append(checks.Error(
+            f"AUTH_USER_CACHE_ALIAS '{alias}' is a per-process local memory cache.",
+            hint="After a password change the other worker processes would keep "
+                 "accepting the old sessions until AUTH_USER_CACHE_TIMEOUT. Point it "
+                 "at a cache all processes share, or remove "
+                 "CachedAuthenticationMiddleware.",
+            id='account.E002',
+        ))
+    alias = getattr(settings, 'TOKEN_CACHE_ALIAS', 'default')
+    if is_process_local(alias):
+        errors.append(checks.Warning(
+            f"TOKEN_CACHE_ALIAS '{alias}' is a per-process local memory cache.",
+            hint="A used activation or password reset link is only remembered by the "
+                 "worker process that consumed it. Point it at a cache all processes "
+                 "share.",
+            id='account.W001',
+        ))
+    return errors
@@ -0,0 +1,82 @@
+import re
+import threading
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.html import escape, strip_tags
+
+# Our transactional emails differ only by one URL. Each template is rendered
+# once with a placeholder in the slot of that URL and split around it, so a
+# message is just the static parts joined with the (escaped) URL. The plain
+# text alternative is derived from the same render once, instead of running
+# strip_tags() over every message body.
+PLACEHOLDER = '@@EMAIL-SLOT-7f3c9a@@'
+
+ANCHOR_RE = re.compile(r'<a\b[^>]*\bhref="((?!#|mailto:)[^"]+)"[^>]*>(.*?)</a>', re.S | re.I)
+BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+
+def html_to_text(html):
+    # Keep the target of links, strip_tags() alone would drop the URL that is
+    # the whole point of these emails
+    html = ANCHOR_RE.sub(lambda match: f'{match.group(2)}: {match.group(1)}', html)
+    lines = (line.strip() for line in strip_tags(html).splitlines())
+    return BLANK_LINES_RE.sub('\n\n', '\n'.join(lines)).strip() + '\n'
+
+
+class EmailTemplate:
+    # Only for templates whose output does not otherwise depend on the slot
+    # value (no {% if %} on it, no filters that change its length ...).
+
+    def __init__(self, template_name, subject, slot):
+        self.template_name = template_name
+        self.subject_format = subject
+        self.slot = slot
+        self.compiled = False
+        self.lock = threading.Lock()
+
+    def compile(self):
+        with self.lock:
+            if self.compiled:
+                return
+            html = render_to_string(self.template_name, {self.slot: PLACEHOLDER})
+            self.html_parts = html.split(PLACEHOLDER)
+            self.text_parts = html_to_text(html).split(PLACEHOLDER)
+            self.subject = self.subject_format.format(site_name=settings.SITE_NAME)
+            self.compiled = True
+
+    def render(self, value):
+        # Returns (html, text) for one slot value
+        if not self.compiled:
+            self.compile()
+        return escape(value).join(self.html_parts), value.join(self.text_parts)
+
+    def render_many(self, values):
+        if not self.compiled:
+            self.compile()
+        html_parts, text_parts = self.html_parts, self.text_parts
+        return [(escape(value).join(html_parts), value.join(text_parts)) for value in values]
+
+
+EMAIL_TEMPLATES = {
+    'activation': EmailTemplate(
+        'account/activation_email.html',
+        "Activate your account on {site_name}",
+        'activation_url',
+    ),
+    'reset_password': EmailTemplate(
+        'account/reset_password_email.html',
+        "Reset Your Password on {site_name}",
+        'reset_url',
+    ),
+}
+
+
+def get_email_template(name):
+    return EMAIL_TEMPLATES[name]
+
+
+def reset_email_templates():
+    # Recompile on next use, e.g. after editing the templates or SITE_NAME
+    for template in EMAIL_TEMPLATES.values():
+        template.compiled = False
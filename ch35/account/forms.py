@@ -1,4 +1,5 @@
 from django import forms
+from django.contrib.auth.forms import PasswordChangeForm
 from account.models import User
 
 class RegistrationForm(forms.ModelForm):
@@ -15,23 +16,19 @@ class RegistrationForm(forms.ModelForm):
         model = User
         fields = ["email", "name", "password", "confirm_password"]
 
-        def clean(self):
-            cleaned_data = super().clean()
-            password = cleaned_data.get('password')
-            confirm_password = cleaned_data.get('confirm_password')
+    # Uniqueness of the email is checked case-insensitively by model
+    # validation against the account_user_email_key index, one query
 
-            if password != confirm_password:
-                self.add_error('confirm_password',
-                               'Password and Confirm Password do not match.')
+    def clean(self):
+        cleaned_data = super().clean()
+        password = cleaned_data.get('password')
+        confirm_password = cleaned_data.get('confirm_password')
 
-            return cleaned_data
+        if password != confirm_password:
+            self.add_error('confirm_password',
+                           'Password and Confirm Password do not match.')
 
-        def clean_email(self):
-            email = self.cleaned_data.get('email')
-            if User.objects.filter(email=email).exists():
-                raise forms.ValidationError(
-                    "A user with this email already exists.")
-            return email
+        return cleaned_data
         
 class PasswordResetForm(forms.Form):
     email = forms.EmailField(
@@ -43,9 +40,27 @@ class PasswordResetForm(forms.Form):
     def clean_email(self):
         email = self.cleaned_data.get('email')
 
-        # Check if a user with this email exists
-        if not User.objects.filter(email=email).exists():
+        # Check if a user with this email exists, and keep it for the view
+        self.user = User.objects.with_email(email).first()
+        if self.user is None:
             raise forms.ValidationError(
                 ('No account is associated with this email address.')
             )
-        return email
\ No newline at end of file
+        return email
+
+class OffloadedPasswordChangeForm(PasswordChangeForm):
+    # PasswordChangeForm hashes the old password inside clean_old_password().
+    # The async password change view checks it in the hashing process pool
+    # first and passes the result in, so validation does no hashing itself.
+    def __init__(self, *args, old_password_valid=False, **kwargs):
+        self.old_password_valid = old_password_valid
+        super().__init__(*args, **kwargs)
+
+    def clean_old_password(self):
+        old_password = self.cleaned_data["old_password"]
+        if not self.old_password_valid:
+            raise forms.ValidationError(
+                self.error_messages["password_incorrect"],
+                code="password_incorrect",
+            )
+        return old_password
@@ -0,0 +1,74 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+# Password hashing (PBKDF2 by default) costs 100+ ms of CPU per call. The
+# async views hand that work to a bounded process pool and await it, so the
+# event loop keeps serving other requests in the meantime.
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def init_hash_worker(settings_module):
+    # Pool processes are spawned, they need their own configured Django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count(),
+                # fork() of a threaded server process is unsafe
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_hash_worker,
+                initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+            )
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+async def run_hasher(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(func, *args))
+
+
+async def amake_password(password):
+    return await run_hasher(make_password, password)
+
+
+async def aset_password(user, raw_password):
+    # Async counterpart of AbstractBaseUser.set_password()
+    user.password = await amake_password(raw_password)
+    user._password = raw_password
+
+
+async def acheck_password(user, raw_password):
+    # Async counterpart of AbstractBaseUser.check_password(), including the
+    # upgrade of hashes made with outdated hasher settings.
+    if not await run_hasher(check_password, raw_password, user.password):
+        return False
+    try:
+        must_update = identify_hasher(user.password).must_update(user.password)
+    except ValueError:
+        must_update = False
+    if must_update:
+        await aset_password(user, raw_password)
+        await user.asave(update_fields=['password'])
+    return True
@@ -0,0 +1,72 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from account.models import User
+
+
+class LastLoginBuffer:
+    # Collects last_login timestamps in memory and writes them with a single
+    # bulk UPDATE once enough logins have piled up or the oldest one is too
+    # old, instead of one UPDATE inside every login request. A timer started
+    # with the first pending login flushes after max_age even when no other
+    # login comes in.
+
+    def __init__(self, max_size=100, max_age=30):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.pending = {}
+        self.first_recorded = None
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def record(self, user_id, when=None):
+        with self.lock:
+            self.pending[user_id] = when or timezone.now()
+            if self.first_recorded is None:
+                self.first_recorded = time.monotonic()
+                self.timer = threading.Timer(self.max_age, self.flush_from_timer)
+                self.timer.daemon = True
+                self.timer.start()
+            due = (len(self.pending) >= self.max_size
+                   or time.monotonic() - self.first_recorded >= self.max_age)
+        if due:
+            self.flush()
+
+    def flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own database connection
+            connections.close_all()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.first_recorded = None
+            timer, self.timer = self.timer, None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        if not pending:
+            return 0
+        users = [User(pk=user_id, last_login=when) for user_id, when in pending.items()]
+        User.objects.bulk_update(users, ['last_login'], batch_size=500)
+        return len(users)
+
+
+last_login_buffer = LastLoginBuffer(
+    max_size=getattr(settings, 'LAST_LOGIN_BUFFER_SIZE', 100),
+    max_age=getattr(settings, 'LAST_LOGIN_BUFFER_MAX_AGE', 30),
+)
+
+
+def defer_last_login(sender, user, **kwargs):
+    # Replacement for django.contrib.auth.models.update_last_login
+    user.last_login = timezone.now()
+    last_login_buffer.record(user.pk, user.last_login)
+
+
+atexit.register(last_login_buffer.flush)
@@ -0,0 +1,79 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from account.hashing import amake_password, shutdown_executor
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ("Compare a fixed number of worker threads hashing inline against an "
+            "event loop that offloads hashing, under a mix of login-like and "
+            "I/O-bound requests")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help="Worker threads of the inline (WSGI-like) server")
+        parser.add_argument('--hash-requests', type=int, default=8)
+        parser.add_argument('--io-requests', type=int, default=200)
+        parser.add_argument('--io-latency', type=float, default=0.01,
+                            help="Seconds each I/O-bound request waits")
+
+    def handle(self, *args, **options):
+        workload = (['hash'] * options['hash_requests']
+                    + ['io'] * options['io_requests'])
+        random.Random(0).shuffle(workload)
+        io_latency = options['io_latency']
+
+        inline = self.run_inline(workload, options['threads'], io_latency)
+        # Start the pool outside the measurement, spawning takes a moment
+        asyncio.run(amake_password('warm-up'))
+        try:
+            offloaded = asyncio.run(self.run_offloaded(workload, io_latency))
+        finally:
+            shutdown_executor()
+
+        for label, (elapsed, io_latencies) in (('inline', inline), ('offloaded', offloaded)):
+            self.stdout.write(
+                f"{label:>9}: {len(workload) / elapsed:7.1f} req/s, I/O request latency "
+                f"p50 {statistics.median(io_latencies) * 1000:6.1f} ms "
+                f"p99 {percentile(io_latencies, 0.99) * 1000:6.1f} ms"
+            )
+
+    def run_inline(self, workload, threads, io_latency):
+        io_latencies = []
+
+        def handle_request(kind, queued_at):
+            if kind == 'hash':
+                make_password('bench-password')
+            else:
+                time.sleep(io_latency)
+                io_latencies.append(time.perf_counter() - queued_at)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as server:
+            for kind in workload:
+                server.submit(handle_request, kind, time.perf_counter())
+        return time.perf_counter() - started, io_latencies
+
+    async def run_offloaded(self, workload, io_latency):
+        io_latencies = []
+
+        async def handle_request(kind, queued_at):
+            if kind == 'hash':
+                await amake_password('bench-password')
+            else:
+                await asyncio.sleep(io_latency)
+                io_latencies.append(time.perf_counter() - queued_at)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(handle_request(kind, time.perf_counter()) for kind in workload))
+        return time.perf_counter() - started, io_latencies
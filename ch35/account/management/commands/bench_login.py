@@ -0,0 +1,76 @@
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import update_last_login
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from account.backends import authenticate_with_reason
+from account.last_login import last_login_buffer
+from account.models import User
+from benchmark.database import test_database
+
+
+def legacy_login(email, password):
+    # What login_view used to do before the session write: its own lookup,
+    # authenticate() looking the user up again, then the last_login UPDATE.
+    user = User.objects.get(email=email)
+    if not user.is_active:
+        return None
+    user = ModelBackend().authenticate(None, email=email, password=password)
+    if user is not None:
+        update_last_login(None, user)
+    return user
+
+
+def single_lookup_login(email, password):
+    user, failure = authenticate_with_reason(None, email, password)
+    if user is not None:
+        last_login_buffer.record(user.pk)
+    return user
+
+
+class Command(BaseCommand):
+    help = "Compare queries and throughput of the old and new login credential checks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--real-hasher', action='store_true',
+                            help="Use PASSWORD_HASHERS from settings instead of MD5, "
+                                 "hashing then dominates both timings")
+
+    def handle(self, *args, **options):
+        hashers = None if options['real_hasher'] else [
+            'django.contrib.auth.hashers.MD5PasswordHasher']
+        # The users are created in a throwaway database, never the real one
+        with test_database(), \
+                override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})):
+            self.run(options['users'], options['rounds'])
+
+    def run(self, user_count, rounds):
+        password = 'bench-password'
+        users = []
+        for number in range(user_count):
+            user = User(email=f'bench-login-{number}@example.com', is_active=True)
+            user.set_password(password)
+            users.append(user)
+        User.objects.bulk_create(users)
+        emails = [user.email for user in users]
+
+        for label, login_func in (('legacy', legacy_login),
+                                  ('single lookup', single_lookup_login)):
+            with CaptureQueriesContext(connection) as queries:
+                login_func(emails[0], password)
+            last_login_buffer.flush()
+
+            started = time.perf_counter()
+            for _ in range(rounds):
+                for email in emails:
+                    login_func(email, password)
+            elapsed = time.perf_counter() - started
+            last_login_buffer.flush()
+            self.stdout.write(
+                f"{label:>14}: {len(queries.captured_queries)} queries per login, "
+                f"{rounds * len(emails) / elapsed:,.0f} logins/s"
+            )
@@ -0,0 +1,61 @@
+import secrets
+import time
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from account.models import User
+from account.tokens import activation_token_generator
+
+
+def legacy_check(uidb64, token):
+    # What activate_account did before: decode, load the user, then check
+    try:
+        user = User.objects.get(pk=force_str(urlsafe_base64_decode(uidb64)))
+    except (TypeError, ValueError, OverflowError, User.DoesNotExist):
+        return False
+    return default_token_generator.check_token(user, token)
+
+
+def signed_check(token):
+    user_id = activation_token_generator.verify(token)
+    if user_id is None:
+        return False
+    user = User.objects.filter(pk=user_id).first()
+    return user is not None and activation_token_generator.check_user(user, token)
+
+
+class Command(BaseCommand):
+    help = "Measure how fast forged activation links are rejected, old and new token format"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--links', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            self.stderr.write("Create at least one user first.")
+            return
+        # Bots reuse real user ids with random tokens, the worst case for
+        # the old format because every link reaches the database
+        uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+        valid_token = activation_token_generator.make_token(user)
+        legacy_links = [(uidb64, secrets.token_urlsafe(24)) for _ in range(options['links'])]
+        signed_links = [valid_token[:-8] + secrets.token_urlsafe(6)[:8]
+                        for _ in range(options['links'])]
+
+        for label, check, links in (
+            ('uidb64 + token', lambda link: legacy_check(*link), legacy_links),
+            ('signed token', signed_check, signed_links),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                rejected = sum(not check(link) for link in links)
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{label:>15}: {rejected / elapsed:,.0f} rejected links/s, "
+                f"{len(queries.captured_queries) / len(links):.2f} queries per link"
+            )
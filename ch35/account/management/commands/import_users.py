@@ -0,0 +1,204 @@
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import NamedTuple
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.core.validators import validate_email
+from django.db import transaction
+from account.hashing import init_hash_worker
+from account.models import User, OutboxEmail
+from account.utils import activation_url_for, build_template_emails
+from core.utils import assign_permission_bulk
+
+ROLES = ('customer', 'seller')
+
+
+class InvalidRecord(NamedTuple):
+    # Stands in for a line that could not be read, skipped like any other
+    # invalid record instead of ending the import
+    reason: str
+
+
+def read_json_record(line):
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as error:
+        return InvalidRecord(f"invalid JSON ({error})")
+    if not isinstance(record, dict):
+        return InvalidRecord(f"expected a JSON object, got {type(record).__name__}")
+    return record
+
+
+def read_records(path, file_format):
+    # Yields (line number, dict) pairs, line numbers count data records from 1
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            for number, row in enumerate(csv.DictReader(source), start=1):
+                yield number, row
+        else:
+            for number, line in enumerate(source, start=1):
+                line = line.strip()
+                yield number, (read_json_record(line) if line else None)
+
+
+class Command(BaseCommand):
+    help = ("Import users from a CSV or JSONL file with the columns email, name, "
+            "city, role, password (or an already hashed password_hash)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Processes used for password hashing")
+        parser.add_argument('--offset', type=int, default=None,
+                            help="Skip this many records, to resume an interrupted import")
+        parser.add_argument('--checkpoint',
+                            help="File that stores the offset of the last committed batch")
+        parser.add_argument('--active', action='store_true',
+                            help="Mark users active instead of sending activation emails")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        batch_size = options['batch_size']
+        self.active = options['active']
+        self.checkpoint = options['checkpoint']
+        self.workers = options['workers']
+
+        offset = options['offset']
+        if offset is None:
+            offset = self.read_checkpoint()
+        if offset:
+            self.stdout.write(f"Resuming after record {offset}")
+
+        self.created = self.skipped = 0
+        self.started = time.perf_counter()
+        records = islice(read_records(path, file_format), offset, None)
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_hash_worker,
+            initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+        ) as pool:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                self.import_batch(batch, pool)
+                self.write_checkpoint(batch[-1][0])
+                self.report(batch[-1][0])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {self.created} created, {self.skipped} skipped."))
+
+    def read_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as checkpoint:
+                return int(checkpoint.read().strip() or 0)
+        return 0
+
+    def write_checkpoint(self, offset):
+        if self.checkpoint:
+            with open(self.checkpoint, 'w') as checkpoint:
+                checkpoint.write(str(offset))
+
+    def report(self, offset):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f"record {offset}: {self.created} created, {self.skipped} skipped "
+            f"({self.created / elapsed:,.0f} users/s)")
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f"record {number}: skipped, {reason}")
+
+    def parse(self, batch):
+        # keys maps the lowercased email to the spelling of the record, email
+        # uniqueness is case-insensitive
+        rows, keys = {}, {}
+        for number, record in batch:
+            if isinstance(record, InvalidRecord):
+                self.skip(number, record.reason)
+                continue
+            if not record:
+                continue
+            email = User.objects.normalize_email((record.get('email') or '').strip())
+            try:
+                validate_email(email)
+            except ValidationError:
+                self.skip(number, f"invalid email {email!r}")
+                continue
+            role = (record.get('role') or 'customer').strip().lower()
+            if role not in ROLES:
+                self.skip(number, f"unknown role {role!r}")
+                continue
+            if email.lower() in keys:
+                self.skip(number, f"duplicate email {email}")
+                continue
+            keys[email.lower()] = email
+            rows[email] = (number, record, role)
+
+        existing = User.objects.with_emails(rows).values_list('email', flat=True)
+        for existing_email in existing:
+            email = keys[existing_email.lower()]
+            self.skip(rows.pop(email)[0], f"{email} already exists")
+        return rows
+
+    def import_batch(self, batch, pool):
+        rows = self.parse(batch)
+        if not rows:
+            return
+
+        # PBKDF2 is the slow part, spread it over all cores
+        to_hash = [(email, record.get('password') or None)
+                   for email, (number, record, role) in rows.items()
+                   if not record.get('password_hash')]
+        hashed = dict(zip(
+            (email for email, password in to_hash),
+            pool.map(make_password, (password for email, password in to_hash),
+                     chunksize=max(1, len(to_hash) // (self.workers * 4))),
+        ))
+
+        users = []
+        for email, (number, record, role) in rows.items():
+            users.append(User(
+                email=email,
+                name=record.get('name') or '',
+                city=record.get('city') or '',
+                password=record.get('password_hash') or hashed[email],
+                is_active=self.active,
+                is_seller=role == 'seller',
+                is_customer=role != 'seller',
+            ))
+
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=len(users))
+            if any(user.pk is None for user in users):
+                # Backends that can't return ids from a bulk insert
+                ids = {email.lower(): pk for email, pk in
+                       User.objects.with_emails(rows).values_list('email', 'pk')}
+                for user in users:
+                    user.pk = ids[user.email.lower()]
+
+            by_role = defaultdict(list)
+            for user in users:
+                by_role[rows[user.email][2]].append(user)
+            for role, role_users in by_role.items():
+                assign_permission_bulk(role_users, role)
+
+            if not self.active:
+                OutboxEmail.objects.bulk_create(
+                    build_template_emails(
+                        'activation',
+                        [(user.email, activation_url_for(user)) for user in users]),
+                    batch_size=500,
+                )
+        self.created += len(users)
@@ -0,0 +1,34 @@
+import signal
+from django.core.management.base import BaseCommand
+from account.outbox import OutboxWorkerPool, drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued emails from the outbox over pooled SMTP connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of worker threads (default: OUTBOX_WORKERS)")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Rows claimed per batch (default: OUTBOX_BATCH_SIZE)")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain what is due over one connection and exit")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            sent = drain_outbox(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Sent {sent} email(s)."))
+            return
+
+        pool = OutboxWorkerPool(workers=options['workers'],
+                                batch_size=options['batch_size'])
+        signal.signal(signal.SIGTERM, lambda *args: pool.stop_event.set())
+        pool.start()
+        self.stdout.write(f"Outbox worker pool started with {pool.workers} worker(s).")
+        try:
+            while not pool.stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        pool.stop()
+        self.stdout.write(self.style.SUCCESS(f"Stopped, sent {pool.sent} email(s)."))
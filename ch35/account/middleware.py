@@ -0,0 +1,27 @@
+from functools import partial
+
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+from account import user_cache
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = user_cache.get_user(request)
+    return request._cached_user
+
+
+async def auser(request):
+    if not hasattr(request, '_acached_user'):
+        request._acached_user = await user_cache.aget_user(request)
+    return request._acached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    # AuthenticationMiddleware that serves request.user from the user cache
+    # (account.user_cache) instead of a users table query per request
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = partial(auser, request)
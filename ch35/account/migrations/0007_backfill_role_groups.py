@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# (group name, User flag). The names are core.utils.role_group_name(), not
+# imported: a migration must not depend on code that may change later.
+ROLE_GROUPS = [('Customer Role', 'is_customer'), ('Seller Role', 'is_seller')]
+
+
+def backfill_role_groups(apps, schema_editor):
+    # Users from before the role groups only hold direct user_permissions,
+    # put them in the group of their role too. The groups get their
+    # permissions from core.utils.sync_role_groups() on post_migrate, once
+    # every Permission row exists.
+    db = schema_editor.connection.alias
+    Group = apps.get_model('auth', 'Group')
+    User = apps.get_model('account', 'User')
+    Membership = User.groups.through
+    for name, flag in ROLE_GROUPS:
+        group, _ = Group.objects.using(db).get_or_create(name=name)
+        user_ids = User.objects.using(db).filter(**{flag: True}).values_list('pk', flat=True)
+        Membership.objects.using(db).bulk_create(
+            [Membership(user_id=user_id, group_id=group.pk) for user_id in user_ids],
+            batch_size=500, ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_user_email_key'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_role_groups, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,30 @@
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser,BaseUserManager,PermissionsMixin
 
-class UserManager(BaseUserManager):
+class UserQuerySet(models.QuerySet):
+    def with_email(self, email):
+        # Case-insensitive match as LOWER(email) = LOWER(%s), which is a single
+        # seek on the unique account_user_email_key index. Both sides are
+        # lowered by the database so they always agree, iexact would not use
+        # the index.
+        return self.alias(email_key=Lower('email')).filter(
+            email_key=Lower(models.Value(email.strip())))
+
+    def with_emails(self, emails):
+        # Bulk version for imports. The keys are lowered by the database as
+        # well: it must agree with the Lower('email') unique index, and
+        # SQLite's lower() only folds ASCII where str.lower() folds all.
+        return self.alias(email_key=Lower('email')).filter(
+            email_key__in=[Lower(models.Value(email.strip())) for email in emails])
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    def get_by_natural_key(self, username):
+        return self.with_email(username).get()
+
     def create_user(self,email,password=None):
         # Creates and saves an User with the given email and password.
         if not email:
@@ -28,7 +51,8 @@ class UserManager(BaseUserManager):
         return user
 
 class User(AbstractBaseUser,PermissionsMixin):
-    email = models.EmailField(max_length=255,unique=True)
+    # Unique case-insensitively through the account_user_email_key index below
+    email = models.EmailField(max_length=255)
     name = models.CharField(max_length=255,blank=True)
     city = models.CharField(max_length=255,blank=True)
     is_active = models.BooleanField(default=False)
@@ -42,9 +66,35 @@ class User(AbstractBaseUser,PermissionsMixin):
     USERNAME_FIELD = 'email'
     
     objects = UserManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                Lower('email'),
+                name='account_user_email_key',
+                violation_error_message="A user with this email already exists.",
+                violation_error_code='duplicate_email',
+            ),
+        ]
     
     def __str__(self):
         return self.email
+
+    def validate_constraints(self, exclude=None):
+        # A clash on account_user_email_key belongs to the email field, where
+        # forms show it, not to the non-field errors of an expression index
+        try:
+            super().validate_constraints(exclude=exclude)
+        except ValidationError as error:
+            errors = error.update_error_dict({})
+            non_field = errors.get(NON_FIELD_ERRORS, [])
+            duplicates = [e for e in non_field if e.code == 'duplicate_email']
+            if duplicates:
+                errors[NON_FIELD_ERRORS] = [e for e in non_field if e not in duplicates]
+                if not errors[NON_FIELD_ERRORS]:
+                    del errors[NON_FIELD_ERRORS]
+                errors.setdefault('email', []).extend(duplicates)
+            raise ValidationError(errors)
     
     def has_perm(self, perm, obj=None):
         "Does the user have a specific permission?"
@@ -58,3 +108,41 @@ class User(AbstractBaseUser,PermissionsMixin):
         if self.is_superuser:
             return True
         return super().has_module_perms(app_label)
+
+
+class OutboxEmail(models.Model):
+    # Emails are written here on the request path and delivered later by
+    # the send_outbox worker pool over a few reused SMTP connections.
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to_email = models.EmailField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # A pending row is due once next_attempt_at has passed. Claiming a row
+    # pushes this forward by the lease time, so rows held by a crashed
+    # worker become due again on their own.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email}"
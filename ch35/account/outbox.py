@@ -0,0 +1,160 @@
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, connection as db_connection
+from django.utils import timezone
+from account.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def outbox_setting(name, default):
+    return getattr(settings, f'OUTBOX_{name}', default)
+
+
+def claim_batch(batch_size, lease_seconds):
+    # Claim due rows with a conditional UPDATE so several workers (threads or
+    # processes) never pick the same row. The lease pushes next_attempt_at
+    # forward, if the worker dies the rows simply become due again.
+    now = timezone.now()
+    due_ids = list(
+        OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not due_ids:
+        return []
+    token = uuid.uuid4()
+    OutboxEmail.objects.filter(
+        id__in=due_ids, status=OutboxEmail.PENDING, next_attempt_at__lte=now
+    ).update(claim_token=token, next_attempt_at=now + timedelta(seconds=lease_seconds))
+    return list(OutboxEmail.objects.filter(claim_token=token).order_by('id'))
+
+
+def build_message(outbox_email, connection):
+    email = EmailMultiAlternatives(
+        outbox_email.subject,
+        outbox_email.body,
+        outbox_email.from_email,
+        [outbox_email.to_email],
+        connection=connection,
+    )
+    if outbox_email.html_body:
+        email.attach_alternative(outbox_email.html_body, 'text/html')
+    return email
+
+
+def retry_delay(attempts):
+    # Exponential backoff: base, 2*base, 4*base ... capped at OUTBOX_MAX_BACKOFF
+    base = outbox_setting('RETRY_BACKOFF', 30)
+    return min(base * (2 ** (attempts - 1)), outbox_setting('MAX_BACKOFF', 3600))
+
+
+def deliver_batch(batch, connection):
+    # Every message goes out over the same open SMTP connection. Messages are
+    # handed to send_messages() one at a time so that a rejected recipient
+    # only fails its own row instead of the whole batch.
+    sent_ids = []
+    max_attempts = outbox_setting('MAX_ATTEMPTS', 5)
+    try:
+        for outbox_email in batch:
+            try:
+                connection.send_messages([build_message(outbox_email, connection)])
+            except Exception as exc:
+                attempts = outbox_email.attempts + 1
+                status = OutboxEmail.FAILED if attempts >= max_attempts else OutboxEmail.PENDING
+                OutboxEmail.objects.filter(pk=outbox_email.pk).update(
+                    status=status,
+                    attempts=attempts,
+                    claim_token=None,
+                    last_error=repr(exc),
+                    next_attempt_at=timezone.now() + timedelta(seconds=retry_delay(attempts)),
+                )
+                logger.warning("Outbox email %s failed (attempt %s): %r",
+                               outbox_email.pk, attempts, exc)
+                # The SMTP session may be unusable after an error. If it
+                # can't be reopened the error ends the batch, the rest of it
+                # keeps its lease and is retried once the lease runs out.
+                connection.close()
+                connection.open()
+            else:
+                sent_ids.append(outbox_email.pk)
+    finally:
+        # Whatever happened later, these went out: never send them twice
+        if sent_ids:
+            OutboxEmail.objects.filter(pk__in=sent_ids).update(
+                status=OutboxEmail.SENT, sent_at=timezone.now(), claim_token=None,
+                last_error='',
+            )
+    return len(sent_ids)
+
+
+def drain_outbox(connection=None, batch_size=None, lease_seconds=None, stop_event=None):
+    # Deliver everything that is currently due over a single connection and
+    # return the number of messages sent.
+    batch_size = batch_size or outbox_setting('BATCH_SIZE', 50)
+    lease_seconds = lease_seconds or outbox_setting('LEASE_SECONDS', 300)
+    batch = claim_batch(batch_size, lease_seconds)
+    if not batch:
+        return 0
+    total = 0
+    # The SMTP connection is only opened once there is something to send
+    with connection or get_connection() as connection:
+        while batch:
+            total += deliver_batch(batch, connection)
+            if stop_event and stop_event.is_set():
+                break
+            batch = claim_batch(batch_size, lease_seconds)
+    return total
+
+
+class OutboxWorkerPool:
+    # A fixed number of threads, each one keeps its own SMTP connection open
+    # while there is work and polls the outbox table when idle.
+
+    def __init__(self, workers=None, batch_size=None, poll_interval=None,
+                 connection_factory=get_connection):
+        self.workers = workers or outbox_setting('WORKERS', 4)
+        self.batch_size = batch_size or outbox_setting('BATCH_SIZE', 50)
+        self.poll_interval = poll_interval or outbox_setting('POLL_INTERVAL', 2)
+        self.connection_factory = connection_factory
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f'outbox-worker-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _run(self):
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    sent = drain_outbox(
+                        connection=self.connection_factory(),
+                        batch_size=self.batch_size,
+                        stop_event=self.stop_event,
+                    )
+                except Exception:
+                    logger.exception("Outbox worker failed to drain the outbox")
+                    sent = 0
+                with self._lock:
+                    self.sent += sent
+                if not sent:
+                    self.stop_event.wait(self.poll_interval)
+        finally:
+            db_connection.close()
@@ -0,0 +1,99 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete
+from core import metrics
+from account.models import User
+
+# Effective permission sets are cached under versioned keys:
+#   perms:<user id>:<user version>:<global version>
+# Changing a user's permissions or groups bumps the user version, changing
+# what a Group grants bumps the global version. Old entries are never read
+# again and simply expire.
+GLOBAL_VERSION_KEY = 'perms:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PERMISSION_CACHE_ALIAS', 'default')]
+
+
+def user_version_key(user_id):
+    return f'perms:version:{user_id}'
+
+
+def new_version():
+    return time.time_ns()
+
+
+def get_versions(cache, user_id):
+    user_key = user_version_key(user_id)
+    versions = cache.get_many([user_key, GLOBAL_VERSION_KEY])
+    for key in (user_key, GLOBAL_VERSION_KEY):
+        if key not in versions:
+            # A lost version must never fall back to an old value, so start
+            # from a fresh one (add() keeps whatever another process set first)
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return versions[user_key], versions[GLOBAL_VERSION_KEY]
+
+
+def get_permissions(user, loader):
+    # Returns the user's permission set from the shared cache, calling
+    # loader() and storing the result on a miss.
+    cache = get_cache()
+    user_version, global_version = get_versions(cache, user.pk)
+    key = f'perms:{user.pk}:{user_version}:{global_version}'
+    perms = cache.get(key)
+    if perms is not None:
+        metrics.incr('permission_cache.hit')
+        return perms
+    metrics.incr('permission_cache.miss')
+    perms = loader()
+    cache.set(key, perms, getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 300))
+    return perms
+
+
+def invalidate_users(user_ids):
+    get_cache().set_many(
+        {user_version_key(user_id): new_version() for user_id in user_ids}, None)
+
+
+def invalidate_all():
+    get_cache().set(GLOBAL_VERSION_KEY, new_version(), None)
+
+
+def user_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # m2m_changed for User.user_permissions and User.groups, from either side
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_users([instance.pk])
+    elif pk_set:
+        invalidate_users(pk_set)
+    else:
+        # post_clear from the Permission/Group side: members are unknown
+        invalidate_all()
+
+
+def group_permissions_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_all()
+
+
+def permission_source_deleted(sender, **kwargs):
+    invalidate_all()
+
+
+def connect_signals():
+    m2m_changed.connect(user_relation_changed, sender=User.user_permissions.through,
+                        dispatch_uid='perm_cache_user_permissions')
+    m2m_changed.connect(user_relation_changed, sender=User.groups.through,
+                        dispatch_uid='perm_cache_user_groups')
+    m2m_changed.connect(group_permissions_changed, sender=Group.permissions.through,
+                        dispatch_uid='perm_cache_group_permissions')
+    post_delete.connect(permission_source_deleted, sender=Group,
+                        dispatch_uid='perm_cache_group_deleted')
+    post_delete.connect(permission_source_deleted, sender=Permission,
+                        dispatch_uid='perm_cache_permission_deleted')
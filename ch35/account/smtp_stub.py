@@ -0,0 +1,101 @@
+import socketserver
+import threading
+from email import message_from_bytes
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    # Speaks just enough SMTP for Django's smtp EmailBackend: no TLS, no
+    # auth, every message is accepted and kept in server.messages, except
+    # for the recipients in server.rejected_recipients.
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 localhost SMTP stub ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command[8:].strip(" <>")
+                if recipient in server.rejected_recipients:
+                    self.reply("550 No such user")
+                    continue
+                recipients.append(recipient)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    # Undo dot-stuffing
+                    if data_line.startswith(b".."):
+                        data_line = data_line[1:]
+                    data.append(data_line)
+                with server.lock:
+                    server.messages.append({
+                        "from": sender,
+                        "to": recipients,
+                        "message": message_from_bytes(b"".join(data)),
+                    })
+                self.reply("250 OK")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP stand-in used instead of the real mail provider in tests and
+    during development, e.g. with EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.port
+    and EMAIL_USE_TLS=False.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), SMTPStubHandler)
+        self.messages = []
+        self.rejected_recipients = set()
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,3 +1,340 @@
-from django.test import TestCase
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core import mail
+from django.core.mail import get_connection
+from django.template.loader import render_to_string
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from account import outbox
+from account.backends import EmailBackend
+from account.checks import check_shared_caches
+from account.email_templates import reset_email_templates
+from account.last_login import LastLoginBuffer
+from account.management.commands.import_users import InvalidRecord, read_records
+from account.models import OutboxEmail, User
+from account.smtp_stub import LocalSMTPServer
+from account.tokens import activation_token_generator, password_reset_token_generator
+from account.utils import send_activation_email, send_reset_password_email
+
+
+@override_settings(OUTBOX_RETRY_BACKOFF=30, OUTBOX_MAX_BACKOFF=3600, OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.server = LocalSMTPServer().start()
+        self.addCleanup(self.server.stop)
+
+    def smtp_connection(self):
+        return get_connection('django.core.mail.backends.smtp.EmailBackend',
+                              host='127.0.0.1', port=self.server.port, use_tls=False,
+                              username='', password='')
+
+    def queue(self, *recipients):
+        return [OutboxEmail.objects.create(subject='Hello', body='Body', from_email='shop@example.com',
+                                           to_email=recipient)
+                for recipient in recipients]
+
+    def test_drain_sends_everything_due(self):
+        self.queue('a@example.com', 'b@example.com')
+        self.assertEqual(outbox.drain_outbox(connection=self.smtp_connection()), 2)
+        self.assertEqual(sorted(message['to'][0] for message in self.server.messages),
+                         ['a@example.com', 'b@example.com'])
+        self.assertEqual(self.server.connections, 1)
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+
+    def test_rejected_recipient_is_retried_with_backoff(self):
+        self.server.rejected_recipients.add('bad@example.com')
+        good, bad = self.queue('good@example.com', 'bad@example.com')
+        started = timezone.now()
+        self.assertEqual(outbox.drain_outbox(connection=self.smtp_connection()), 1)
+        good.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual(good.status, OutboxEmail.SENT)
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIsNone(bad.claim_token)
+        self.assertGreaterEqual(bad.next_attempt_at, started + timedelta(seconds=30))
+        # Not due yet
+        self.assertEqual(outbox.drain_outbox(connection=self.smtp_connection()), 0)
+
+        # Doubling delays, failed for good after OUTBOX_MAX_ATTEMPTS
+        self.assertEqual([outbox.retry_delay(attempts) for attempts in (1, 2, 3)], [30, 60, 120])
+        for attempts in (2, 3):
+            OutboxEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+            outbox.drain_outbox(connection=self.smtp_connection())
+            bad.refresh_from_db()
+            self.assertEqual(bad.attempts, attempts)
+        self.assertEqual(bad.status, OutboxEmail.FAILED)
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_claimed_rows_are_leased(self):
+        self.queue('a@example.com', 'b@example.com')
+        batch = outbox.claim_batch(10, lease_seconds=300)
+        self.assertEqual(len(batch), 2)
+        # Another worker gets nothing while the lease runs
+        self.assertEqual(outbox.claim_batch(10, lease_seconds=300), [])
+        # A worker that died leaves the rows due again once it runs out
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(outbox.claim_batch(10, lease_seconds=300)), 2)
+
+    def test_failed_reconnect_keeps_what_was_sent(self):
+        self.server.rejected_recipients.add('bad@example.com')
+        first, bad, last = self.queue('first@example.com', 'bad@example.com', 'last@example.com')
+        batch = outbox.claim_batch(10, lease_seconds=300)
+        with self.smtp_connection() as connection:
+            open_connection = connection.open
+
+            def reopen():
+                # send_messages() calls open() too, only reconnecting fails
+                if connection.connection is None:
+                    raise ConnectionRefusedError
+                return open_connection()
+
+            with mock.patch.object(connection, 'open', side_effect=reopen):
+                with self.assertRaises(ConnectionRefusedError):
+                    outbox.deliver_batch(batch, connection)
+        for outbox_email in (first, bad, last):
+            outbox_email.refresh_from_db()
+        # Sent before the SMTP server went away: marked, never sent again
+        self.assertEqual(first.status, OutboxEmail.SENT)
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.PENDING, 1))
+        # Not attempted: keeps its lease and is picked up after it
+        self.assertEqual((last.status, last.attempts), (OutboxEmail.PENDING, 0))
+        self.assertIsNotNone(last.claim_token)
+        self.assertEqual([message['to'] for message in self.server.messages],
+                         [['first@example.com']])
+
+
+class LastLoginBufferTests(TransactionTestCase):
+    # The timer flushes from its own thread and database connection
+    def test_flushed_after_max_age_without_another_login(self):
+        user = User.objects.create_user(email='login@example.com', password='x' * 12)
+        buffer = LastLoginBuffer(max_size=100, max_age=0.2)
+        when = timezone.now()
+        buffer.record(user.pk, when)
+        user.refresh_from_db()
+        self.assertIsNone(user.last_login)
+        deadline = time.monotonic() + 5
+        while user.last_login is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            user.refresh_from_db()
+        self.assertEqual(user.last_login, when)
+
+    def test_full_buffer_flush_cancels_the_timer(self):
+        user = User.objects.create_user(email='login@example.com', password='x' * 12)
+        buffer = LastLoginBuffer(max_size=1, max_age=60)
+        buffer.record(user.pk)
+        self.assertIsNone(buffer.timer)
+        self.assertEqual(buffer.pending, {})
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+
+
+class UserQuerySetTests(TestCase):
+    def test_with_emails_matches_like_the_unique_index(self):
+        User.objects.create_user(email='Äda@example.com')
+        User.objects.create_user(email='bob@example.com')
+        # The import must see these as taken, or the insert violates the index
+        found = User.objects.with_emails(['ÄDA@EXAMPLE.COM', ' BOB@example.com'])
+        self.assertEqual(sorted(found.values_list('email', flat=True)),
+                         ['bob@example.com', 'Äda@example.com'])
+
+
+class ReadRecordsTests(TestCase):
+    def test_unreadable_json_lines_become_invalid_records(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8') as source:
+            source.write('{"email": "a@example.com"}\n{"email": \n[1]\n\n')
+            source.flush()
+            records = list(read_records(source.name, 'jsonl'))
+        self.assertEqual([number for number, record in records], [1, 2, 3, 4])
+        self.assertEqual(records[0][1], {'email': 'a@example.com'})
+        self.assertIsInstance(records[1][1], InvalidRecord)
+        self.assertEqual(records[2][1], InvalidRecord('expected a JSON object, got list'))
+        self.assertIsNone(records[3][1])
+
+
+@override_settings(AUTH_USER_CACHE_ALIAS='default', PERMISSION_CACHE_ALIAS='default',
+                   PAGE_CACHE_ALIAS='default')
+class UserCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_password_change_ends_cached_sessions(self):
+        user = User.objects.create_user(email='c@example.com', password='old-password-1')
+        User.objects.filter(pk=user.pk).update(is_active=True, is_customer=True)
+        self.client.force_login(User.objects.get(pk=user.pk))
+        dashboard = reverse('customer:customer_dashboard')
+        self.assertEqual(self.client.get(dashboard).status_code, 200)
+        user = User.objects.get(pk=user.pk)
+        user.set_password('new-password-2')
+        user.save()
+        response = self.client.get(dashboard)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+    def test_local_memory_cache_fails_the_check(self):
+        self.assertEqual([error.id for error in check_shared_caches(None)],
+                         ['account.E001', 'account.E002'])
+        with override_settings(MIDDLEWARE=[
+                'django.contrib.sessions.middleware.SessionMiddleware',
+                'django.contrib.auth.middleware.AuthenticationMiddleware']):
+            self.assertEqual([error.id for error in check_shared_caches(None)], ['account.E001'])
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = User.objects.create_user(email='p@example.com')
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        self.view = Permission.objects.get(codename='view_product')
+        self.add = Permission.objects.get(codename='add_product')
+        self.group = Group.objects.create(name='Editors')
+        self.group.permissions.add(self.add)
+
+    def permissions(self):
+        # A fresh instance, so no per-request _perm_cache
+        user = User.objects.get(pk=self.user.pk)
+        return EmailBackend().get_all_permissions(user)
+
+    def assertCachedPermissions(self, expected):
+        self.assertEqual(self.permissions(), expected)
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(EmailBackend().get_all_permissions(user), expected)
+
+    def test_user_permissions_from_the_user_side(self):
+        self.assertCachedPermissions(set())
+        self.user.user_permissions.add(self.view)
+        self.assertCachedPermissions({'product.view_product'})
+        self.user.user_permissions.remove(self.view)
+        self.assertCachedPermissions(set())
+
+    def test_user_permissions_from_the_permission_side(self):
+        self.assertCachedPermissions(set())
+        self.view.user_set.add(self.user)
+        self.assertCachedPermissions({'product.view_product'})
+        # Cleared from the permission side, the members aren't known
+        self.view.user_set.clear()
+        self.assertCachedPermissions(set())
+
+    def test_groups_from_both_sides(self):
+        self.assertCachedPermissions(set())
+        self.user.groups.add(self.group)
+        self.assertCachedPermissions({'product.add_product'})
+        self.group.user_set.remove(self.user)
+        self.assertCachedPermissions(set())
+        self.group.user_set.add(self.user)
+        self.assertCachedPermissions({'product.add_product'})
+
+    def test_what_a_group_grants(self):
+        self.user.groups.add(self.group)
+        self.assertCachedPermissions({'product.add_product'})
+        self.group.permissions.add(self.view)
+        self.assertCachedPermissions({'product.add_product', 'product.view_product'})
+        self.view.group_set.remove(self.group)
+        self.assertCachedPermissions({'product.add_product'})
+        self.group.delete()
+        self.assertCachedPermissions(set())
+
+
+@override_settings(SITE_NAME='Test Shop', DEFAULT_FROM_EMAIL='shop@example.com')
+class EmailTemplateTests(TestCase):
+    # The & checks that the URL is escaped in the HTML part only
+    url = 'http://testserver/link/?a=1&b=2'
+
+    def setUp(self):
+        reset_email_templates()
+        self.addCleanup(reset_email_templates)
+
+    def send(self, send_email):
+        send_email('to@example.com', self.url)
+        self.assertEqual(outbox.drain_outbox(), 1)
+        [message] = mail.outbox
+        [(html, mimetype)] = message.alternatives
+        self.assertEqual(mimetype, 'text/html')
+        self.assertEqual((message.from_email, message.to), ('shop@example.com', ['to@example.com']))
+        return message, html
+
+    def test_activation_email(self):
+        message, html = self.send(send_activation_email)
+        self.assertEqual(message.subject, 'Activate your account on Test Shop')
+        # The same as rendering the template for this one message
+        self.assertEqual(html, render_to_string('account/activation_email.html',
+                                                {'activation_url': self.url}))
+        self.assertIn(f'Activate Account: {self.url}', message.body)
+        self.assertNotIn('<', message.body)
+        self.assertNotIn('&amp;', message.body)
+
+    def test_reset_password_email(self):
+        message, html = self.send(send_reset_password_email)
+        self.assertEqual(message.subject, 'Reset Your Password on Test Shop')
+        self.assertEqual(html, render_to_string('account/reset_password_email.html',
+                                                {'reset_url': self.url}))
+        self.assertIn(f'Reset Password: {self.url}', message.body)
+        self.assertIn('valid for 1 hour only', message.body)
+        self.assertNotIn('<', message.body)
+
+
+class TokenTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = User.objects.create_user(email='t@example.com', password='old-password-1')
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        self.user = User.objects.get(pk=self.user.pk)
+
+    def reset(self, token, password='new-password-2'):
+        return self.client.post(reverse('password_reset_confirm', kwargs={'token': token}),
+                                {'new_password1': password, 'new_password2': password})
+
+    def test_valid_token(self):
+        token = password_reset_token_generator.make_token(self.user)
+        self.assertEqual(password_reset_token_generator.verify(token), self.user.pk)
+        self.assertTrue(password_reset_token_generator.check_user(self.user, token))
+        # Not for another purpose
+        self.assertIsNone(activation_token_generator.verify(token))
+
+    def test_expired_token(self):
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - 3601):
+            token = password_reset_token_generator.make_token(self.user)
+        self.assertIsNone(password_reset_token_generator.verify(token))
+        self.assertRedirects(self.reset(token), reverse('password_reset'))
+
+    def test_consumed_token_is_not_reused(self):
+        token = password_reset_token_generator.make_token(self.user)
+        self.assertRedirects(self.reset(token), reverse('login'))
+        self.assertTrue(password_reset_token_generator.is_consumed(token))
+        self.assertIsNone(password_reset_token_generator.verify(token))
+        self.assertRedirects(self.reset(token, 'third-password-3'), reverse('password_reset'))
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('new-password-2'))
+
+    def test_password_change_ends_the_token(self):
+        token = password_reset_token_generator.make_token(self.user)
+        self.user.set_password('changed-password-4')
+        self.user.save()
+        # Still well-formed and unused, but no longer the user's state
+        self.assertEqual(password_reset_token_generator.verify(token), self.user.pk)
+        self.assertFalse(password_reset_token_generator.check_user(self.user, token))
+        self.assertRedirects(self.reset(token), reverse('password_reset'))
+
+    def test_activation_ends_the_token(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        token = activation_token_generator.make_token(User.objects.get(pk=self.user.pk))
+        self.client.get(reverse('activate', kwargs={'token': token}))
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.is_active)
+        self.assertFalse(activation_token_generator.check_user(user, token))
+
+    def test_login_does_not_end_the_token(self):
+        # last_login is written late with DEFER_LAST_LOGIN, it isn't part of the state
+        token = password_reset_token_generator.make_token(self.user)
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+        self.assertTrue(password_reset_token_generator.check_user(
+            User.objects.get(pk=self.user.pk), token))
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_consumed_tokens_in_a_local_memory_cache_fail_the_check(self):
+        self.assertIn('account.W001', [error.id for error in check_shared_caches(None)])
@@ -0,0 +1,74 @@
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+from core import metrics
+
+
+class SignedTokenGenerator:
+    # Activation and password reset links carry a signed, timestamped token
+    # "<payload>:<timestamp>:<signature>" with the payload [user id, state].
+    # Signature and expiry are verified in memory, so garbage or expired
+    # links are rejected without a database query. Only then is the user
+    # loaded and the state (a hash of password, is_active and email)
+    # compared, which makes a link die once it has been used: activating
+    # flips is_active, a reset changes the password. Unlike Django's
+    # PasswordResetTokenGenerator last_login is left out, with
+    # DEFER_LAST_LOGIN it is written up to a flush interval after the login,
+    # so a link would die at some unpredictable point. Consumed tokens are
+    # also remembered in TOKEN_CACHE_ALIAS so they can't be replayed.
+
+    def __init__(self, purpose, max_age):
+        self.purpose = purpose
+        self.max_age = max_age
+        self.signer = signing.TimestampSigner(salt=f'account.tokens.{purpose}')
+
+    def user_state(self, user):
+        value = f'{user.pk}{user.password}{user.is_active}{user.email}'
+        return salted_hmac(self.purpose, value, algorithm='sha256').hexdigest()[:20]
+
+    def make_token(self, user):
+        return self.signer.sign_object([user.pk, self.user_state(user)])
+
+    def verify(self, token):
+        # Returns the user id of a well-formed, unexpired and unused token,
+        # or None. Never touches the database.
+        try:
+            user_id, state = self.signer.unsign_object(token, max_age=self.max_age)
+        except (signing.BadSignature, ValueError, TypeError):
+            metrics.incr(f'tokens.{self.purpose}.rejected')
+            return None
+        if self.is_consumed(token):
+            metrics.incr(f'tokens.{self.purpose}.replayed')
+            return None
+        return user_id
+
+    def check_user(self, user, token):
+        # Second step for a token that passed verify(): does it still match
+        # the user's current state?
+        user_id, state = self.signer.unsign_object(token)
+        return user_id == user.pk and constant_time_compare(state, self.user_state(user))
+
+    def consumed_key(self, token):
+        return f'tokens:{self.purpose}:{hashlib.sha256(token.encode()).hexdigest()}'
+
+    @property
+    def cache(self):
+        # Shared by all workers, or another one would still accept the token
+        # (system check account.W001)
+        return caches[getattr(settings, 'TOKEN_CACHE_ALIAS', 'default')]
+
+    def is_consumed(self, token):
+        return self.cache.get(self.consumed_key(token)) is not None
+
+    def consume(self, token):
+        # Remember the token until it would have expired anyway
+        self.cache.set(self.consumed_key(token), 1, self.max_age)
+
+
+activation_token_generator = SignedTokenGenerator(
+    'activation', getattr(settings, 'ACTIVATION_TOKEN_MAX_AGE', 60 * 60 * 24 * 3))
+password_reset_token_generator = SignedTokenGenerator(
+    'password_reset', getattr(settings, 'PASSWORD_RESET_TOKEN_MAX_AGE', 60 * 60))
@@ -0,0 +1,113 @@
+import time
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from core import metrics
+from account.models import User
+
+# The user of an authenticated request is cached under
+#   auth_user:<user id>:<user version>:<session auth hash>
+# Saving or deleting the user bumps the version, so a password change kills
+# stale sessions at once: their next request misses the cache and the full
+# session check of django.contrib.auth flushes them. That only holds when
+# every worker process reads the same cache (system check account.E002). A request that loaded
+# the user from the database just before the bump writes under the old
+# version, which is never read again.
+# Updates through QuerySet.update()/bulk_update() send no signals and are
+# only picked up when the entry expires (AUTH_USER_CACHE_TIMEOUT).
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def version_key(user_id):
+    return f'auth_user:version:{user_id}'
+
+
+def new_version():
+    return time.time_ns()
+
+
+def check_credentials(user_id, backend_path, session_hash):
+    # (user id, session auth hash) of a session that may hold a logged in
+    # user of one of our backends, else None
+    if None in (user_id, backend_path, session_hash) or not session_hash:
+        return None
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return None
+    return str(user_id), session_hash
+
+
+def cache_timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def get_user(request):
+    # Drop-in for django.contrib.auth.get_user()
+    session = request.session
+    credentials = check_credentials(
+        session.get(SESSION_KEY), session.get(BACKEND_SESSION_KEY), session.get(HASH_SESSION_KEY))
+    if credentials is None:
+        return auth.get_user(request)
+    user_id, session_hash = credentials
+    cache = get_cache()
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # A lost version must never fall back to an old value
+        cache.add(version_key(user_id), new_version(), None)
+        version = cache.get(version_key(user_id))
+    key = f'auth_user:{user_id}:{version}:{session_hash}'
+    user = cache.get(key)
+    if user is not None:
+        metrics.incr('user_cache.hit')
+        return user
+    metrics.incr('user_cache.miss')
+    user = auth.get_user(request)
+    # Only cache a session that verified as is (not one that was flushed or
+    # moved on from a fallback secret)
+    if user.is_authenticated and session.get(HASH_SESSION_KEY) == session_hash:
+        cache.set(key, user, cache_timeout())
+    return user
+
+
+async def aget_user(request):
+    # Drop-in for django.contrib.auth.aget_user()
+    session = request.session
+    credentials = check_credentials(
+        await session.aget(SESSION_KEY), await session.aget(BACKEND_SESSION_KEY),
+        await session.aget(HASH_SESSION_KEY))
+    if credentials is None:
+        return await auth.aget_user(request)
+    user_id, session_hash = credentials
+    cache = get_cache()
+    version = await cache.aget(version_key(user_id))
+    if version is None:
+        await cache.aadd(version_key(user_id), new_version(), None)
+        version = await cache.aget(version_key(user_id))
+    key = f'auth_user:{user_id}:{version}:{session_hash}'
+    user = await cache.aget(key)
+    if user is not None:
+        metrics.incr('user_cache.hit')
+        return user
+    metrics.incr('user_cache.miss')
+    user = await auth.aget_user(request)
+    if user.is_authenticated and await session.aget(HASH_SESSION_KEY) == session_hash:
+        await cache.aset(key, user, cache_timeout())
+    return user
+
+
+def invalidate_user(user_id):
+    get_cache().set(version_key(user_id), new_version(), None)
+
+
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def connect_signals():
+    post_save.connect(user_changed, sender=User, dispatch_uid='user_cache_saved')
+    post_delete.connect(user_changed, sender=User, dispatch_uid='user_cache_deleted')
@@ -1,45 +1,50 @@
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.urls import reverse
 from django.conf import settings
-import threading
+from account.models import OutboxEmail
+from account.email_templates import get_email_template
+from account.tokens import activation_token_generator
 
 
-class SendEmailThread(threading.Thread):
-    def __init__(self, email):
-        self.email = email
-        threading.Thread.__init__(self)
+def build_email(subject, html_content, text_content, recipient_email):
+    return OutboxEmail(
+        subject=subject,
+        body=text_content,
+        html_body=html_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to_email=recipient_email,
+    )
 
-    def run(self):
-        self.email.send()
 
+def build_template_emails(template_name, recipients):
+    # recipients is a list of (email, slot value) pairs, all messages are
+    # rendered in one call from the precompiled template
+    template = get_email_template(template_name)
+    rendered = template.render_many([value for email, value in recipients])
+    return [
+        build_email(template.subject, html_content, text_content, email)
+        for (email, value), (html_content, text_content) in zip(recipients, rendered)
+    ]
+
+
+def activation_url_for(user):
+    token = activation_token_generator.make_token(user)
+    activation_link = reverse('activate', kwargs={'token': token})
+    return f"{settings.SITE_DOMAIN.rstrip('/')}{activation_link}"
 
-def send_activation_email(recipient_email, activation_url):
-    subject = "Activate your account on " + settings.SITE_NAME
-    from_email = settings.DEFAULT_FROM_EMAIL
-    to_email = [recipient_email]
 
-    # Load the HTML template
-    html_content = render_to_string(
-        'account/activation_email.html', {'activation_url': activation_url})
-    text_content = strip_tags(html_content)
+def build_activation_email(recipient_email, activation_url):
+    return build_template_emails('activation', [(recipient_email, activation_url)])[0]
 
-    email = EmailMultiAlternatives(subject, text_content, from_email, to_email)
-    email.attach_alternative(html_content, 'text/html')
-    SendEmailThread(email).start()
+
+def send_activation_email(recipient_email, activation_url):
+    # Only a single INSERT happens on the request path, the send_outbox
+    # worker pool delivers the message later.
+    email = build_activation_email(recipient_email, activation_url)
+    email.save()
+    return email
 
 
 def send_reset_password_email(recipient_email, reset_url):
-    subject = 'Reset Your Password on '+settings.SITE_NAME
-    from_email = settings.DEFAULT_FROM_EMAIL
-    to_email = [recipient_email]
-
-    # Load the HTML template
-    html_content = render_to_string(
-        'account/reset_password_email.html', {'reset_url': reset_url})
-
-    # Create the email body with both HTML and plain text versions
-    text_content = strip_tags(html_content)
-    email = EmailMultiAlternatives(subject, text_content, from_email, to_email)
-    email.attach_alternative(html_content, "text/html")
-    SendEmailThread(email).start()
+    email = build_template_emails('reset_password', [(recipient_email, reset_url)])[0]
+    email.save()
+    return email
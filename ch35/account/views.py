@@ -2,15 +2,17 @@ from django.shortcuts import render, redirect
 from account.forms import RegistrationForm,PasswordResetForm
 from django.contrib import messages
 from django.conf import settings
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.utils.encoding import force_bytes, force_str
-from django.contrib.auth.tokens import default_token_generator
 from django.urls import reverse
-from account.utils import send_activation_email,send_reset_password_email
+from account.utils import send_activation_email,send_reset_password_email,activation_url_for
 from account.models import User
-from django.contrib.auth import authenticate, login
+from account.tokens import activation_token_generator, password_reset_token_generator
+from django.contrib.auth import login, alogin
+from account.backends import authenticate_with_reason, aauthenticate_with_reason, INACTIVE_USER
+from account.hashing import aset_password
+from asgiref.sync import sync_to_async
 from django.contrib.auth.forms import SetPasswordForm
 from core.utils import assign_permission
+from core.ratelimit import get_limiter, client_ip
 
 
 
@@ -18,6 +20,13 @@ def home(request):
     return render(request, 'account/home.html')
 
 
+def login_attempt_allowed(request, email):
+    # Admission control before any password hashing happens: per client IP
+    # and per email address, see RATELIMITS in settings
+    return (get_limiter('login_ip').hit(client_ip(request))
+            and get_limiter('login_email').hit(email.strip().lower()))
+
+
 def login_view(request):
     if request.user.is_authenticated:
         if request.user.is_seller:
@@ -32,21 +41,22 @@ def login_view(request):
         if not email or not password:
             messages.error(request, "Both fields are required.")
             return redirect('login')
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            messages.error(request, "Invalid email or password.")
+        if not login_attempt_allowed(request, email):
+            messages.error(
+                request, "Too many login attempts. Please try again later.")
             return redirect('login')
+        # One SELECT tells us whether the user is unknown, inactive or
+        # typed a wrong password
+        user, failure = authenticate_with_reason(request, email, password)
 
-        if not user.is_active:
+        if failure == INACTIVE_USER:
             messages.error(
                 request, "Your account is inactive. Please activate your account."
             )
             return redirect('login')
 
-        user = authenticate(request, email=email, password=password)
-
         if user is not None:
+            get_limiter('login_email').reset(email.strip().lower())
             login(request, user)
             if user.is_seller:
                 return redirect('seller:seller_dashboard')
@@ -63,28 +73,26 @@ def login_view(request):
     return render(request, 'account/login.html')
 
 
+def save_registered_user(user, role):
+    user.is_active = False
+    if role == "seller":
+        user.is_seller = True
+        user.is_customer = False
+    else:
+        user.is_seller = False
+        user.is_customer = True
+    user.save()
+    assign_permission(user, role)
+    send_activation_email(user.email, activation_url_for(user))
+
+
 def register_view(request):
     if request.method == "POST":
         form = RegistrationForm(request.POST)
         if form.is_valid():
             user = form.save(commit=False)
             user.set_password(form.cleaned_data["password"])
-            user.is_active = False
-            role = request.POST.get("role")
-            if role == "seller":
-                user.is_seller = True
-                user.is_customer = False
-            else:
-                user.is_seller = False
-                user.is_customer = True
-            user.save()
-            assign_permission(user, role)
-            uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
-            token = default_token_generator.make_token(user)
-            activation_link = reverse(
-                'activate', kwargs={'uidb64': uidb64, 'token': token})
-            activation_url = f'{settings.SITE_DOMAIN}{activation_link}'
-            send_activation_email(user.email, activation_url)
+            save_registered_user(user, request.POST.get("role"))
             messages.success(
                 request,
                 'Registration successful! Please check your email to activate your account.',
@@ -95,46 +103,53 @@ def register_view(request):
     return render(request, 'account/register.html', {'form': form})
 
 
-def activate_account(request, uidb64, token):
-    try:
-        uid = force_str(urlsafe_base64_decode(uidb64))
-        user = User.objects.get(pk=uid)
+def activate_account(request, token):
+    if activation_token_generator.is_consumed(token):
+        messages.warning(
+            request, "This account has already been activated.")
+        return redirect('login')
 
-        if user.is_active:
-            messages.warning(
-                request, "This account has already been activated.")
-            return redirect('login')
+    # Signature and expiry are checked before the database is touched
+    user_id = activation_token_generator.verify(token)
+    if user_id is None:
+        messages.error(
+            request, "The activation link is invalid or has expired."
+        )
+        return redirect('login')
 
-        if default_token_generator.check_token(user, token):
-            user.is_active = True
-            user.save()
-            messages.success(
-                request, "Your account has been activated successfully!"
-            )
-            return redirect('login')
-        else:
-            messages.error(
-                request, "The activation link is invalid or has expired."
-            )
-            return redirect('login')
-    except (TypeError, ValueError, OverflowError, User.DoesNotExist):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
         messages.error(request, "Invalid activation link.")
         return redirect('login')
 
+    if user.is_active:
+        messages.warning(
+            request, "This account has already been activated.")
+        return redirect('login')
+
+    if activation_token_generator.check_user(user, token):
+        user.is_active = True
+        user.save(update_fields=['is_active', 'is_updated'])
+        activation_token_generator.consume(token)
+        messages.success(
+            request, "Your account has been activated successfully!"
+        )
+    else:
+        messages.error(
+            request, "The activation link is invalid or has expired."
+        )
+    return redirect('login')
+
 
 def password_reset_view(request):
     if request.method == "POST":
         form = PasswordResetForm(request.POST)
         if form.is_valid():
-            email = form.cleaned_data.get('email')
-            user = User.objects.filter(email=email).first()
+            user = form.user
             if user:
-                uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
-                token = default_token_generator.make_token(user)
+                token = password_reset_token_generator.make_token(user)
                 reset_url = reverse(
-                    'password_reset_confirm',
-                    kwargs={'uidb64': uidb64, 'token': token},
-                )
+                    'password_reset_confirm', kwargs={'token': token})
                 absolute_reset_url = f"{request.build_absolute_uri(reset_url)}"
                 send_reset_password_email(user.email, absolute_reset_url)
             messages.success(
@@ -147,37 +162,136 @@ def password_reset_view(request):
     return render(request, 'account/password_reset.html', {'form': form})
 
 
-def password_reset_confirm_view(request, uidb64, token):
-    try:
-        uid = force_str(urlsafe_base64_decode(uidb64))
-        user = User.objects.get(pk=uid)
+def password_reset_confirm_view(request, token):
+    # Signature and expiry are checked before the database is touched
+    user_id = password_reset_token_generator.verify(token)
+    user = User.objects.filter(pk=user_id).first() if user_id is not None else None
 
-        if not default_token_generator.check_token(user, token):
-            messages.error(request, ('This link has expired or is invalid.'))
-            return redirect('password_reset')
+    if user is None or not password_reset_token_generator.check_user(user, token):
+        messages.error(request, ('This link has expired or is invalid.'))
+        return redirect('password_reset')
 
-        if request.method == "POST":
-            form = SetPasswordForm(user, request.POST)
-            if form.is_valid():
-                form.save()
-                messages.success(
-                    request, ('Your password has been successfully reset.')
-                )
-                return redirect('login')
+    if request.method == "POST":
+        form = SetPasswordForm(user, request.POST)
+        if form.is_valid():
+            form.save()
+            password_reset_token_generator.consume(token)
+            messages.success(
+                request, ('Your password has been successfully reset.')
+            )
+            return redirect('login')
+        else:
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, error)
+    else:
+        form = SetPasswordForm(user)
+
+    return render(
+        request, 'account/password_reset_confirm.html', {
+            'form': form, 'token': token}
+    )
+
+
+# Async variants of the views that hash passwords. The hashing runs in the
+# process pool of account.hashing, so under ASGI the worker keeps serving
+# other requests while PBKDF2 runs. They are routed when
+# OFFLOAD_PASSWORD_HASHING is enabled (see account/urls.py).
+
+async def arender(request, template_name, context=None):
+    # Templates read request.user and the session lazily, which needs the
+    # database and therefore has to happen outside the event loop
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def alogin_view(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        if user.is_seller:
+            return redirect('seller:seller_dashboard')
+        elif user.is_customer:
+            return redirect('customer:customer_dashboard')
+        return redirect('home')
+    if request.method == "POST":
+        email = request.POST.get("email")
+        password = request.POST.get("password")
+
+        if not email or not password:
+            messages.error(request, "Both fields are required.")
+            return redirect('login')
+        if not await sync_to_async(login_attempt_allowed)(request, email):
+            messages.error(
+                request, "Too many login attempts. Please try again later.")
+            return redirect('login')
+        user, failure = await aauthenticate_with_reason(request, email, password)
+
+        if failure == INACTIVE_USER:
+            messages.error(
+                request, "Your account is inactive. Please activate your account."
+            )
+            return redirect('login')
+
+        if user is not None:
+            await sync_to_async(get_limiter('login_email').reset)(email.strip().lower())
+            await alogin(request, user)
+            if user.is_seller:
+                return redirect('seller:seller_dashboard')
+            elif user.is_customer:
+                return redirect('customer:customer_dashboard')
             else:
-                for field, errors in form.errors.items():
-                    for error in errors:
-                        messages.error(request, error)
+                messages.error(
+                    request, "You do not have permission to access this area."
+                )
+                return redirect('home')
         else:
-            form = SetPasswordForm(user)
+            messages.error(request, "Invalid email or password.")
+            return redirect('login')
+    return await arender(request, 'account/login.html')
 
-        return render(
-            request, 'account/password_reset_confirm.html', {
-                'form': form, 'uidb64': uidb64, 'token': token}
-        )
 
-    except (TypeError, ValueError, OverflowError, User.DoesNotExist):
-        messages.error(request, (
-            'An error occurred. Please try again later.'))
+async def aregister_view(request):
+    if request.method == "POST":
+        form = RegistrationForm(request.POST)
+        if await sync_to_async(form.is_valid)():
+            user = form.save(commit=False)
+            await aset_password(user, form.cleaned_data["password"])
+            await sync_to_async(save_registered_user)(user, request.POST.get("role"))
+            messages.success(
+                request,
+                'Registration successful! Please check your email to activate your account.',
+            )
+            return redirect('login')
+    else:
+        form = RegistrationForm()
+    return await arender(request, 'account/register.html', {'form': form})
+
+
+async def apassword_reset_confirm_view(request, token):
+    user_id = password_reset_token_generator.verify(token)
+    user = await User.objects.filter(pk=user_id).afirst() if user_id is not None else None
+
+    if user is None or not password_reset_token_generator.check_user(user, token):
+        messages.error(request, ('This link has expired or is invalid.'))
         return redirect('password_reset')
- 
+
+    if request.method == "POST":
+        form = SetPasswordForm(user, request.POST)
+        if await sync_to_async(form.is_valid)():
+            await aset_password(user, form.cleaned_data["new_password1"])
+            await user.asave()
+            await sync_to_async(password_reset_token_generator.consume)(token)
+            messages.success(
+                request, ('Your password has been successfully reset.')
+            )
+            return redirect('login')
+        else:
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, error)
+    else:
+        form = SetPasswordForm(user)
+
+    return await arender(
+        request, 'account/password_reset_confirm.html', {
+            'form': form, 'token': token}
+    )
@@ -0,0 +1,35 @@
+import contextlib
+import os
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment,
+)
+from account.last_login import last_login_buffer
+from core.cache_backends import file_caches_in
+
+
+@contextlib.contextmanager
+def test_database():
+    # A throwaway, migrated copy of the default database for benchmarks
+    setup_test_environment()
+    tempdir = tempfile.mkdtemp()
+    if connection.vendor == 'sqlite':
+        # The in-memory test database uses shared-cache table locks that
+        # fail concurrent writers at once, a file waits for the lock
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempdir, 'benchmark.sqlite3')
+        connection.settings_dict['OPTIONS'].update(timeout=30, transaction_mode='IMMEDIATE')
+    cache_override = override_settings(CACHES=file_caches_in(tempdir))
+    cache_override.enable()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+        # Buffered last_login values belong to the test database
+        last_login_buffer.flush()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        cache_override.disable()
+        teardown_test_environment()
+        shutil.rmtree(tempdir, ignore_errors=True)
@@ -0,0 +1,91 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.test.utils import CaptureQueriesContext
+from benchmark.database import test_database
+from benchmark.runner import TestClientAdapter, percentile
+from benchmark.seed import make_users
+from core.utils import assign_permission_bulk
+from product.models import Product
+from seller.stats import reconcile_all
+
+
+def timed(function, rounds):
+    latencies = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def summary(latencies):
+    return (f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+            f"p95 {percentile(latencies, 0.95) * 1000:7.2f} ms")
+
+
+class Command(BaseCommand):
+    help = ("Grow the catalog of a throwaway database step by step and time the seller "
+            "dashboard (one stats row) against the aggregates it replaces")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1_000, 10_000, 100_000, 1_000_000])
+        parser.add_argument('--rounds', type=int, default=200,
+                            help="Dashboard loads per catalog size")
+
+    def handle(self, *args, **options):
+        with test_database():
+            seller = make_users('seller', 1, is_active=True, is_seller=True, is_customer=False)[0]
+            assign_permission_bulk([seller], 'seller')
+            client = TestClientAdapter()
+            client.login_as(seller)
+            client.get('/seller/dashboard')
+            rng, seeded = random.Random(0), 0
+            for size in sorted(options['sizes']):
+                self.grow(seller, seeded, size, rng)
+                seeded = size
+                self.measure(client, seller, size, options['rounds'])
+
+    def grow(self, seller, start, stop, rng):
+        with transaction.atomic():
+            for offset in range(start, stop, 10_000):
+                Product.objects.bulk_create(
+                    Product(sku=f'BD-{number}', name=f'Product {number}', seller=seller,
+                            description=f'Description of product {number}',
+                            price=Decimal(rng.randrange(100, 100000)) / 100)
+                    for number in range(offset, min(offset + 10_000, stop)))
+        reconcile_all()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, client, seller, size, rounds):
+        # The log is a bounded deque, a full one would hide the new queries
+        connection.queries_log.clear()
+        # Steady state: the user cache entry may have expired while seeding
+        client.get('/seller/dashboard')
+        with CaptureQueriesContext(connection) as queries:
+            status = client.get('/seller/dashboard')
+        assert status == 200, status
+        dashboard = timed(lambda: client.get('/seller/dashboard'), rounds)
+        # What the page would run without the stats table
+        products = Product.objects.filter(seller=seller)
+        aggregates = timed(lambda: (
+            products.aggregate(Count('pk'), Sum('price'), Min('price'), Max('price')),
+            list(products.order_by('-updated_at', '-pk')[:5]),
+        ), max(1, rounds // 20))
+        # The incremental maintenance cost of a single product save
+        product = products.order_by('?').first()
+
+        def save():
+            product.price = Decimal(random.randrange(100, 100000)) / 100
+            product.save()
+        saves = timed(save, max(1, rounds // 10))
+        self.stdout.write(
+            f"{size:>10,} products  dashboard {summary(dashboard)} ({len(queries)} queries)  "
+            f"aggregates {summary(aggregates)}  save {summary(saves)}")
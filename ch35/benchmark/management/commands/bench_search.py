@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from benchmark.database import test_database
+from benchmark.runner import percentile
+from product.models import Product
+from product.search import FTS5SearchBackend, PortableSearchBackend, fts5_index_exists
+
+ADJECTIVES = ('wireless', 'compact', 'ergonomic', 'portable', 'waterproof', 'vintage',
+              'smart', 'heavy', 'lightweight', 'silent', 'premium', 'budget')
+NOUNS = ('keyboard', 'mouse', 'monitor', 'speaker', 'backpack', 'lamp', 'charger',
+         'headphones', 'camera', 'router', 'blender', 'kettle', 'drill', 'tent')
+# Descriptions draw from a larger vocabulary with a skewed (Zipf-like)
+# distribution, like real text: a few words are everywhere, most are rare
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'qui', 'dor')
+VOCABULARY = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+# A mix of selective, broad and prefix ("search as you type") queries
+QUERIES = ('wireless keyboard', 'vintage lamp sku 42', 'waterproof tent', 'kettle', 'headph',
+           'premium camera kalomi', 'silent blender', 'sku 4242', 'router ruvoze', 'ergo mou')
+
+
+def make_products(count, rng):
+    for number in range(count):
+        adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+        words = rng.choices(VOCABULARY, WEIGHTS, k=25)
+        yield Product(
+            sku=f'BS-{number}',
+            name=f'{adjective.title()} {noun} sku {number}',
+            description=f'{adjective} {noun} ' + ' '.join(words),
+            price=Decimal(rng.randrange(100, 100000)) / 100,
+        )
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway database with products and compare FTS5 product search "
+            "against icontains")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--rounds', type=int, default=3,
+                            help="Times every query is run per backend")
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with test_database():
+            if not fts5_index_exists():
+                raise CommandError("FTS5 needs a SQLite database built with FTS5.")
+            self.seed(options['products'])
+            for backend in (FTS5SearchBackend(), PortableSearchBackend()):
+                self.measure(backend, options['rounds'], options['limit'])
+
+    def seed(self, count):
+        rng = random.Random(0)
+        started = time.perf_counter()
+        batch = []
+        with transaction.atomic():
+            for product in make_products(count, rng):
+                batch.append(product)
+                if len(batch) == 10_000:
+                    Product.objects.bulk_create(batch)
+                    batch = []
+            Product.objects.bulk_create(batch)
+        seeded = time.perf_counter()
+        with transaction.atomic():
+            FTS5SearchBackend().rebuild()
+        indexed = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(
+            f"seeded {count:,} products in {seeded - started:.1f}s, "
+            f"FTS5 index built in {indexed - seeded:.1f}s")
+
+    def measure(self, backend, rounds, limit):
+        latencies, hits = [], 0
+        backend.search(QUERIES[0], limit)
+        for _ in range(rounds):
+            for query in QUERIES:
+                started = time.perf_counter()
+                hits += len(backend.search(query, limit))
+                latencies.append(time.perf_counter() - started)
+        self.stdout.write(
+            f"{backend.name:>9}: p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+            f"p95 {percentile(latencies, 0.95) * 1000:8.1f} ms  "
+            f"{len(latencies) / sum(latencies):8.1f} searches/s  "
+            f"{hits / len(latencies):.1f} results/search")
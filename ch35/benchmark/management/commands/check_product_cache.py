@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from benchmark.database import test_database
+from core import metrics
+from product import cache
+from product.models import ORDERINGS, Product
+
+
+class Command(BaseCommand):
+    help = ("Run concurrent product writers against product cache readers on a throwaway "
+            "database and fail on any stale read")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10)
+
+    def handle(self, *args, **options):
+        with test_database():
+            Product.objects.bulk_create(
+                Product(sku=f'CC-{number}', name='v0', description='Consistency check',
+                        price=Decimal(0))
+                for number in range(options['products']))
+            self.product_ids = list(Product.objects.values_list('pk', flat=True))
+            # product id -> the last version a writer saw committed. The
+            # price of a product is its version, a reader that starts after
+            # a commit must never see a lower one.
+            self.committed = dict.fromkeys(self.product_ids, 0)
+            self.lock = threading.Lock()
+            self.stop = threading.Event()
+            self.stale, self.reads, self.writes = [], 0, 0
+            metrics.reset()
+            self.run_threads(options)
+            self.check_final_state()
+
+        self.stdout.write(
+            f"{self.writes:,} writes, {self.reads:,} reads, {len(self.stale)} stale reads, "
+            f"hit ratio {metrics.snapshot('product_cache').get('product_cache.hit_ratio')}")
+        if self.stale:
+            for product_id, seen, floor in self.stale[:10]:
+                self.stderr.write(f"product {product_id}: read version {seen}, {floor} was committed")
+            raise CommandError("The product cache served stale products")
+
+    def run_threads(self, options):
+        # Every writer owns a slice of the products, so versions only grow
+        slices = [self.product_ids[number::options['writers']]
+                  for number in range(options['writers'])]
+        threads = [threading.Thread(target=self.writer, args=(product_ids,))
+                   for product_ids in slices]
+        threads += [threading.Thread(target=self.reader, args=(number,))
+                    for number in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        self.stop.set()
+        for thread in threads:
+            thread.join()
+
+    def writer(self, product_ids):
+        rng = random.Random()
+        try:
+            while not self.stop.is_set():
+                product = Product.objects.get(pk=rng.choice(product_ids))
+                version = int(product.price) + 1
+                product.price, product.name = Decimal(version), f'v{version}'
+                product.save()
+                # save() has committed and invalidated the cache by now
+                with self.lock:
+                    self.committed[product.pk] = version
+                    self.writes += 1
+        finally:
+            connection.close()
+
+    def reader(self, number):
+        rng = random.Random(number)
+        orderings = list(ORDERINGS)
+        try:
+            while not self.stop.is_set():
+                product_ids = rng.sample(self.product_ids, 10)
+                with self.lock:
+                    floors = {product_id: self.committed[product_id] for product_id in product_ids}
+                if number % 2:
+                    # Pages hold the same product objects as detail lookups
+                    products, _ = cache.get_page(rng.choice(orderings), None, 50)
+                    products = {product.pk: product for product in products
+                                if product.pk in floors}
+                else:
+                    products = cache.get_products(product_ids)
+                with self.lock:
+                    self.reads += 1
+                    for product_id, product in products.items():
+                        if int(product.price) < floors[product_id]:
+                            self.stale.append((product_id, int(product.price), floors[product_id]))
+        finally:
+            connection.close()
+
+    def check_final_state(self):
+        # Once the writers are done, the cache must agree with the database
+        stored = {product.pk: (product.name, product.price) for product in Product.objects.all()}
+        cached = {product_id: (product.name, product.price)
+                  for product_id, product in cache.get_products(self.product_ids).items()}
+        for product_id, values in stored.items():
+            if cached.get(product_id) != values:
+                self.stale.append((product_id, cached.get(product_id), values))
+        for ordering in ORDERINGS:
+            expected, _ = Product.objects.page(ordering, None, 50)
+            products, _ = cache.get_page(ordering, None, 50)
+            if [product.pk for product in products] != [product.pk for product in expected]:
+                self.stale.append((f'page {ordering}', [product.pk for product in products],
+                                   [product.pk for product in expected]))
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from benchmark.database import test_database
+from benchmark.runner import HTTPClientAdapter, TestClientAdapter, run_scenario, start_wsgi_server
+from benchmark.scenarios import SCENARIOS
+from benchmark.seed import seed
+
+COLUMNS = ('scenario', 'requests', 'errors', 'throughput', 'p50', 'p95', 'p99',
+           'queries_avg', 'queries_max', 'query_budget', 'peak_rss_mb')
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway test database and load test the account, customer and "
+            "seller views, failing when a view runs more queries than its budget")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=50,
+                            help="Requests per concurrent client")
+        parser.add_argument('--mode', choices=('client', 'wsgi', 'both'), default='both',
+                            help="Django test client, a local WSGI server, or both")
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help="Run only these scenarios (repeatable)")
+        parser.add_argument('--real-hasher', action='store_true',
+                            help="Keep PASSWORD_HASHERS, by default MD5 is used so the "
+                                 "numbers show the views rather than PBKDF2")
+
+    def handle(self, *args, **options):
+        overrides = {
+            'MIDDLEWARE': ['benchmark.middleware.LoadTestMiddleware'] + settings.MIDDLEWARE,
+            'RATELIMITS': {name: (10 ** 9, 1) for name in settings.RATELIMITS},
+            'ALLOWED_HOSTS': settings.ALLOWED_HOSTS + ['127.0.0.1', 'testserver'],
+        }
+        if not options['real_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        with test_database(), override_settings(**overrides):
+            caches['default'].clear()
+            results = self.run(options)
+
+        self.print_results(results)
+        over_budget = [result for result in results
+                       if result['queries_max'] > result['query_budget']]
+        if over_budget:
+            raise CommandError("Query budget exceeded: " + ", ".join(
+                f"{result['mode']}/{result['scenario']} ran {result['queries_max']} "
+                f"queries (budget {result['query_budget']})" for result in over_budget))
+
+    def run(self, options):
+        data = seed(options['users'], options['products'])
+        names = options['scenario'] or list(SCENARIOS)
+        modes = ['client', 'wsgi'] if options['mode'] == 'both' else [options['mode']]
+        results = []
+        for mode in modes:
+            server = None
+            if mode == 'wsgi':
+                server, base_url = start_wsgi_server()
+                adapter_class = HTTPClientAdapter
+            else:
+                base_url, adapter_class = None, TestClientAdapter
+            try:
+                for name in names:
+                    self.stderr.write(f"{mode}: {name} ...")
+                    result = run_scenario(SCENARIOS[name](data), adapter_class, base_url,
+                                          options['concurrency'], options['requests'])
+                    result['mode'] = mode
+                    results.append(result)
+            finally:
+                if server is not None:
+                    server.shutdown()
+                    server.server_close()
+        return results
+
+    def print_results(self, results):
+        header = f"{'mode':<7}{'scenario':<24}{'reqs':>6}{'errs':>6}{'req/s':>9}" \
+                 f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>7}{'q max':>7}" \
+                 f"{'budget':>8}{'rss MB':>8}"
+        self.stdout.write(header)
+        for result in results:
+            line = (f"{result['mode']:<7}{result['scenario']:<24}{result['requests']:>6}"
+                    f"{result['errors']:>6}{result['throughput']:>9.1f}{result['p50']:>9.1f}"
+                    f"{result['p95']:>9.1f}{result['p99']:>9.1f}{result['queries_avg']:>7.1f}"
+                    f"{result['queries_max']:>7}{result['query_budget']:>8}"
+                    f"{result['peak_rss_mb']:>8.0f}")
+            style = self.style.ERROR if result['queries_max'] > result['query_budget'] else str
+            self.stdout.write(style(line))
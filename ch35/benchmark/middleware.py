@@ -0,0 +1,44 @@
+import threading
+from collections import defaultdict
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+SCENARIO_HEADER = 'HTTP_X_LOADTEST_SCENARIO'
+# Transaction control is logged on some backends (BEGIN IMMEDIATE on SQLite)
+# but not on others, it does not count against a budget
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+# scenario name -> SQL queries of each measured request
+recorded_queries = defaultdict(list)
+_lock = threading.Lock()
+
+
+def count_queries(captured):
+    return sum(not query['sql'].startswith(TRANSACTION_CONTROL) for query in captured)
+
+
+class LoadTestMiddleware:
+    # Installed first in MIDDLEWARE by the loadtest command only. It counts
+    # the SQL queries of requests tagged with a scenario (including the
+    # session save on the way out) and skips CSRF checks like the test
+    # client does, so the plain HTTP client needs no token round trip.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._dont_enforce_csrf_checks = True
+        scenario = request.META.get(SCENARIO_HEADER)
+        if scenario is None:
+            return self.get_response(request)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_response(request)
+        with _lock:
+            recorded_queries[scenario].append(count_queries(queries.captured_queries))
+        return response
+
+
+def reset_recorded_queries():
+    with _lock:
+        recorded_queries.clear()
@@ -0,0 +1,157 @@
+import http.cookiejar
+import resource
+import socketserver
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.test import Client
+from benchmark.middleware import recorded_queries, reset_recorded_queries
+from benchmark.seed import PASSWORD
+
+
+class TestClientAdapter:
+    # Drives the views in-process through django.test.Client
+
+    def __init__(self, base_url=None):
+        self.client = Client(raise_request_exception=False)
+        self.scenario = None
+
+    def get(self, path):
+        return self.client.get(path, HTTP_X_LOADTEST_SCENARIO=self.scenario).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data, HTTP_X_LOADTEST_SCENARIO=self.scenario).status_code
+
+    def logout(self):
+        # A fresh cookie jar, without the session DELETE of Client.logout()
+        self.client = Client(raise_request_exception=False)
+
+    def login_as(self, user):
+        self.client.force_login(user)
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClientAdapter:
+    # Drives the views over real HTTP against the local WSGI server
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.scenario = None
+        self.logout()
+
+    def open(self, path, data=None, scenario=True):
+        headers = {'X-Loadtest-Scenario': self.scenario} if scenario and self.scenario else {}
+        if data is not None:
+            data = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def get(self, path):
+        return self.open(path)
+
+    def post(self, path, data):
+        return self.open(path, data)
+
+    def logout(self):
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirectHandler)
+
+    def login_as(self, user):
+        self.open('/login/', {'email': user.email, 'password': PASSWORD}, scenario=False)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def start_wsgi_server():
+    server = make_server('127.0.0.1', 0, WSGIHandler(),
+                         server_class=ThreadingWSGIServer, handler_class=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(scenario, adapter_class, base_url, concurrency, requests_per_worker):
+    reset_recorded_queries()
+    latencies, errors = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(number):
+        try:
+            client = adapter_class(base_url)
+            scenario.prepare(client, number)
+            client.scenario = scenario.name
+        except Exception:
+            barrier.abort()
+            raise
+        try:
+            barrier.wait()
+            for _ in range(requests_per_worker):
+                started = time.perf_counter()
+                status = scenario.request(client, number)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if status >= 400:
+                        errors.append(status)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        raise RuntimeError(f"Preparing the {scenario.name} scenario failed")
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    queries = recorded_queries.get(scenario.name, [0])
+    return {
+        'scenario': scenario.name,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'queries_avg': statistics.mean(queries),
+        'queries_max': max(queries),
+        'query_budget': scenario.query_budget,
+        'peak_rss_mb': peak_rss_mb(),
+    }
@@ -0,0 +1,227 @@
+import itertools
+import threading
+import uuid
+
+from account.tokens import activation_token_generator, password_reset_token_generator
+from benchmark.seed import PASSWORD
+from product.models import Product
+
+
+class Scenario:
+    # One view under load. query_budget is the most SQL queries a single
+    # request may run, the load test fails when a request goes over it.
+    name = None
+    query_budget = None
+
+    def __init__(self, data):
+        self.data = data
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def next_number(self):
+        with self.lock:
+            return next(self.counter)
+
+    def prepare(self, client, worker):
+        # Runs once per client before measuring, e.g. to log in
+        pass
+
+    def request(self, client, worker):
+        raise NotImplementedError
+
+
+class LoginScenario(Scenario):
+    name = 'login'
+    # user lookup, session key exists check, session INSERT from cycle_key()
+    # and the UPDATE of SessionMiddleware on the way out, plus the bulk
+    # last_login UPDATE in the one login of every LAST_LOGIN_BUFFER_SIZE that
+    # flushes the buffer
+    query_budget = 5
+
+    def request(self, client, worker):
+        customers = self.data['customers']
+        user = customers[self.next_number() % len(customers)]
+        client.logout()
+        return client.post('/login/', {'email': user.email, 'password': PASSWORD})
+
+
+class RegisterScenario(Scenario):
+    name = 'register'
+    # uniqueness check, user INSERT, group membership, outbox INSERT
+    query_budget = 4
+
+    def request(self, client, worker):
+        email = f'register-{uuid.uuid4().hex}@loadtest.example'
+        return client.post('/register/', {
+            'name': 'Load Test', 'email': email, 'role': 'customer',
+            'password': PASSWORD, 'confirm_password': PASSWORD,
+        })
+
+
+class ActivateScenario(Scenario):
+    name = 'activate'
+    # user lookup, UPDATE of is_active
+    query_budget = 2
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.tokens = [activation_token_generator.make_token(user) for user in data['inactive']]
+
+    def request(self, client, worker):
+        token = self.tokens[self.next_number() % len(self.tokens)]
+        return client.get(f'/activate/{token}/')
+
+
+class PasswordResetScenario(Scenario):
+    name = 'password_reset'
+    # user lookup in the form, outbox INSERT
+    query_budget = 2
+
+    def request(self, client, worker):
+        customers = self.data['customers']
+        user = customers[self.next_number() % len(customers)]
+        return client.post('/password_reset/', {'email': user.email})
+
+
+class PasswordResetConfirmScenario(Scenario):
+    name = 'password_reset_confirm'
+    # user lookup for a valid token
+    query_budget = 1
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.tokens = [password_reset_token_generator.make_token(user)
+                       for user in data['customers']]
+
+    def request(self, client, worker):
+        token = self.tokens[self.next_number() % len(self.tokens)]
+        return client.get(f'/password_reset_confirm/{token}/')
+
+
+class DashboardScenario(Scenario):
+    users_key = None
+    path = None
+    # session lookup, the user comes from CachedAuthenticationMiddleware
+    query_budget = 1
+
+    def prepare(self, client, worker):
+        users = self.data[self.users_key]
+        client.login_as(users[worker % len(users)])
+        # Warm the user cache, the budget is for steady state page views
+        client.get(self.path)
+
+    def request(self, client, worker):
+        return client.get(self.path)
+
+
+class CustomerDashboardScenario(DashboardScenario):
+    name = 'customer_dashboard'
+    users_key = 'customers'
+    path = '/customer/dashboard'
+
+
+class SellerDashboardScenario(DashboardScenario):
+    name = 'seller_dashboard'
+    users_key = 'sellers'
+    path = '/seller/dashboard'
+    # session lookup, the stats row
+    query_budget = 2
+
+
+class ForbiddenScenario(Scenario):
+    name = 'forbidden'
+    # session lookup, the 403 itself is prebuilt bytes (a customer probing a
+    # seller URL)
+    query_budget = 1
+
+    def prepare(self, client, worker):
+        customers = self.data['customers']
+        client.login_as(customers[worker % len(customers)])
+        client.get('/seller/dashboard')
+
+    def request(self, client, worker):
+        status = client.get('/seller/dashboard')
+        # Forbidden is the expected outcome, anything else is an error
+        return 200 if status == 403 else max(status, 400)
+
+
+class ProductListScenario(Scenario):
+    name = 'product_list'
+    # session lookup, one index range scan for the page however deep it is
+    # on a list cache miss, or one in_bulk() for rows not cached yet. A warm
+    # page is the session lookup only.
+    query_budget = 2
+
+    def __init__(self, data):
+        super().__init__(data)
+        # Cursors of every page, requests jump around from first to last
+        self.cursors, cursor = [None], None
+        while True:
+            products, cursor = Product.objects.page('price', cursor)
+            if cursor is None:
+                break
+            self.cursors.append(cursor)
+
+    def prepare(self, client, worker):
+        customers = self.data['customers']
+        client.login_as(customers[worker % len(customers)])
+        client.get('/products/?format=json')
+
+    def request(self, client, worker):
+        cursor = self.cursors[self.next_number() * 7 % len(self.cursors)]
+        query = f'&cursor={cursor}' if cursor else ''
+        return client.get(f'/products/?format=json&ordering=price{query}')
+
+
+class ProductDetailScenario(Scenario):
+    name = 'product_detail'
+    # session lookup, the product on a cache miss
+    query_budget = 2
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.product_ids = list(Product.objects.values_list('pk', flat=True))
+
+    def prepare(self, client, worker):
+        customers = self.data['customers']
+        client.login_as(customers[worker % len(customers)])
+        client.get(f'/products/{self.product_ids[0]}/?format=json')
+
+    def request(self, client, worker):
+        # A hot set: most requests go to the first tenth of the catalog
+        number = self.next_number()
+        hot = self.product_ids[:max(1, len(self.product_ids) // 10)]
+        product_ids = self.product_ids if number % 10 == 0 else hot
+        return client.get(f'/products/{product_ids[number * 7 % len(product_ids)]}/?format=json')
+
+
+class SellerProductListScenario(Scenario):
+    name = 'seller_products'
+    # session lookup, one page of the seller's products with can_change and
+    # can_delete computed in the same query
+    query_budget = 2
+
+    def prepare(self, client, worker):
+        sellers = self.data['sellers']
+        client.login_as(sellers[worker % len(sellers)])
+        client.get('/seller/products/?size=100')
+
+    def request(self, client, worker):
+        return client.get('/seller/products/?size=100')
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (
+        LoginScenario,
+        RegisterScenario,
+        ActivateScenario,
+        PasswordResetScenario,
+        PasswordResetConfirmScenario,
+        CustomerDashboardScenario,
+        SellerDashboardScenario,
+        ForbiddenScenario,
+        ProductListScenario,
+        ProductDetailScenario,
+        SellerProductListScenario,
+    )
+}
@@ -0,0 +1,39 @@
+from decimal import Decimal
+
+from account.models import User
+from core.utils import assign_permission_bulk
+from product.models import Product
+from product.search import get_search_backend
+from seller.stats import reconcile_all
+
+PASSWORD = 'Loadtest-pass-1'
+
+
+def make_users(prefix, count, **fields):
+    users = []
+    for number in range(count):
+        user = User(email=f'{prefix}{number}@loadtest.example', name=f'{prefix}{number}', **fields)
+        user.set_password(PASSWORD)
+        users.append(user)
+    User.objects.bulk_create(users, batch_size=1000)
+    return users
+
+
+def seed(users, products):
+    # Returns the seeded objects the scenarios pick their input from
+    customers = make_users('customer', users, is_active=True, is_customer=True)
+    sellers = make_users('seller', max(1, users // 10), is_active=True,
+                         is_seller=True, is_customer=False)
+    inactive = make_users('inactive', users, is_active=False, is_customer=True)
+    assign_permission_bulk(customers + inactive, 'customer')
+    assign_permission_bulk(sellers, 'seller')
+    Product.objects.bulk_create(
+        [Product(sku=f'LT-{number}', name=f'Product {number}', seller=sellers[number % len(sellers)],
+                 description=f'Description of product {number}',
+                 price=Decimal(number % 1000) + Decimal('0.99'))
+         for number in range(products)],
+        batch_size=1000,
+    )
+    get_search_backend().rebuild()
+    reconcile_all()
+    return {'customers': customers, 'sellers': sellers, 'inactive': inactive}
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'seller',
     'core',
     'product',
+    'benchmark',
 ]
 
 MIDDLEWARE = [
@@ -49,7 +50,7 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'account.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -126,6 +127,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # To Use Custom User Model
 AUTH_USER_MODEL = 'account.User'
 
+# Runs the tests with empty file caches
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 
 SITE_DOMAIN = 'http://127.0.0.1:8000/'
 SITE_NAME = 'Auth System'
@@ -141,4 +145,101 @@ EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
 LOGOUT_REDIRECT_URL = 'login'
-LOGIN_URL = 'login'
\ No newline at end of file
+LOGIN_URL = 'login'
+
+# Outbox delivery (python manage.py send_outbox)
+OUTBOX_WORKERS = 4
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF = 30  # seconds, doubled on every failed attempt
+
+# Authenticate account.User by email with a single lookup
+AUTHENTICATION_BACKENDS = ['account.backends.EmailBackend']
+# account.User.email is unique case-insensitively through a functional index
+# (account_user_email_key) rather than unique=True, EmailBackend knows this
+SILENCED_SYSTEM_CHECKS = ['auth.W004']
+# Buffer last_login updates and write them in bulk instead of once per login
+DEFER_LAST_LOGIN = True
+LAST_LOGIN_BUFFER_SIZE = 100
+LAST_LOGIN_BUFFER_MAX_AGE = 30  # seconds
+
+# The default local memory cache holds only 300 entries, too few once product
+# rows are cached next to users and permissions. It is per process: caches
+# that are invalidated on writes use 'shared' instead, which every worker on
+# this machine reads. Swap it for memcached or redis across machines.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'shared': {
+        # FileBasedCache that doesn't list the directory on every set()
+        'BACKEND': 'core.cache_backends.SharedFileBasedCache',
+        'LOCATION': BASE_DIR / 'shared_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Effective permission sets are cached per user in this cache alias. It must
+# be shared by all processes (system check account.E001), else a revoked
+# permission keeps working in the other workers until the timeout.
+PERMISSION_CACHE_ALIAS = 'shared'
+PERMISSION_CACHE_TIMEOUT = 300
+
+# account.middleware.CachedAuthenticationMiddleware keeps the logged in user
+# in this cache alias instead of loading it on every request. Saving a user
+# invalidates the entry, the timeout bounds staleness for updates that
+# bypass save() (QuerySet.update(), bulk_update()). The invalidation must
+# reach every worker, so a password change ends old sessions everywhere at
+# once: a local memory cache fails system check account.E002.
+AUTH_USER_CACHE_ALIAS = 'shared'
+AUTH_USER_CACHE_TIMEOUT = 60  # seconds
+
+# Route login, register, password reset confirm and password change to the
+# async views that hash passwords in a process pool. Only useful when the
+# project is served through ASGI (ch35.asgi), under WSGI the thread waits anyway.
+OFFLOAD_PASSWORD_HASHING = False
+PASSWORD_HASHING_WORKERS = None  # defaults to the number of CPUs
+
+# Sliding window login limits checked before the password is hashed,
+# name: (attempts, window in seconds)
+RATELIMITS = {
+    'login_ip': (50, 300),
+    'login_email': (10, 300),
+}
+# Counted in a cache all workers share that increments atomically (system
+# check core.W001)
+RATELIMIT_CACHE_ALIAS = 'shared'
+# Behind a reverse proxy: the header holding the client address and how many
+# proxies of ours append to it, see core.ratelimit.client_ip()
+# RATELIMIT_CLIENT_IP_HEADER = 'HTTP_X_FORWARDED_FOR'
+# RATELIMIT_TRUSTED_PROXIES = 1
+
+# Lifetime of the signed activation and password reset links, in seconds
+ACTIVATION_TOKEN_MAX_AGE = 60 * 60 * 24 * 3
+PASSWORD_RESET_TOKEN_MAX_AGE = 60 * 60
+# Used links are remembered there until they expire (system check account.W001)
+TOKEN_CACHE_ALIAS = 'shared'
+
+# Product search: 'auto' uses the SQLite FTS5 index when the database has it
+# (python manage.py rebuild_product_search after bulk changes), else a
+# portable icontains scan. 'fts5' or 'portable' to force one.
+PRODUCT_SEARCH_BACKEND = 'auto'
+
+# Product detail lookups and catalog pages are read through this cache alias
+# (product.cache). Saves and deletes invalidate their entries in every worker
+# reading it (system check product.W001), the timeout bounds staleness for
+# updates that bypass save().
+PRODUCT_CACHE_ALIAS = 'shared'
+PRODUCT_CACHE_TIMEOUT = 300  # seconds
+
+# The customer and seller dashboards are cached once per role in this cache
+# alias (core.page_cache), per-user parts are {% user_fragment %} tags
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 600  # seconds
+
+# 403 page of core.decorators.login_and_role_required: a template to use
+# instead of the built-in page (rendered once, without a request) and how
+# long browsers may reuse it. Counted as forbidden.<role>.<route> metrics.
+ROLE_FORBIDDEN_TEMPLATE = None
+ROLE_FORBIDDEN_MAX_AGE = 60  # seconds
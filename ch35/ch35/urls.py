@@ -22,4 +22,6 @@ urlpatterns = [
     path('', include('account.urls')),
     path('customer/', include('customer.urls')),
     path('seller/', include('seller.urls')),
+    path('core/', include('core.urls')),
+    path('products/', include('product.urls')),
 ]
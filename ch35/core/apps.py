@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from core.checks import check_shared_caches
+        from core.utils import sync_role_groups
+        checks.register(check_shared_caches, checks.Tags.caches)
+        # Not limited to sender=self: the permissions of apps listed after
+        # core in INSTALLED_APPS are only created in their own post_migrate.
+        post_migrate.connect(sync_role_groups, dispatch_uid='sync_role_groups')
@@ -0,0 +1,68 @@
+import os
+import time
+from contextlib import contextmanager
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.utils.module_loading import import_string
+
+
+class SharedFileBasedCache(FileBasedCache):
+    # FileBasedCache lists the whole directory on every set() to see whether
+    # it holds MAX_ENTRIES yet, thousands of files for a set_many() of a page
+    # of products. This one looks at most once every CULL_INTERVAL seconds
+    # (default 1) per cache instance, the directory may go a little over
+    # MAX_ENTRIES in between.
+    # add() and incr() read and then write in FileBasedCache, two processes
+    # can both add a key or both write back the same count. Here they hold an
+    # exclusive lock on one of LOCK_STRIPES files in <LOCATION>/locks while
+    # doing so, the key's md5 picks which, so counters are exact across the
+    # processes of a host (system check core.W001 looks for atomic_incr).
+    atomic_incr = True
+    lock_stripes = 64
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = params.get('OPTIONS', {}).get('CULL_INTERVAL', 1)
+        self._next_cull = 0
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self._cull_interval
+        super()._cull()
+
+    @contextmanager
+    def _key_lock(self, key):
+        stripe = int(md5(key.encode(), usedforsecurity=False).hexdigest(), 16) % self.lock_stripes
+        path = os.path.join(self._dir, 'locks', f'{stripe:02d}.lock')
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        with open(path, 'ab') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(file)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._key_lock(self.make_and_validate_key(key, version=version)):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._key_lock(self.make_and_validate_key(key, version=version)):
+            return super().incr(key, delta, version)
+
+
+def file_caches_in(directory):
+    # settings.CACHES with every file based cache moved to an empty
+    # subdirectory of directory. Files outlive a throwaway database, whose
+    # ids start over: tests and benchmarks must not read the project's.
+    caches = {alias: dict(config) for alias, config in settings.CACHES.items()}
+    for alias, config in caches.items():
+        if issubclass(import_string(config['BACKEND']), FileBasedCache):
+            config['LOCATION'] = os.path.join(directory, f'cache_{alias}')
+    return caches
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core import checks
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.utils.module_loading import import_string
+
+
+def is_process_local(alias):
+    # Every worker process has its own LocMemCache: a key deleted or a
+    # version bumped in one process is never seen by the others, so whatever
+    # they cached stays in use until it expires.
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None:
+        return False
+    try:
+        return issubclass(import_string(backend), LocMemCache)
+    except ImportError:
+        return False
+
+
+def has_atomic_incr(alias):
+    # memcached and redis increment on the server, SharedFileBasedCache under
+    # a file lock. The other backends get, add one and set: concurrent
+    # add()/incr() calls overwrite each other's counts.
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None:
+        return False
+    try:
+        backend = import_string(backend)
+    except ImportError:
+        return False
+    return (issubclass(backend, (BaseMemcachedCache, RedisCache))
+            or getattr(backend, 'atomic_incr', False))
+
+
+def check_shared_caches(app_configs, **kwargs):
+    warnings = []
+    alias = getattr(settings, 'RATELIMIT_CACHE_ALIAS', 'default')
+    if is_process_local(alias):
+        warnings.append(checks.Warning(
+            f"RATELIMIT_CACHE_ALIAS '{alias}' is a per-process local memory cache.",
+            hint="Every worker process counts separately, with N workers a client "
+                 "gets N times the RATELIMITS. Point it at a cache all processes "
+                 "share (memcached or redis count atomically).",
+            id='core.W001',
+        ))
+    elif not has_atomic_incr(alias):
+        warnings.append(checks.Warning(
+            f"RATELIMIT_CACHE_ALIAS '{alias}' doesn't increment atomically.",
+            hint="Concurrent attempts overwrite each other's counts, a client "
+                 "sending them in parallel gets past the RATELIMITS. Use "
+                 "memcached, redis or core.cache_backends.SharedFileBasedCache.",
+            id='core.W001',
+        ))
+    return warnings
@@ -1,6 +1,13 @@
+import gzip
+import json
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from functools import wraps
+from django.template.loader import render_to_string
+from functools import cache, wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.http import HttpResponseForbidden
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from core import metrics
 
 erro_403_html = """
 <!DOCTYPE html>
@@ -72,16 +79,82 @@ erro_403_html = """
 
 """
 
-def login_and_role_required(required_role):
+@cache
+def forbidden_bodies():
+  # The 403 page is the same for every request: rendered, encoded and
+  # compressed once per process, each forbidden request only wraps the
+  # bytes in a response. ROLE_FORBIDDEN_TEMPLATE replaces erro_403_html,
+  # it is rendered without a request, so it can't show anything per user.
+  template_name = getattr(settings, 'ROLE_FORBIDDEN_TEMPLATE', None)
+  html = (render_to_string(template_name) if template_name else erro_403_html).encode()
+  return {
+    'html': html,
+    # mtime=0 keeps the bytes (and so any ETag a proxy derives) stable
+    'html_gzip': gzip.compress(html, compresslevel=9, mtime=0),
+    'json': json.dumps({'detail': "You are not authorized to access this page.",
+                        'code': 'forbidden'}).encode(),
+  }
+
+
+def wants_json(request):
+  return (request.GET.get('format') == 'json'
+          or request.headers.get('Accept', '').startswith('application/json'))
+
+
+def forbidden_response(request, required_role):
+  # Counted per required role and route, to see how much probing there is
+  route = request.resolver_match.view_name if request.resolver_match else 'unknown'
+  metrics.incr(f'forbidden.{required_role}.{route}')
+  bodies = forbidden_bodies()
+  if wants_json(request):
+    response = HttpResponseForbidden(bodies['json'], content_type='application/json')
+  elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+    response = HttpResponseForbidden(bodies['html_gzip'])
+    response['Content-Encoding'] = 'gzip'
+  else:
+    response = HttpResponseForbidden(bodies['html'])
+  # Whether a user is forbidden depends on who they are
+  patch_vary_headers(response, ('Accept', 'Accept-Encoding', 'Cookie'))
+  patch_cache_control(response, private=True,
+                      max_age=getattr(settings, 'ROLE_FORBIDDEN_MAX_AGE', 60))
+  # Counted above, skip the "Forbidden: ..." warning django.request would
+  # log for every probe
+  response._has_been_logged = True
+  return response
+
+
+def role_check(request, user, required_role, perm):
+  # Returns None when the user may continue or the forbidden response
+  if required_role == "customer" and not user.is_customer:
+    return forbidden_response(request, required_role)
+  if required_role == "seller" and not user.is_seller:
+    return forbidden_response(request, required_role)
+  if perm is not None and not user.has_perm(perm):
+    return forbidden_response(request, required_role)
+  return None
+
+
+def login_and_role_required(required_role, perm=None):
+  # perm is an optional permission like "product.add_product" checked after
+  # the role, it is answered from the shared permission cache
   def decorator(view_func):
+    if iscoroutinefunction(view_func):
+      @wraps(view_func)
+      @login_required
+      async def _wrapped_view(request, *args, **kwargs):
+        user = await request.auser()
+        forbidden = await sync_to_async(role_check)(request, user, required_role, perm)
+        if forbidden is not None:
+          return forbidden
+        return await view_func(request, *args, **kwargs)
+      return _wrapped_view
+
     @wraps(view_func)
     @login_required
     def _wrapped_view(request, *args, **kwargs):
-      user = request.user
-      if required_role == "customer" and not user.is_customer:
-        return HttpResponseForbidden(erro_403_html)
-      if required_role == "seller" and not user.is_seller:
-        return HttpResponseForbidden(erro_403_html)
+      forbidden = role_check(request, request.user, required_role, perm)
+      if forbidden is not None:
+        return forbidden
       return view_func(request, *args, **kwargs)
     return _wrapped_view
   return decorator
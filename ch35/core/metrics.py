@@ -0,0 +1,54 @@
+import contextlib
+import threading
+import time
+from collections import Counter
+
+# Simple in-process counters (cache hits, rejections ...) that are exposed
+# to staff through core.views.metrics_view. Each worker process keeps its own.
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+@contextlib.contextmanager
+def timer(name):
+    # Counts the timed block in <name>.count and its duration in <name>.seconds
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _counters[f'{name}.count'] += 1
+            _counters[f'{name}.seconds'] += elapsed
+
+
+def derived(counters):
+    # <x>.hit_ratio from <x>.hit and <x>.miss, <x>.avg_ms from a timer
+    values = {}
+    for name, value in counters.items():
+        if name.endswith('.hit'):
+            base = name[:-len('.hit')]
+            total = value + counters.get(f'{base}.miss', 0)
+            values[f'{base}.hit_ratio'] = round(value / total, 4) if total else None
+        elif name.endswith('.seconds'):
+            base = name[:-len('.seconds')]
+            count = counters.get(f'{base}.count', 0)
+            values[f'{base}.avg_ms'] = round(value / count * 1000, 3) if count else None
+    return values
+
+
+def snapshot(prefix=''):
+    with _lock:
+        counters = {name: value for name, value in _counters.items() if name.startswith(prefix)}
+    counters.update(derived(counters))
+    return dict(sorted(counters.items()))
+
+
+def reset():
+    with _lock:
+        _counters.clear()
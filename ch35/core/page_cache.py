@@ -0,0 +1,163 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import cc_delim_re, patch_cache_control, patch_vary_headers
+from django.utils.safestring import mark_safe
+from core import metrics
+
+# Pages behind login that look the same for every user of a role are
+# rendered once per role as a skeleton and cached under
+#   page_role:<version>:<role>:<hash of the path and the Vary header values>
+# The few per-user parts (CSRF token, messages, a seller's stats ...) are
+# {% user_fragment %} tags in the templates: the skeleton holds a marker
+# for each, replaced by the fragment rendered for the current user on every
+# request. The response is Cache-Control: private and Vary: Cookie, so no
+# shared cache downstream ever serves it to another user.
+VERSION_KEY = 'page_role:version'
+FRAGMENT_START, FRAGMENT_END = '<!--user-fragment:', '-->'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def role_of(user):
+    # The part of the user the cached page may depend on, None for a user
+    # whose pages are not cached
+    roles = [role for role, flag in (('customer', user.is_customer), ('seller', user.is_seller))
+             if flag]
+    return '+'.join(roles) or None
+
+
+def fragment_marker(template_name):
+    return mark_safe(f'{FRAGMENT_START}{template_name}{FRAGMENT_END}')
+
+
+def rendering_skeleton(request):
+    return getattr(request, '_page_cache_skeleton', False)
+
+
+def get_version(cache):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_pages():
+    # Every role's cached pages, e.g. after a template change
+    get_cache().set(VERSION_KEY, time.time_ns(), None)
+
+
+def vary_headers(response):
+    # Headers the view said its output depends on, except Cookie: that is
+    # what the role and the fragments stand in for
+    if not response.has_header('Vary'):
+        return []
+    return sorted(header.lower() for header in cc_delim_re.split(response['Vary'])
+                  if header and header.lower() not in ('cookie', '*'))
+
+
+def page_key(version, role, request, headers):
+    values = '|'.join(request.headers.get(header, '') for header in headers)
+    digest = hashlib.md5(f'{request.get_full_path()}|{values}'.encode(),
+                         usedforsecurity=False).hexdigest()
+    return f'page_role:{version}:{role}:{digest}'
+
+
+def headers_key(version, role, request):
+    # Where the Vary header names of a path are remembered, as in
+    # django.utils.cache.learn_cache_key()
+    digest = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()
+    return f'page_role:{version}:{role}:headers:{digest}'
+
+
+def touched_user_state(request):
+    # Whether rendering used something of the current user outside a
+    # fragment: a CSRF token or the messages
+    messages = getattr(request, '_messages', None)
+    return (request.META.get('CSRF_COOKIE_NEEDS_UPDATE', False)
+            or (messages is not None and messages.used))
+
+
+def stitch(request, skeleton, fragment_context):
+    parts = skeleton.split(FRAGMENT_START)
+    if len(parts) == 1:
+        return skeleton
+    context = fragment_context(request) if fragment_context else {}
+    output = [parts[0]]
+    for part in parts[1:]:
+        template_name, rest = part.split(FRAGMENT_END, 1)
+        output.append(render_to_string(template_name, context, request=request))
+        output.append(rest)
+    return ''.join(output)
+
+
+def cache_page_per_role(timeout=None, fragment_context=None):
+    # Caches a GET view's page per role, see above. fragment_context(request)
+    # returns the extra context of the page's user fragments. Use it below
+    # the login/role check decorators.
+    if timeout is None:
+        timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            role = role_of(request.user) if request.user.is_authenticated else None
+            if request.method not in ('GET', 'HEAD') or role is None:
+                return view_func(request, *args, **kwargs)
+            cache = get_cache()
+            version = get_version(cache)
+            headers = cache.get(headers_key(version, role, request))
+            entry = None
+            if headers is not None:
+                entry = cache.get(page_key(version, role, request, headers))
+            if entry is not None:
+                metrics.incr('page_cache.hit')
+                skeleton, content_type = entry
+            else:
+                metrics.incr('page_cache.miss')
+                # Tell whether rendering the skeleton asks for a CSRF token
+                csrf_update = request.META.pop('CSRF_COOKIE_NEEDS_UPDATE', False)
+                request._page_cache_skeleton = True
+                try:
+                    response = view_func(request, *args, **kwargs)
+                    if hasattr(response, 'render') and callable(response.render):
+                        response.render()
+                finally:
+                    request._page_cache_skeleton = False
+                touched = touched_user_state(request)
+                if csrf_update:
+                    request.META['CSRF_COOKIE_NEEDS_UPDATE'] = True
+                if (response.status_code != 200 or response.streaming
+                        or response.cookies or touched):
+                    # Not the same for the whole role, return it as it is
+                    # with the fragments filled in
+                    metrics.incr('page_cache.uncacheable')
+                    if not response.streaming:
+                        response.content = stitch(
+                            request, response.content.decode(response.charset),
+                            fragment_context)
+                    return response
+                headers = vary_headers(response)
+                skeleton = response.content.decode(response.charset)
+                content_type = response['Content-Type']
+                cache.set_many({
+                    headers_key(version, role, request): headers,
+                    page_key(version, role, request, headers): (skeleton, content_type),
+                }, timeout)
+            response = HttpResponse(stitch(request, skeleton, fragment_context),
+                                    content_type=content_type)
+            if headers:
+                patch_vary_headers(response, headers)
+            patch_vary_headers(response, ('Cookie',))
+            patch_cache_control(response, private=True)
+            return response
+        return _wrapped_view
+    return decorator
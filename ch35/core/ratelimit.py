@@ -0,0 +1,78 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from core import metrics
+
+
+class SlidingWindowLimiter:
+    # Sliding window counter: every key keeps one counter for the current
+    # fixed window and reads the one of the previous window, weighted by how
+    # much of it still overlaps the sliding window. That is two cache entries
+    # per key no matter how many attempts there are.
+    # The counters are only as shared and as exact as the cache alias:
+    # add() and incr() are atomic on memcached, redis and
+    # SharedFileBasedCache, while the stock file and database caches read and
+    # write back, so concurrent attempts lose counts. A local memory cache
+    # counts per worker process: with N workers a client gets up to N times
+    # the limit. System check core.W001 warns about both.
+
+    def __init__(self, name, limit, window, cache_alias='default'):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.cache_alias = cache_alias
+
+    def make_key(self, key, window_number):
+        digest = hashlib.sha256(str(key).encode()).hexdigest()[:32]
+        return f'rl:{self.name}:{digest}:{window_number}'
+
+    def hit(self, key):
+        # Counts an attempt and returns True while the key is under the limit
+        cache = caches[self.cache_alias]
+        now = time.time()
+        window_number = int(now // self.window)
+        current_key = self.make_key(key, window_number)
+        # Entries live for two windows so the next window can still read them
+        cache.add(current_key, 0, self.window * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(current_key, 1, self.window * 2)
+            current = 1
+        previous = cache.get(self.make_key(key, window_number - 1), 0)
+        overlap = 1 - (now % self.window) / self.window
+        allowed = previous * overlap + current <= self.limit
+        if not allowed:
+            metrics.incr(f'ratelimit.{self.name}.rejected')
+        return allowed
+
+    def reset(self, key):
+        window_number = int(time.time() // self.window)
+        caches[self.cache_alias].delete_many(
+            [self.make_key(key, window_number), self.make_key(key, window_number - 1)])
+
+
+def client_ip(request):
+    # Behind a reverse proxy set RATELIMIT_CLIENT_IP_HEADER, e.g. to
+    # 'HTTP_X_FORWARDED_FOR', otherwise every client shares the proxy address.
+    # Clients can send the header themselves, only the entries appended by
+    # our RATELIMIT_TRUSTED_PROXIES proxies are real: each appends the address
+    # it got the request from, so the client is the last of them counted
+    # from the right. A shorter header didn't come through all of them.
+    header = getattr(settings, 'RATELIMIT_CLIENT_IP_HEADER', None)
+    if header and request.META.get(header):
+        addresses = [address.strip() for address in request.META[header].split(',')]
+        trusted_proxies = getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', 1)
+        if 0 < trusted_proxies <= len(addresses):
+            return addresses[-trusted_proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def get_limiter(name):
+    # Limiters are configured in settings.RATELIMITS as name: (limit, window)
+    limit, window = settings.RATELIMITS[name]
+    return SlidingWindowLimiter(
+        name, limit, window, getattr(settings, 'RATELIMIT_CACHE_ALIAS', 'default'))
@@ -0,0 +1,16 @@
+from django import template
+from core.page_cache import fragment_marker, rendering_skeleton
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def user_fragment(context, template_name):
+    # {% user_fragment "account/messages.html" %} renders like {% include %},
+    # but a page cached per role (core.page_cache) keeps a marker in its
+    # place and renders it again for every user
+    request = context.get('request')
+    if request is not None and rendering_skeleton(request):
+        return fragment_marker(template_name)
+    with context.push():
+        return context.template.engine.get_template(template_name).render(context)
@@ -0,0 +1,22 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from core.cache_backends import file_caches_in
+
+
+class TestRunner(DiscoverRunner):
+    # Every test run gets empty file caches instead of the project's, see
+    # core.cache_backends.file_caches_in()
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_override = override_settings(CACHES=file_caches_in(self.cache_dir))
+        self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
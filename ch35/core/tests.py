@@ -1,3 +1,254 @@
-from django.test import TestCase
+import gzip
+import json
+import threading
+import time
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.template import RequestContext, Template
+from django.urls import reverse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from account.models import User
+from account.views import save_registered_user
+from core import metrics
+from core.checks import check_shared_caches
+from core.page_cache import cache_page_per_role, invalidate_pages
+from core.ratelimit import SlidingWindowLimiter, client_ip
+from core.utils import role_group_name, sync_role_groups
+from seller.models import SellerStats
+
+
+class ClientIpTests(SimpleTestCase):
+    def request(self, forwarded_for=None):
+        extra = {} if forwarded_for is None else {'HTTP_X_FORWARDED_FOR': forwarded_for}
+        return RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', **extra)
+
+    def test_without_header_setting_the_peer_address_is_used(self):
+        self.assertEqual(client_ip(self.request('1.2.3.4')), '10.0.0.1')
+
+    @override_settings(RATELIMIT_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_client_supplied_entries_are_ignored(self):
+        # The proxy appended 203.0.113.7, the rest came from the client
+        self.assertEqual(client_ip(self.request('1.2.3.4, 5.6.7.8, 203.0.113.7')), '203.0.113.7')
+        self.assertEqual(client_ip(self.request()), '10.0.0.1')
+
+    @override_settings(RATELIMIT_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR',
+                       RATELIMIT_TRUSTED_PROXIES=2)
+    def test_trusted_proxy_count(self):
+        self.assertEqual(client_ip(self.request('1.2.3.4, 203.0.113.7, 10.0.0.9')), '203.0.113.7')
+        # Didn't go through both proxies
+        self.assertEqual(client_ip(self.request('203.0.113.7')), '10.0.0.1')
+
+
+class SlidingWindowLimiterTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_limit_per_key(self):
+        limiter = SlidingWindowLimiter('test', 3, 300)
+        self.assertEqual([limiter.hit('a') for _ in range(4)], [True, True, True, False])
+        self.assertTrue(limiter.hit('b'))
+        limiter.reset('a')
+        self.assertTrue(limiter.hit('a'))
+
+    def test_concurrent_hits_on_the_shared_cache_all_count(self):
+        caches['shared'].clear()
+        limiter = SlidingWindowLimiter('test', 10 ** 6, 300, 'shared')
+        barrier = threading.Barrier(8)
+
+        def attempts():
+            # Every thread has its own cache instance, like worker processes
+            barrier.wait()
+            for _ in range(25):
+                limiter.hit('a')
+
+        threads = [threading.Thread(target=attempts) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        current = limiter.make_key('a', int(time.time() // 300))
+        self.assertEqual(caches['shared'].get(current), 200)
+
+
+class RatelimitCheckTests(SimpleTestCase):
+    def check_ids(self, backend):
+        with override_settings(CACHES={'default': {'BACKEND': backend, 'LOCATION': 'x'}},
+                               RATELIMIT_CACHE_ALIAS='default'):
+            return [warning.id for warning in check_shared_caches(None)]
+
+    def test_backends_without_atomic_increments_are_flagged(self):
+        self.assertEqual(self.check_ids('django.core.cache.backends.locmem.LocMemCache'),
+                         ['core.W001'])
+        self.assertEqual(self.check_ids('django.core.cache.backends.filebased.FileBasedCache'),
+                         ['core.W001'])
+        self.assertEqual(self.check_ids('django.core.cache.backends.db.DatabaseCache'),
+                         ['core.W001'])
+
+    def test_atomic_backends_pass(self):
+        self.assertEqual(self.check_ids('core.cache_backends.SharedFileBasedCache'), [])
+        self.assertEqual(self.check_ids('django.core.cache.backends.redis.RedisCache'), [])
+        self.assertEqual(
+            self.check_ids('django.core.cache.backends.memcached.PyMemcacheCache'), [])
+
+
+class RoleGroupTests(TestCase):
+    def register(self, email, role):
+        user = User(email=email)
+        user.set_password('a-long-password-1')
+        save_registered_user(user, role)
+        User.objects.filter(pk=user.pk).update(is_active=True)
+        return User.objects.get(pk=user.pk)
+
+    def test_new_users_get_the_group_of_their_role(self):
+        seller = self.register('seller@example.com', 'seller')
+        customer = self.register('customer@example.com', 'customer')
+        self.assertEqual(list(seller.groups.values_list('name', flat=True)), ['Seller Role'])
+        self.assertEqual(list(customer.groups.values_list('name', flat=True)), ['Customer Role'])
+        # Through the group only, nothing granted directly
+        self.assertFalse(seller.user_permissions.exists())
+        self.assertTrue(seller.has_perms(['product.view_product', 'product.add_product',
+                                          'product.change_product']))
+        self.assertTrue(customer.has_perm('product.view_product'))
+        self.assertFalse(customer.has_perm('product.add_product'))
+
+    def test_sync_updates_the_groups_to_the_config(self):
+        group = Group.objects.get(name=role_group_name('seller'))
+        group.permissions.clear()
+        sync_role_groups()
+        self.assertEqual(
+            sorted(group.permissions.values_list('codename', flat=True)),
+            ['add_product', 'change_product', 'view_product'])
+
+
+class BackfillRoleGroupsMigrationTests(TransactionTestCase):
+    before = [('account', '0006_user_email_key')]
+    after = [('account', '0007_backfill_role_groups')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_users_are_put_in_their_role_group(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        OldUser = apps.get_model('account', 'User')
+        OldUser.objects.bulk_create([
+            OldUser(email='seller@example.com', is_seller=True, is_customer=False),
+            OldUser(email='customer@example.com', is_customer=True),
+            OldUser(email='nobody@example.com', is_customer=False),
+        ])
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        groups = {user.email: [group.name for group in user.groups.all()]
+                  for user in User.objects.prefetch_related('groups')}
+        self.assertEqual(groups, {
+            'seller@example.com': ['Seller Role'],
+            'customer@example.com': ['Customer Role'],
+            'nobody@example.com': [],
+        })
+
+
+@override_settings(PAGE_CACHE_ALIAS='default')
+class PageCacheTests(TestCase):
+    fragment = '{% user_fragment "seller/fragments/dashboard_stats.html" %}'
+
+    def setUp(self):
+        caches['default'].clear()
+        metrics.reset()
+        self.renders = 0
+        for number in range(2):
+            User.objects.create_user(email=f's{number}@example.com')
+        User.objects.update(is_seller=True, is_customer=False)
+        self.sellers = list(User.objects.order_by('pk'))
+
+    def view(self, body):
+        @cache_page_per_role(fragment_context=lambda request: {
+            'stats': SellerStats(product_count=request.user.pk)})
+        def page(request):
+            self.renders += 1
+            template = Template('{% load page_cache %}<h1>Page</h1>' + body)
+            return HttpResponse(template.render(RequestContext(request)))
+        return page
+
+    def get(self, view, user):
+        request = RequestFactory().get('/page/')
+        request.user = user
+        return view(request).content.decode()
+
+    def test_same_role_shares_the_skeleton_not_the_fragments(self):
+        view = self.view(self.fragment)
+        first, second = self.sellers
+        self.assertIn(f'Products: {first.pk}', self.get(view, first))
+        self.assertIn(f'Products: {second.pk}', self.get(view, second))
+        self.assertEqual(self.renders, 1)
+        self.assertEqual((metrics.snapshot()['page_cache.miss'],
+                          metrics.snapshot()['page_cache.hit']), (1, 1))
+
+    def test_user_state_outside_a_fragment_is_not_cached(self):
+        # The CSRF token is the user's own, the page can't be shared
+        view = self.view('<p>{{ csrf_token }}</p>' + self.fragment)
+        first, second = self.sellers
+        content = self.get(view, first)
+        self.assertIn(f'Products: {first.pk}', content)
+        self.assertNotIn('user-fragment', content)
+        self.assertIn(f'Products: {second.pk}', self.get(view, second))
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(metrics.snapshot()['page_cache.uncacheable'], 2)
+
+    def test_invalidate_pages(self):
+        view = self.view(self.fragment)
+        self.get(view, self.sellers[0])
+        self.get(view, self.sellers[0])
+        self.assertEqual(self.renders, 1)
+        invalidate_pages()
+        self.assertIn(f'Products: {self.sellers[1].pk}', self.get(view, self.sellers[1]))
+        self.assertEqual(self.renders, 2)
+
+
+class ForbiddenResponseTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        customer = User.objects.create_user(email='c@example.com')
+        User.objects.filter(pk=customer.pk).update(is_active=True)
+        self.client.force_login(User.objects.get(pk=customer.pk))
+        self.url = reverse('seller:seller_dashboard')
+
+    def assertForbidden(self, response, content_type):
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response['Content-Type'].startswith(content_type))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept, Accept-Encoding, Cookie')
+
+    def test_html(self):
+        response = self.client.get(self.url)
+        self.assertForbidden(response, 'text/html')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'403 - Access Forbidden', response.content)
+        self.assertEqual(metrics.snapshot('forbidden.')['forbidden.seller.seller:seller_dashboard'],
+                         1)
+
+    def test_compressed_html(self):
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip, br'})
+        self.assertForbidden(response, 'text/html')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'403 - Access Forbidden', gzip.decompress(response.content))
+
+    def test_json(self):
+        for response in (self.client.get(self.url, {'format': 'json'}),
+                         self.client.get(self.url, headers={'Accept': 'application/json'})):
+            self.assertForbidden(response, 'application/json')
+            self.assertEqual(json.loads(response.content)['code'], 'forbidden')
+
+    def test_anonymous_users_are_sent_to_login(self):
+        self.client.logout()
+        response = self.client.get(self.url, {'format': 'json'})
+        self.assertRedirects(response, f"{reverse('login')}?next={self.url}%3Fformat%3Djson",
+                             fetch_redirect_response=False)
@@ -0,0 +1,6 @@
+from django.urls import path
+from core.views import metrics_view
+app_name = 'core'
+urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
+]
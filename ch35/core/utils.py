@@ -1,14 +1,70 @@
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.models import ContentType
+from django.db.models import Q
+from account.models import User
+from account.permission_cache import invalidate_users
 from core.permission_config import PERMISSION_CONFIG
 
-def assign_permission(user, role):
-    role_permission = PERMISSION_CONFIG.get(role,{})
+# role -> Group id, filled the first time a role is assigned in this process
+_role_group_ids = {}
+
+
+def role_group_name(role):
+    return f"{role.title()} Role"
+
+
+def role_permissions(role):
+    # All Permission rows for a role in PERMISSION_CONFIG, in a single query
+    role_permission = PERMISSION_CONFIG.get(role, {})
+    content_types = ContentType.objects.get_for_models(*role_permission)
+    query = Q()
     for model, permissions in role_permission.items():
-        content_type = ContentType.objects.get_for_model(model)
-        for perm_codename in permissions:
-            permission = Permission.objects.get(
-                content_type = content_type,
-                codename = f"{perm_codename}_{model._meta.model_name}"
-            )
-            user.user_permissions.add(permission)
+        query |= Q(
+            content_type=content_types[model],
+            codename__in=[f"{perm_codename}_{model._meta.model_name}"
+                          for perm_codename in permissions],
+        )
+    if not query:
+        return Permission.objects.none()
+    return Permission.objects.filter(query)
+
+
+def sync_role_groups(**kwargs):
+    # Compile PERMISSION_CONFIG into one Group per role. Runs after every
+    # migrate, so editing PERMISSION_CONFIG updates every user of that role.
+    _role_group_ids.clear()
+    for role in PERMISSION_CONFIG:
+        group, _ = Group.objects.get_or_create(name=role_group_name(role))
+        group.permissions.set(role_permissions(role))
+        _role_group_ids[role] = group.pk
+
+
+def get_role_group_id(role):
+    if role not in PERMISSION_CONFIG:
+        return None
+    if role not in _role_group_ids:
+        group_id = Group.objects.filter(
+            name=role_group_name(role)).values_list('pk', flat=True).first()
+        if group_id is None:
+            sync_role_groups()
+        else:
+            _role_group_ids[role] = group_id
+    return _role_group_ids[role]
+
+
+def assign_permission_bulk(users, role):
+    # One multi-row INSERT of group memberships for any number of users
+    group_id = get_role_group_id(role)
+    if group_id is None:
+        return
+    Membership = User.groups.through
+    Membership.objects.bulk_create(
+        [Membership(user_id=user.pk, group_id=group_id) for user in users],
+        ignore_conflicts=True,
+    )
+    # bulk_create does not send m2m_changed
+    invalidate_users([user.pk for user in users])
+
+
+def assign_permission(user, role):
+    assign_permission_bulk([user], role)
@@ -1,3 +1,9 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from core import metrics
 
-# Create your views here.
+
+@staff_member_required
+def metrics_view(request):
+    # Counters of this worker process, e.g. /core/metrics/?prefix=permission_cache
+    return JsonResponse(metrics.snapshot(request.GET.get('prefix', '')))
@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.urls import path
-from customer.views import customer_dashboard_view, password_change_view
+from customer.views import customer_dashboard_view, password_change_view, apassword_change_view
 app_name = 'customer'
+
+if settings.OFFLOAD_PASSWORD_HASHING:
+    password_change_view = apassword_change_view
+
 urlpatterns = [
     path('dashboard', customer_dashboard_view, name='customer_dashboard'),
     path('password-change/', password_change_view,
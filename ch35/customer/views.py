@@ -1,12 +1,18 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib import messages
-from django.contrib.auth import logout
+from django.contrib.auth import logout, alogout
 from django.contrib.auth.decorators import login_required
 from core.decorators import login_and_role_required
+from core.page_cache import cache_page_per_role
+from asgiref.sync import sync_to_async
+from account.forms import OffloadedPasswordChangeForm
+from account.hashing import acheck_password, aset_password
+from account.views import arender
 
 
 @login_and_role_required('customer')
+@cache_page_per_role()
 def customer_dashboard_view(request):
     return render(request, 'customer/dashboard.html')
 
@@ -30,3 +36,31 @@ def password_change_view(request):
     else:
         form = PasswordChangeForm(user=request.user)
     return render(request, 'customer/password_change.html', {'form': form})
+
+
+@login_and_role_required('customer')
+async def apassword_change_view(request):
+    # Async variant of password_change_view, both the old password check and
+    # the new hash run in the account.hashing process pool
+    user = await request.auser()
+    if request.method == "POST":
+        old_password_valid = await acheck_password(
+            user, request.POST.get("old_password") or "")
+        form = OffloadedPasswordChangeForm(
+            user=user, data=request.POST, old_password_valid=old_password_valid)
+        if await sync_to_async(form.is_valid)():
+            await aset_password(user, form.cleaned_data["new_password1"])
+            await user.asave()
+            await alogout(request)
+            messages.success(
+                request, "Password changed successfully. Please log in with your new password."
+            )
+            return redirect('login')
+        else:
+            # Handle form errors and display them to the user
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, error)
+    else:
+        form = OffloadedPasswordChangeForm(user=user)
+    return await arender(request, 'customer/password_change.html', {'form': form})
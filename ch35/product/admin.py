@@ -4,6 +4,7 @@ from product.models import Product
 
 class ProductModelAdmin(admin.ModelAdmin):
     model = Product
-    list_display = ["id","name","description","price"]
+    list_display = ["id","sku","name","description","price","seller"]
+    list_select_related = ["seller"]
 
 admin.site.register(Product, ProductModelAdmin)
\ No newline at end of file
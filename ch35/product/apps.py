@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class ProductConfig(AppConfig):
     name = 'product'
+
+    def ready(self):
+        from product import cache, search
+        from product.checks import check_shared_caches
+        search.connect_signals()
+        cache.connect_signals()
+        checks.register(check_shared_caches, checks.Tags.caches)
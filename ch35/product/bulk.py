@@ -0,0 +1,152 @@
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from product.cache import invalidate_products
+from product.models import Product
+from product.search import get_search_backend
+
+# Columns of the CSV files sellers import and export, sku is the natural key
+CSV_COLUMNS = ('sku', 'name', 'description', 'price')
+UPDATE_FIELDS = ['name', 'description', 'price', 'updated_at']
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.upserted = 0
+        self.errors = []  # (line number, message), the first MAX_REPORTED_ERRORS
+        self.error_count = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def parse_row(row):
+    # Returns a Product for one CSV row, validated with the model fields'
+    # own rules but without a query. Raises ValidationError.
+    values, errors = {}, []
+    for column in CSV_COLUMNS:
+        try:
+            values[column] = Product._meta.get_field(column).clean(
+                (row.get(column) or '').strip(), None)
+        except ValidationError as error:
+            errors.extend(f"{column}: {message}" for message in error.messages)
+    if errors:
+        raise ValidationError(errors)
+    return Product(**values)
+
+
+def taken_skus(skus, seller):
+    return list(Product.objects.filter(sku__in=skus).exclude(
+        seller_id=seller.pk).values_list('sku', flat=True))
+
+
+class SkuTaken(Exception):
+    def __init__(self, skus):
+        self.skus = skus
+
+
+def upsert_batch(rows, seller=None, result=None):
+    # rows: (line number, Product). One INSERT ... ON CONFLICT (sku) DO
+    # UPDATE for the whole batch. The last row wins when a sku repeats, a
+    # statement may not update a row twice. With a seller, new products are
+    # theirs and rows whose sku belongs to someone else are rejected; the
+    # owner is never in UPDATE_FIELDS, an upsert doesn't move a product.
+    # The upsert can't be told to skip other sellers' rows, and one may
+    # create a product with our sku between the check and the write. So the
+    # check runs again after the write: by then the statement holds the lock
+    # of every row it inserted or updated until we commit, nobody can add or
+    # take over one of the skus any more. Finding one means we overwrote it,
+    # the write is rolled back and done again without it.
+    rows = {product.sku: (line, product) for line, product in rows}
+    with transaction.atomic():
+        taken = taken_skus(list(rows), seller) if seller is not None else []
+        while True:
+            for sku in taken:
+                line, _ = rows.pop(sku)
+                if result is not None:
+                    result.add_error(line, f"sku {sku} belongs to another seller")
+            products = [product for _, product in rows.values()]
+            for product in products:
+                # Left over from a rolled back attempt
+                product.pk = None
+                product.seller = seller
+            try:
+                with transaction.atomic():
+                    Product.objects.bulk_create(
+                        products,
+                        update_conflicts=True,
+                        unique_fields=['sku'],
+                        update_fields=UPDATE_FIELDS,
+                    )
+                    if seller is not None and products:
+                        taken = taken_skus(list(rows), seller)
+                        if taken:
+                            raise SkuTaken(taken)
+            except SkuTaken as error:
+                taken = error.skus
+                continue
+            break
+        # bulk_create sends no post_save, keep search and cache in sync here
+        get_search_backend().index(products)
+        product_ids = [product.pk for product in products]
+        transaction.on_commit(lambda: invalidate_products(product_ids))
+    return len(products)
+
+
+def import_products(file, seller=None, batch_size=BATCH_SIZE):
+    # Streams an uploaded CSV (a binary file object): rows are read, validated
+    # and upserted batch_size at a time, so memory stays flat however large
+    # the file is. Invalid rows are skipped and reported, valid ones are kept.
+    result = ImportResult()
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        read_batches(csv.DictReader(text), seller, batch_size, result)
+    finally:
+        # Leave the uploaded file open, it belongs to the caller
+        text.detach()
+    return result
+
+
+def read_batches(reader, seller, batch_size, result):
+    missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        result.add_error(1, f"missing columns: {', '.join(missing)}")
+        return
+
+    batch = []
+    try:
+        for row in reader:
+            result.rows += 1
+            try:
+                batch.append((reader.line_num, parse_row(row)))
+            except ValidationError as error:
+                result.add_error(reader.line_num, '; '.join(error.messages))
+            if len(batch) >= batch_size:
+                result.upserted += upsert_batch(batch, seller, result)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as error:
+        result.add_error(reader.line_num, f"unreadable file: {error}")
+    if batch:
+        result.upserted += upsert_batch(batch, seller, result)
+
+
+class Echo:
+    # csv.writer target that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=2000):
+    # Yields the CSV lines of the queryset, chunk_size rows are fetched at a
+    # time through a server-side cursor where the database has one
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in queryset.order_by('pk').values_list(*CSV_COLUMNS).iterator(chunk_size=chunk_size):
+        yield writer.writerow(row)
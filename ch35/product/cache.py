@@ -0,0 +1,139 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from core import metrics
+from product.models import ORDERINGS, Product
+
+# Read-through cache of products, keyed like the user and permission caches:
+#   product:<id>:<product version>          the row's field values
+#   product_list:<list version>:<page>      ids and next cursor of a page
+# Saving or deleting a product bumps its version and the list version once
+# the transaction commits, the next read misses and refills from the
+# database. A reader that loaded a row just before the bump stores it under
+# the old version, which is never read again, so readers can't put back a
+# stale row. Bulk operations (bulk_create, QuerySet.update/delete) send no
+# signals, call invalidate_products() after them; anything missed is only
+# picked up when the entry expires (PRODUCT_CACHE_TIMEOUT).
+# The bumps only reach the workers reading the same cache: with a per-process
+# local memory cache the others serve the old row until it expires (system
+# check product.W001).
+LIST_VERSION_KEY = 'product_list:version'
+FIELDS = [field.attname for field in Product._meta.concrete_fields]
+
+
+def get_cache():
+    return caches[getattr(settings, 'PRODUCT_CACHE_ALIAS', 'default')]
+
+
+def cache_timeout():
+    return getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+
+
+def version_key(product_id):
+    return f'product:version:{product_id}'
+
+
+def new_version():
+    return time.time_ns()
+
+
+def get_versions(cache, keys):
+    # {version key: version}, a lost version starts from a fresh one (add()
+    # keeps whatever another process set first)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def to_values(product):
+    return tuple(getattr(product, field) for field in FIELDS)
+
+
+def from_values(values):
+    # Like a row fetched from the database, e.g. seller.stats sees the price
+    return Product.from_db('default', FIELDS, values)
+
+
+def get_products(ids):
+    # {id: Product} for the ids that exist, with one get_many() for the
+    # versions, one for the rows and one in_bulk() query for all misses
+    ids = list(dict.fromkeys(int(product_id) for product_id in ids))
+    if not ids:
+        return {}
+    cache = get_cache()
+    with metrics.timer('product_cache.lookup'):
+        versions = get_versions(cache, [version_key(product_id) for product_id in ids])
+        keys = {product_id: f'product:{product_id}:{versions[version_key(product_id)]}'
+                for product_id in ids}
+        cached = cache.get_many(list(keys.values()))
+        products = {product_id: from_values(cached[key])
+                    for product_id, key in keys.items() if key in cached}
+        missing = [product_id for product_id in ids if product_id not in products]
+        metrics.incr('product_cache.hit', len(products))
+        metrics.incr('product_cache.miss', len(missing))
+        if missing:
+            loaded = Product.objects.in_bulk(missing)
+            cache.set_many({keys[product_id]: to_values(product)
+                            for product_id, product in loaded.items()}, cache_timeout())
+            products.update(loaded)
+    return products
+
+
+def get_product(product_id):
+    return get_products([product_id]).get(int(product_id))
+
+
+def page_key(version, ordering, cursor, size):
+    # Cursors are long, hash them. ordering comes from the query string: only
+    # a known one goes into a key, anything else could be too long or hold
+    # characters memcached rejects.
+    if ordering not in ORDERINGS:
+        raise ValueError("Unknown ordering")
+    cursor_hash = hashlib.md5((cursor or '').encode(), usedforsecurity=False).hexdigest()
+    return f'product_list:{version}:{ordering}:{size}:{cursor_hash}'
+
+
+def get_page(ordering='newest', cursor=None, size=20):
+    # Cached Product.objects.page(): the page's ids come from the list
+    # cache, the products from get_products(). Raises ValueError like page().
+    cache = get_cache()
+    version = get_versions(cache, [LIST_VERSION_KEY])[LIST_VERSION_KEY]
+    key = page_key(version, ordering, cursor, size)
+    entry = cache.get(key)
+    if entry is None:
+        metrics.incr('product_list_cache.miss')
+        products, next_cursor = Product.objects.page(ordering, cursor, size)
+        # Only the ids: the rows are cached by get_products(), which reads
+        # their versions before the database
+        cache.set(key, ([product.pk for product in products], next_cursor), cache_timeout())
+        return products, next_cursor
+    metrics.incr('product_list_cache.hit')
+    ids, next_cursor = entry
+    products = get_products(ids)
+    # A product deleted since is skipped, its bump also expires the page
+    return [products[product_id] for product_id in ids if product_id in products], next_cursor
+
+
+def invalidate_products(product_ids):
+    cache = get_cache()
+    versions = {version_key(product_id): new_version() for product_id in product_ids}
+    versions[LIST_VERSION_KEY] = new_version()
+    cache.set_many(versions, None)
+
+
+def product_changed(sender, instance, **kwargs):
+    # After the commit: bumping earlier would let a reader refill the old row
+    product_id = instance.pk
+    transaction.on_commit(lambda: invalidate_products([product_id]))
+
+
+def connect_signals():
+    post_save.connect(product_changed, sender=Product, dispatch_uid='product_cache_saved')
+    post_delete.connect(product_changed, sender=Product, dispatch_uid='product_cache_deleted')
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core import checks
+from core.checks import is_process_local
+
+
+def check_shared_caches(app_configs, **kwargs):
+    warnings = []
+    alias = getattr(settings, 'PRODUCT_CACHE_ALIAS', 'default')
+    if is_process_local(alias):
+        warnings.append(checks.Warning(
+            f"PRODUCT_CACHE_ALIAS '{alias}' is a per-process local memory cache.",
+            hint="A saved product is only invalidated in the worker process that saved "
+                 "it, the others serve the old row until PRODUCT_CACHE_TIMEOUT. Point it "
+                 "at a cache all processes share.",
+            id='product.W001',
+        ))
+    return warnings
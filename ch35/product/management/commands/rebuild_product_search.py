@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from product.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index from the products table"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.perf_counter()
+        with transaction.atomic():
+            count = backend.rebuild()
+        self.stdout.write(
+            f"{backend.name}: indexed {count:,} products in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:58
+
+from django.db import DatabaseError, migrations
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 index for product.search, only on SQLite builds that have FTS5.
+    # Other databases use the portable search backend and need nothing.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE product_search USING fts5("
+            "name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+    except DatabaseError:
+        return
+    schema_editor.execute(
+        "INSERT INTO product_search (rowid, name, description) "
+        "SELECT id, name, description FROM product_product"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:40
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Concat
+
+
+def fill_sku(apps, schema_editor):
+    # Existing products get "P<id>" so the column can be unique and required
+    Product = apps.get_model('product', 'Product')
+    Product.objects.filter(sku__isnull=True).update(
+        sku=Concat(models.Value('P'), Cast('id', models.CharField())))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_sku, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+    ]
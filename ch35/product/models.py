@@ -1,12 +1,140 @@
+from django.conf import settings
+from django.core import signing
 from django.db import models
 
+# Orderings the catalog can be browsed in, each ends with the primary key so
+# that rows with the same created_at/price have a stable position. Both are
+# served by a composite index in either direction.
+ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+CURSOR_SALT = 'product.cursor'
+# Model permissions a seller holds on the products they own only
+OWNER_ACTIONS = ('change', 'delete')
+
+
+class ProductQuerySet(models.QuerySet):
+    def page(self, ordering='newest', cursor=None, size=20):
+        # Keyset (seek) pagination: instead of OFFSET, which reads and throws
+        # away every row before the page, continue right after the last row
+        # of the previous page. Each page is one index range scan of size + 1
+        # rows, as cheap on page 10,000 as on page 1.
+        # Returns (products, cursor of the next page or None). Raises
+        # ValueError for an unknown ordering or a bad cursor.
+        if ordering not in ORDERINGS:
+            raise ValueError(f"Unknown ordering {ordering!r}")
+        order_by = ORDERINGS[ordering]
+        queryset = self.order_by(*order_by)
+        if cursor:
+            queryset = queryset.filter(self.after(ordering, cursor))
+        products = list(queryset[:size + 1])
+        if len(products) <= size:
+            return products, None
+        products = products[:size]
+        return products, self.make_cursor(ordering, products[-1])
+
+    def owned_by(self, user):
+        return self.filter(seller_id=user.pk)
+
+    @staticmethod
+    def permission_filter(user, action):
+        # Q of the products user may <action>: all of them for a superuser,
+        # the ones they own with the model permission, None for no product.
+        # has_perm() without an object is answered from the permission
+        # cache, the ownership check runs in SQL.
+        if not user.is_active:
+            return None
+        if user.is_superuser:
+            return models.Q()
+        if not user.has_perm(f'product.{action}_product'):
+            return None
+        return models.Q(seller_id=user.pk)
+
+    def permitted(self, user, action='change'):
+        condition = self.permission_filter(user, action)
+        return self.none() if condition is None else self.filter(condition)
+
+    def with_permissions(self, user, actions=OWNER_ACTIONS):
+        # Annotates can_<action> on every row instead of a has_perm() call
+        # per product
+        annotations = {}
+        for action in actions:
+            condition = self.permission_filter(user, action)
+            if condition is None or not condition:
+                annotations[f'can_{action}'] = models.Value(condition is not None)
+            else:
+                annotations[f'can_{action}'] = models.ExpressionWrapper(
+                    condition, output_field=models.BooleanField())
+        return self.annotate(**annotations)
+
+    @staticmethod
+    def make_cursor(ordering, product):
+        column = ORDERINGS[ordering][0].lstrip('-')
+        value = getattr(product, column)
+        value = value.isoformat() if column == 'created_at' else str(value)
+        # Signed, so a client can't hand us arbitrary filter values
+        return signing.dumps([ordering, value, product.pk], salt=CURSOR_SALT)
+
+    @staticmethod
+    def after(ordering, cursor):
+        # (column, id) > (value, pk) written so the database can start the
+        # index range at column >= value
+        try:
+            cursor_ordering, value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        if cursor_ordering != ordering:
+            raise ValueError("The cursor belongs to another ordering")
+        column, _ = ORDERINGS[ordering]
+        if column.startswith('-'):
+            column = column[1:]
+            return (models.Q(**{f'{column}__lte': value})
+                    & (models.Q(**{f'{column}__lt': value}) | models.Q(id__lt=pk)))
+        return (models.Q(**{f'{column}__gte': value})
+                & (models.Q(**{f'{column}__gt': value}) | models.Q(id__gt=pk)))
+
+
 # Create your models here.
 class Product(models.Model):
+    # Stock keeping unit, the natural key bulk imports upsert by
+    sku = models.CharField(max_length=64, unique=True)
+    # Products without a seller belong to the shop itself. No single column
+    # index, product_seller_created_at_idx starts with seller.
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                               on_delete=models.SET_NULL, related_name='products',
+                               db_index=False)
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_at_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            # A seller's products newest first, paginated like the catalog
+            models.Index(fields=['seller', 'created_at', 'id'],
+                         name='product_seller_created_at_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The price as stored, seller.stats adjusts its totals by the
+        # difference on save instead of aggregating again
+        instance._loaded_price = instance.__dict__.get('price')
+        instance._loaded_seller_id = instance.__dict__.get('seller_id')
+        return instance
+
+    def is_owned_by(self, user):
+        # Object-level permission checks (EmailBackend.has_perm) read this
+        return self.seller_id is not None and self.seller_id == user.pk
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
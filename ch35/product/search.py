@@ -0,0 +1,182 @@
+import functools
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from product.models import Product
+
+# Search results are Product instances with three extra attributes:
+#   rank            lower is better
+#   name_highlight  escaped name with the matched terms in <mark>
+#   snippet         escaped part of the description around the first match
+FTS_TABLE = 'product_search'
+# Markers that can't appear in product text, swapped for <mark> after escaping
+MARK_START, MARK_END = '\x02', '\x03'
+TERM_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+
+
+def search_terms(query):
+    return TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def markup(text):
+    # Escape product text, then turn the markers into <mark> tags
+    return mark_safe(escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def highlight(products, terms, prefix=False):
+    # Sets name_highlight and snippet on the products of one result page.
+    # prefix: terms match at the start of words, like the FTS5 query,
+    # otherwise anywhere like icontains.
+    words = '|'.join(re.escape(term) for term in terms)
+    pattern = re.compile(rf'\b(?:{words})\w*' if prefix else words, re.I)
+    for product in products:
+        product.name_highlight = markup(mark(pattern, product.name))
+        product.snippet = markup(mark(pattern, excerpt(pattern, product.description)))
+    return products
+
+
+def mark(pattern, text):
+    return pattern.sub(lambda match: f'{MARK_START}{match.group()}{MARK_END}', text)
+
+
+def excerpt(pattern, text, length=120):
+    # About length characters of text around the first match
+    match = pattern.search(text)
+    start = max(0, match.start() - length // 2) if match else 0
+    if start:
+        # Don't cut a word in half
+        start = text.find(' ', start) + 1 or start
+    end = start + length
+    return ('…' if start else '') + text[start:end] + ('…' if end < len(text) else '')
+
+
+class FTS5SearchBackend:
+    # SQLite FTS5 index over name and description (created by migration
+    # 0003), kept in sync by the post_save/post_delete hooks below and
+    # rebuilt in bulk with rebuild_product_search. The rowid is the product
+    # id. Prefixes of 2 and 3 characters are precomputed in the index, longer
+    # prefixes are range scans on the term b-tree.
+    name = 'fts5'
+
+    def match_expression(self, terms):
+        # Every term must match, the last one as a prefix ("search as you type")
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' AND '.join(quoted)
+
+    def search(self, query, limit=20):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # bm25() weights a hit in the name ten times a hit in the description.
+        # Only the rowids are ranked in the index, product rows are joined for
+        # the returned page alone. Highlighting is done in Python for the same
+        # reason: FTS5's highlight()/snippet() would run for every match.
+        products = Product.objects.raw(
+            f'''SELECT product_product.*, ranked.rank
+                FROM (
+                    SELECT rowid, bm25({FTS_TABLE}, 10.0, 1.0) AS rank
+                    FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+                    ORDER BY rank LIMIT %s
+                ) AS ranked
+                JOIN product_product ON product_product.id = ranked.rowid
+                ORDER BY ranked.rank''',
+            [self.match_expression(terms), limit],
+        )
+        return highlight(list(products), terms, prefix=True)
+
+    def index(self, products):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+                [(product.pk, product.name, product.description) for product in products],
+            )
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                               [(product_id,) for product_id in product_ids])
+
+    def rebuild(self):
+        # One INSERT ... SELECT, then merge the index b-trees
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+                f'SELECT id, name, description FROM product_product')
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+
+class PortableSearchBackend:
+    # Works on every database, but icontains can't use an index: every
+    # search scans the products table. Names matching all terms rank first.
+    name = 'portable'
+
+    def search(self, query, limit=20):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        matches = Q()
+        for term in terms:
+            matches &= Q(name__icontains=term) | Q(description__icontains=term)
+        in_name = Q()
+        for term in terms:
+            in_name &= Q(name__icontains=term)
+        results = list(
+            Product.objects.filter(matches)
+            .alias(in_name=Q(in_name))
+            .order_by('-in_name', '-id')[:limit]
+        )
+        for rank, product in enumerate(results):
+            product.rank = rank
+        return highlight(results, terms)
+
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self):
+        return Product.objects.count()
+
+
+def fts5_index_exists():
+    # The migration only creates the table on SQLite builds with FTS5
+    return (connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names())
+
+
+@functools.cache
+def get_search_backend():
+    # PRODUCT_SEARCH_BACKEND: 'auto' (FTS5 on SQLite when available), 'fts5'
+    # or 'portable'
+    choice = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if choice == 'fts5' or (choice == 'auto' and fts5_index_exists()):
+        return FTS5SearchBackend()
+    return PortableSearchBackend()
+
+
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index([instance])
+
+
+def product_deleted(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+def connect_signals():
+    # Keeps the index in sync with single saves and deletes. Bulk operations
+    # (bulk_create, QuerySet.update/delete) send no signals, run
+    # rebuild_product_search after them.
+    post_save.connect(product_saved, sender=Product, dispatch_uid='product_search_saved')
+    post_delete.connect(product_deleted, sender=Product, dispatch_uid='product_search_deleted')
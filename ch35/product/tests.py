@@ -1,3 +1,240 @@
-from django.test import TestCase
+import io
+import random
+import threading
+import time
+import warnings
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import CacheKeyWarning, caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from account.models import User
+from product import bulk, cache
+from product.models import ORDERINGS, Product
+
+
+class SharedCacheMixin:
+    def setUp(self):
+        # Ids start over with every test, so must the cached rows
+        caches['shared'].clear()
+
+    def create_products(self, count):
+        Product.objects.bulk_create(
+            Product(sku=f'P-{number}', name='v0', description='', price=Decimal(0))
+            for number in range(count))
+        return list(Product.objects.values_list('pk', flat=True))
+
+
+class ProductCacheTests(SharedCacheMixin, TestCase):
+    def test_save_invalidates_the_product_and_the_pages(self):
+        product_id, = self.create_products(1)
+        self.assertEqual(cache.get_product(product_id).name, 'v0')
+        self.assertEqual([product.name for product in cache.get_page('newest')[0]], ['v0'])
+        product = Product.objects.get(pk=product_id)
+        product.name = 'v1'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(cache.get_product(product_id).name, 'v1')
+        self.assertEqual([product.name for product in cache.get_page('newest')[0]], ['v1'])
+
+    def test_reader_loading_before_a_write_never_stores_a_stale_row(self):
+        product_id, = self.create_products(1)
+        in_bulk = Product.objects.in_bulk
+
+        def load_then_write(ids):
+            # The reader got the old row, a writer commits before it stores it
+            rows = in_bulk(ids)
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.filter(pk=product_id).update(name='v1')
+                cache.product_changed(Product, Product(pk=product_id))
+            return rows
+
+        with mock.patch.object(Product.objects, 'in_bulk', side_effect=load_then_write):
+            self.assertEqual(cache.get_product(product_id).name, 'v0')
+        self.assertEqual(cache.get_product(product_id).name, 'v1')
+
+    def test_unknown_ordering_never_becomes_a_key(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            with self.assertRaises(ValueError):
+                cache.get_page('<img src=x onerror=alert(1)> ' * 20)
+            with self.assertRaises(ValueError):
+                cache.page_key(1, 'price; drop', None, 20)
+
+
+class ConcurrentProductCacheTests(SharedCacheMixin, TransactionTestCase):
+    # Writers saving products while readers go through the cache: once a
+    # save has committed no reader that starts later may see an older row.
+    # The price of a product is the number of times it was saved.
+    writers, readers, seconds = 2, 4, 1.0
+
+    def test_writers_against_readers(self):
+        product_ids = self.create_products(40)
+        committed = dict.fromkeys(product_ids, 0)
+        stale, errors = [], []
+        lock, stop = threading.Lock(), threading.Event()
+        # The in-memory test database fails concurrent queries instead of
+        # waiting, so database work takes turns: a writer's save with its
+        # invalidation, a reader's load on a miss. The cache reads and writes
+        # around them still interleave freely.
+        database_lock = threading.Lock()
+        in_bulk, page = Product.objects.in_bulk, Product.objects.page
+
+        def locked(method):
+            def call(*args, **kwargs):
+                with database_lock:
+                    return method(*args, **kwargs)
+            return call
+
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        def writer(owned):
+            rng = random.Random()
+            while not stop.is_set():
+                with database_lock:
+                    product = Product.objects.get(pk=rng.choice(owned))
+                    product.price += 1
+                    product.save()
+                with lock:
+                    committed[product.pk] = int(product.price)
+
+        def reader(number):
+            rng = random.Random(number)
+            while not stop.is_set():
+                sample = rng.sample(product_ids, 10)
+                with lock:
+                    floors = {product_id: committed[product_id] for product_id in sample}
+                if number % 2:
+                    products = {product.pk: product
+                                for product in cache.get_page(rng.choice(list(ORDERINGS)), None, 50)[0]}
+                else:
+                    products = cache.get_products(sample)
+                for product_id, floor in floors.items():
+                    if product_id in products and int(products[product_id].price) < floor:
+                        stale.append((product_id, int(products[product_id].price), floor))
+
+        threads = [threading.Thread(target=run, args=(writer, product_ids[number::self.writers]))
+                   for number in range(self.writers)]
+        threads += [threading.Thread(target=run, args=(reader, number))
+                    for number in range(self.readers)]
+        with mock.patch.object(Product.objects, 'in_bulk', locked(in_bulk)), \
+                mock.patch.object(Product.objects, 'page', locked(page)):
+            for thread in threads:
+                thread.start()
+            time.sleep(self.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(stale, [])
+        self.assertGreater(sum(committed.values()), 0)
+        stored = dict(Product.objects.values_list('pk', 'price'))
+        cached = {product_id: product.price
+                  for product_id, product in cache.get_products(product_ids).items()}
+        self.assertEqual(cached, stored)
+
+
+class BadRequestTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        user = User.objects.create_user(email='c@example.com')
+        User.objects.filter(pk=user.pk).update(is_active=True)
+        self.client.force_login(user)
+
+    def assertRejected(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        for value in params.values():
+            self.assertNotIn(value, response.content.decode())
+
+    def test_product_list_does_not_echo_parameters(self):
+        url = reverse('product:product_list')
+        self.assertRejected(url, {'ordering': '<img src=x onerror=alert(1)>'})
+        self.assertRejected(url, {'size': '<script>alert(1)</script>'})
+        self.assertRejected(url, {'cursor': '<script>alert(1)</script>'})
+
+    def test_product_search_does_not_echo_parameters(self):
+        self.assertRejected(reverse('product:product_search'),
+                            {'q': 'lamp', 'limit': '<script>alert(1)</script>'})
+
+
+class BulkImportTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(email='s@example.com')
+        self.other = User.objects.create_user(email='o@example.com')
+
+    def import_csv(self, *lines, seller=None):
+        content = '\n'.join(('sku,name,description,price',) + lines) + '\n'
+        return bulk.import_products(io.BytesIO(content.encode()), seller or self.seller)
+
+    def test_create_then_update(self):
+        result = self.import_csv('A,Lamp,Bright,10.00', 'B,Desk,Oak,99.50')
+        self.assertEqual((result.rows, result.upserted, result.errors), (2, 2, []))
+        created = {product.sku: product for product in Product.objects.all()}
+        self.assertEqual(created['A'].seller, self.seller)
+        self.assertEqual(created['B'].price, Decimal('99.50'))
+
+        result = self.import_csv('A,Lamp,Brighter,12.00', 'C,Chair,Pine,5')
+        self.assertEqual(result.upserted, 2)
+        self.assertEqual(Product.objects.count(), 3)
+        lamp = Product.objects.get(sku='A')
+        self.assertEqual((lamp.pk, lamp.description, lamp.price),
+                         (created['A'].pk, 'Brighter', Decimal('12.00')))
+        self.assertEqual(lamp.created_at, created['A'].created_at)
+
+    def test_skus_of_other_sellers_are_rejected(self):
+        self.import_csv('A,Theirs,Old,1', seller=self.other)
+        result = self.import_csv('A,Mine,New,2', 'B,Desk,Oak,3')
+        self.assertEqual(result.upserted, 1)
+        self.assertEqual(result.errors, [(2, 'sku A belongs to another seller')])
+        theirs = Product.objects.get(sku='A')
+        self.assertEqual((theirs.seller, theirs.name), (self.other, 'Theirs'))
+        self.assertEqual(Product.objects.get(sku='B').seller, self.seller)
+
+    def test_sku_taken_between_check_and_write(self):
+        # The other seller's product appears after the first check, as with
+        # a concurrent import: the write is redone without it
+        self.import_csv('A,Theirs,Old,1', seller=self.other)
+        taken_skus = bulk.taken_skus
+        calls = []
+
+        def check_too_early(skus, seller):
+            calls.append(skus)
+            return [] if len(calls) == 1 else taken_skus(skus, seller)
+
+        with mock.patch.object(bulk, 'taken_skus', check_too_early):
+            result = self.import_csv('A,Mine,New,2', 'B,Desk,Oak,3')
+        self.assertEqual(result.upserted, 1)
+        self.assertEqual(result.errors, [(2, 'sku A belongs to another seller')])
+        self.assertEqual(Product.objects.get(sku='A').name, 'Theirs')
+        self.assertEqual(Product.objects.get(sku='B').seller, self.seller)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        result = self.import_csv('A,Lamp,Bright,ten', 'B,,Oak,1', 'C,Chair,Pine,1')
+        self.assertEqual((result.rows, result.upserted, result.error_count), (3, 1, 2))
+        self.assertEqual([line for line, message in result.errors], [2, 3])
+        self.assertTrue(result.errors[0][1].startswith('price:'))
+        self.assertTrue(result.errors[1][1].startswith('name:'))
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['C'])
+
+        result = bulk.import_products(io.BytesIO(b'sku,name\nA,Lamp\n'), self.seller)
+        self.assertEqual(result.errors, [(1, 'missing columns: description, price')])
+
+    def test_export_round_trips(self):
+        self.import_csv('A,Lamp,"Bright, warm",10.00', 'B,Desk,Oak,99.50')
+        self.import_csv('C,Theirs,Old,1', seller=self.other)
+        lines = list(bulk.export_rows(Product.objects.owned_by(self.seller)))
+        self.assertEqual(lines, ['sku,name,description,price\r\n',
+                                 'A,Lamp,"Bright, warm",10.00\r\n',
+                                 'B,Desk,Oak,99.50\r\n'])
@@ -0,0 +1,9 @@
+from django.urls import path
+from product.views import product_list_view, product_detail_view, product_search_view
+app_name = 'product'
+
+urlpatterns = [
+    path('', product_list_view, name='product_list'),
+    path('<int:pk>/', product_detail_view, name='product_detail'),
+    path('search/', product_search_view, name='product_search'),
+]
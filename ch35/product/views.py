@@ -1,3 +1,90 @@
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
+from core.decorators import wants_json
+from product import cache
+from product.models import ORDERINGS
+from product.search import get_search_backend
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def product_to_dict(product):
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'description': product.description,
+        'price': str(product.price),
+        'created_at': product.created_at.isoformat(),
+    }
+
+
+def bad_request(message):
+    # A fixed message as plain text: the rejected value is never echoed back,
+    # so a crafted link can't inject markup into the page
+    return HttpResponseBadRequest(message, content_type='text/plain; charset=utf-8')
+
 
 # Create your views here.
+@login_required
+def product_list_view(request):
+    # /products/?ordering=newest|oldest|price|-price&cursor=...&size=20
+    # Add format=json (or Accept: application/json) for the API response.
+    ordering = request.GET.get('ordering', 'newest')
+    if ordering not in ORDERINGS:
+        return bad_request(f"ordering must be one of {', '.join(ORDERINGS)}.")
+    try:
+        size = min(max(int(request.GET.get('size', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return bad_request("size must be a whole number.")
+    try:
+        # Served from the product cache, no query for a warm page
+        products, next_cursor = cache.get_page(ordering, request.GET.get('cursor'), size)
+    except ValueError:
+        return bad_request("Invalid cursor.")
+
+    if wants_json(request):
+        return JsonResponse({
+            'results': [product_to_dict(product) for product in products],
+            'next_cursor': next_cursor,
+        })
+    return render(request, 'product/product_list.html', {
+        'products': products,
+        'next_cursor': next_cursor,
+        'ordering': ordering,
+        'orderings': ORDERINGS,
+        'size': size,
+    })
+
+
+@login_required
+def product_detail_view(request, pk):
+    product = cache.get_product(pk)
+    if product is None:
+        raise Http404("No such product")
+    if wants_json(request):
+        return JsonResponse(product_to_dict(product))
+    return render(request, 'product/product_detail.html', {'product': product})
+
+
+@login_required
+def product_search_view(request):
+    # /products/search/?q=...&limit=20, format=json as for the listing
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return bad_request("limit must be a whole number.")
+    results = get_search_backend().search(query, limit) if query else []
+
+    if wants_json(request):
+        return JsonResponse({
+            'results': [dict(product_to_dict(product),
+                             name_highlight=product.name_highlight,
+                             snippet=product.snippet) for product in results],
+        })
+    return render(request, 'product/product_search.html', {
+        'query': query,
+        'results': results,
+    })
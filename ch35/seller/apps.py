@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class SellerConfig(AppConfig):
     name = 'seller'
+
+    def ready(self):
+        from seller.stats import connect_signals
+        connect_signals()
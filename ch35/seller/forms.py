@@ -0,0 +1,7 @@
+from django import forms
+from product.models import Product
+
+class ProductForm(forms.ModelForm):
+    class Meta:
+        model = Product
+        fields = ["name", "description", "price"]
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+from seller.stats import catalog_stats, reconcile_all
+
+
+class Command(BaseCommand):
+    help = ("Recompute the seller dashboard statistics from the products table. "
+            "Run it periodically (e.g. hourly from cron) to repair drift from bulk "
+            "operations that bypass the save/delete signals.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        for stats in reconcile_all():
+            self.stdout.write(f"{stats.key}: {stats.product_count:,} products")
+        self.stdout.write(f"catalog: {catalog_stats().product_count:,} products")
+        self.stdout.write(f"reconciled in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('price_min', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('price_max', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('recent', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reconciled_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def remove_catalog_row(apps, schema_editor):
+    # The catalog totals are summed over the seller rows now. The shop row
+    # is created by the next save of a shop product or reconcile_seller_stats.
+    SellerStats = apps.get_model('seller', 'SellerStats')
+    SellerStats.objects.filter(key='catalog').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seller', '0001_seller_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_catalog_row, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,28 @@
 from django.db import models
 
 # Create your models here.
+class SellerStats(models.Model):
+    # Dashboard numbers kept up to date incrementally by seller.stats from
+    # Product save/delete signals, so the dashboard reads one row instead of
+    # aggregating the products table. reconcile_seller_stats recomputes them.
+    # One row per seller ('seller:<id>') and one for the shop's own products.
+    SHOP = 'shop'
+
+    key = models.CharField(max_length=64, unique=True)
+    product_count = models.PositiveIntegerField(default=0)
+    price_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    price_min = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    price_max = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    # Most recently updated products, newest first: [{id, name, price, updated_at}]
+    recent = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+    reconciled_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return self.key
+
+    @property
+    def price_avg(self):
+        if not self.product_count:
+            return None
+        return round(self.price_total / self.product_count, 2)
@@ -0,0 +1,172 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from product.models import Product
+from seller.models import SellerStats
+
+RECENT_ITEMS = 5
+
+
+def seller_key(seller_id):
+    return f'seller:{seller_id}'
+
+
+def stats_keys(seller_id):
+    # The row a product of seller_id counts towards, one per product: a row
+    # every product write had to lock would put all of them in a queue.
+    # Shop products (no seller) have one of their own.
+    if seller_id is None:
+        return [SellerStats.SHOP]
+    return [seller_key(seller_id)]
+
+
+def dashboard_stats(user):
+    # The one row the dashboard of a seller reads
+    key = seller_key(user.pk)
+    return SellerStats.objects.filter(key=key).first() or SellerStats(key=key)
+
+
+def catalog_stats():
+    # Totals of the whole catalog, summed over the rows when asked for
+    # rather than kept in a row of their own. Without recent items.
+    totals = SellerStats.objects.aggregate(
+        count=Sum('product_count'), total=Sum('price_total'),
+        low=Min('price_min'), high=Max('price_max'))
+    return SellerStats(key='catalog', product_count=totals['count'] or 0,
+                       price_total=totals['total'] or 0,
+                       price_min=totals['low'], price_max=totals['high'])
+
+
+def products_for(key):
+    if key == SellerStats.SHOP:
+        return Product.objects.filter(seller__isnull=True)
+    return Product.objects.filter(seller_id=int(key.removeprefix('seller:')))
+
+
+def lock_stats(key):
+    # The stats row, locked until the end of the transaction so concurrent
+    # product saves apply their changes one after another
+    try:
+        with transaction.atomic():
+            stats, _ = SellerStats.objects.select_for_update().get_or_create(key=key)
+    except IntegrityError:
+        # Created concurrently
+        stats = SellerStats.objects.select_for_update().get(key=key)
+    return stats
+
+
+def recent_entry(product):
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'price': str(product.price),
+        'updated_at': product.updated_at.isoformat(),
+    }
+
+
+def refresh_extremes(stats, products):
+    # Only when the old min or max went away. products is one seller's (or
+    # the shop's): read through product_seller_created_at_idx and sorted,
+    # the cost grows with the products of that row, never with the catalog.
+    stats.price_min = products.order_by('price').values_list('price', flat=True).first()
+    stats.price_max = products.order_by('-price').values_list('price', flat=True).first()
+
+
+def apply_change(key, old_price=None, product=None, deleted=False):
+    # old_price: the stored price before this save/delete, None for a new product
+    with transaction.atomic():
+        stats = lock_stats(key)
+        if old_price is not None and not stats.product_count:
+            # Drifted after a bulk operation, the row can't be adjusted
+            reconcile(key)
+            return
+        extremes_stale = False
+        if old_price is not None:
+            stats.product_count -= 1
+            stats.price_total -= old_price
+            extremes_stale = old_price in (stats.price_min, stats.price_max)
+        stats.recent = [entry for entry in stats.recent if entry['id'] != product.pk]
+        if not deleted:
+            stats.product_count += 1
+            stats.price_total += product.price
+            if stats.price_min is None or product.price < stats.price_min:
+                stats.price_min = product.price
+            if stats.price_max is None or product.price > stats.price_max:
+                stats.price_max = product.price
+            extremes_stale = extremes_stale and product.price != old_price
+            stats.recent = [recent_entry(product)] + stats.recent[:RECENT_ITEMS - 1]
+        if extremes_stale:
+            # The old min or max went away, only now is a lookup needed
+            refresh_extremes(stats, products_for(key))
+        # After a delete, recent may hold fewer items until the next reconcile
+        stats.save()
+
+
+def reconcile(key):
+    # Recompute one row from the products table, for drift after bulk
+    # operations that send no signals (bulk_create, QuerySet.update/delete)
+    products = products_for(key)
+    with transaction.atomic():
+        stats = lock_stats(key)
+        totals = products.aggregate(
+            count=Count('pk'), total=Sum('price'), low=Min('price'), high=Max('price'))
+        stats.product_count = totals['count']
+        stats.price_total = totals['total'] or 0
+        stats.price_min, stats.price_max = totals['low'], totals['high']
+        stats.recent = [recent_entry(product)
+                        for product in products.order_by('-updated_at', '-pk')[:RECENT_ITEMS]]
+        stats.reconciled_at = timezone.now()
+        stats.save()
+    return stats
+
+
+def reconcile_seller(seller_id):
+    return [reconcile(key) for key in stats_keys(seller_id)]
+
+
+def reconcile_all():
+    # Every existing row and one per seller with products
+    keys = {SellerStats.SHOP}
+    keys.update(SellerStats.objects.values_list('key', flat=True))
+    keys.update(seller_key(seller_id) for seller_id in Product.objects.filter(
+        seller__isnull=False).values_list('seller_id', flat=True).distinct())
+    return [reconcile(key) for key in sorted(keys)]
+
+
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded_price = getattr(instance, '_loaded_price', None)
+    new_keys = stats_keys(instance.seller_id)
+    if created:
+        for key in new_keys:
+            apply_change(key, None, instance)
+    elif loaded_price is None:
+        # Saved without being loaded first, the old price is unknown. A
+        # previous owner's row is left to the periodic reconcile.
+        for key in new_keys:
+            reconcile(key)
+    else:
+        old_keys = stats_keys(instance._loaded_seller_id)
+        for key in old_keys:
+            if key not in new_keys:
+                # Moved to another seller
+                apply_change(key, loaded_price, instance, deleted=True)
+        for key in new_keys:
+            apply_change(key, loaded_price if key in old_keys else None, instance)
+    instance._loaded_price = instance.price
+    instance._loaded_seller_id = instance.seller_id
+
+
+def product_deleted(sender, instance, **kwargs):
+    price = getattr(instance, '_loaded_price', None)
+    price = instance.price if price is None else price
+    seller_id = getattr(instance, '_loaded_seller_id', instance.seller_id)
+    for key in stats_keys(seller_id):
+        apply_change(key, price, instance, deleted=True)
+
+
+def connect_signals():
+    post_save.connect(product_saved, sender=Product, dispatch_uid='seller_stats_saved')
+    post_delete.connect(product_deleted, sender=Product, dispatch_uid='seller_stats_deleted')
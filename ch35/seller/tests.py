@@ -1,3 +1,119 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import caches
 from django.test import TestCase
+from django.urls import reverse
+from account.models import User
+from core.utils import assign_permission
+from product.models import Product
+from seller import stats as seller_stats
+from seller.models import SellerStats
+
+
+class ProductListTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        seller = User.objects.create_user(email='s@example.com')
+        User.objects.filter(pk=seller.pk).update(is_active=True, is_seller=True)
+        assign_permission(seller, 'seller')
+        self.client.force_login(seller)
+
+    def test_bad_parameters_are_not_echoed(self):
+        url = reverse('seller:product_list')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        for params in ({'size': '<script>alert(1)</script>'},
+                       {'cursor': '<img src=x onerror=alert(1)>'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(response['Content-Type'].startswith('text/plain'))
+            self.assertNotIn(next(iter(params.values())), response.content.decode())
+
+
+class SellerStatsTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(email='s@example.com')
+        self.other = User.objects.create_user(email='o@example.com')
+
+    def create(self, sku, price, seller=None):
+        return Product.objects.create(sku=sku, name=sku, description='', price=Decimal(price),
+                                      seller=seller or self.seller)
+
+    def stats(self, user=None):
+        stats = seller_stats.dashboard_stats(user or self.seller)
+        return (stats.product_count, stats.price_total, stats.price_min, stats.price_max,
+                [entry['id'] for entry in stats.recent])
+
+    def test_create_update_delete(self):
+        lamp = self.create('A', '10.00')
+        desk = self.create('B', '30.00')
+        self.assertEqual(self.stats(), (2, Decimal('40.00'), Decimal('10.00'),
+                                        Decimal('30.00'), [desk.pk, lamp.pk]))
+        lamp = Product.objects.get(pk=lamp.pk)
+        lamp.price = Decimal('15.00')
+        lamp.save()
+        self.assertEqual(self.stats(), (2, Decimal('45.00'), Decimal('15.00'),
+                                        Decimal('30.00'), [lamp.pk, desk.pk]))
+        desk.delete()
+        self.assertEqual(self.stats(), (1, Decimal('15.00'), Decimal('15.00'),
+                                        Decimal('15.00'), [lamp.pk]))
+
+    def test_move_between_sellers(self):
+        lamp = self.create('A', '10.00')
+        self.create('B', '20.00', seller=self.other)
+        lamp = Product.objects.get(pk=lamp.pk)
+        lamp.seller = self.other
+        lamp.save()
+        self.assertEqual(self.stats(), (0, Decimal('0.00'), None, None, []))
+        self.assertEqual(self.stats(self.other)[:4],
+                         (2, Decimal('30.00'), Decimal('10.00'), Decimal('20.00')))
+
+    def test_extremes_are_recomputed_when_they_go_away(self):
+        self.create('A', '10.00')
+        cheapest = self.create('B', '5.00')
+        priciest = self.create('C', '50.00')
+        cheapest.delete()
+        self.assertEqual(self.stats()[2:4], (Decimal('10.00'), Decimal('50.00')))
+        priciest = Product.objects.get(pk=priciest.pk)
+        priciest.price = Decimal('1.00')
+        priciest.save()
+        self.assertEqual(self.stats()[2:4], (Decimal('1.00'), Decimal('10.00')))
+
+    def test_products_count_towards_their_own_row_only(self):
+        self.create('A', '10.00')
+        self.create('B', '20.00', seller=self.other)
+        Product.objects.create(sku='C', name='C', description='', price=Decimal('5.00'))
+        self.assertEqual(dict(SellerStats.objects.values_list('key', 'product_count')),
+                         {f'seller:{self.seller.pk}': 1, f'seller:{self.other.pk}': 1,
+                          SellerStats.SHOP: 1})
+        catalog = seller_stats.catalog_stats()
+        self.assertEqual((catalog.product_count, catalog.price_total, catalog.price_min,
+                          catalog.price_max),
+                         (3, Decimal('35.00'), Decimal('5.00'), Decimal('20.00')))
+
+    def test_reconcile_repairs_drift(self):
+        self.create('A', '10.00')
+        Product.objects.update(price=Decimal('12.00'))
+        seller_stats.reconcile_seller(self.seller.pk)
+        self.assertEqual(self.stats()[:4], (1, Decimal('12.00'), Decimal('12.00'),
+                                            Decimal('12.00')))
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        seller = User.objects.create_user(email='s@example.com')
+        User.objects.filter(pk=seller.pk).update(is_active=True, is_seller=True)
+        assign_permission(seller, 'seller')
+        self.client.force_login(seller)
+        Product.objects.create(sku='A', name='Lamp', description='', price=Decimal('10.00'),
+                               seller=seller)
 
-# Create your tests here.
+    def test_stats_are_read_once_per_request(self):
+        for _ in range(2):
+            # A miss renders the skeleton, then a hit
+            with mock.patch('seller.views.dashboard_stats',
+                            wraps=seller_stats.dashboard_stats) as dashboard_stats:
+                response = self.client.get(reverse('seller:seller_dashboard'))
+            self.assertEqual(dashboard_stats.call_count, 1)
+            self.assertContains(response, 'Products: 1')
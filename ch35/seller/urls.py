@@ -1,6 +1,11 @@
 from django.urls import path
-from seller.views import seller_dashboard_view
+from seller.views import (seller_dashboard_view, product_import_view, product_export_view,
+                          product_list_view, product_edit_view)
 app_name = 'seller'
 urlpatterns = [
-    path('dashboard', seller_dashboard_view, name='seller_dashboard')
+    path('dashboard', seller_dashboard_view, name='seller_dashboard'),
+    path('products/', product_list_view, name='product_list'),
+    path('products/<int:pk>/edit/', product_edit_view, name='product_edit'),
+    path('products/import/', product_import_view, name='product_import'),
+    path('products/export.csv', product_export_view, name='product_export'),
 ]
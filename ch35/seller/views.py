@@ -1,8 +1,92 @@
-from django.shortcuts import render
+from django.contrib import messages
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
 from core.decorators import login_and_role_required
+from core.page_cache import cache_page_per_role
+from product.bulk import export_rows, import_products
+from product.models import Product
+from product.views import MAX_PAGE_SIZE, PAGE_SIZE, bad_request
+from seller.forms import ProductForm
+from seller.stats import dashboard_stats, reconcile_seller
 
 # Create your views here.
+def dashboard_fragments(request):
+    # One indexed row read, however large the catalog
+    return {'stats': dashboard_stats(request.user)}
+
+
 @login_and_role_required('seller')
+@cache_page_per_role(fragment_context=dashboard_fragments)
 def seller_dashboard_view(request):
-    return render(request,'seller/dashboard.html')
\ No newline at end of file
+    # The stats are a user fragment, filled in from dashboard_fragments()
+    # by cache_page_per_role
+    return render(request,'seller/dashboard.html')
+
+
+@login_and_role_required('seller', 'product.add_product')
+def product_import_view(request):
+    # Upsert products by sku from an uploaded CSV (sku,name,description,price)
+    if request.method == "POST":
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.error(request, "Choose a CSV file to import.")
+            return redirect('seller:product_import')
+        result = import_products(upload, seller=request.user)
+        if result.upserted:
+            # The bulk upserts sent no signals
+            reconcile_seller(request.user.pk)
+        messages.success(
+            request, f"Imported {result.upserted} of {result.rows} rows.")
+        for line, error in result.errors:
+            messages.error(request, f"Line {line}: {error}")
+        if result.error_count > len(result.errors):
+            messages.error(
+                request, f"... and {result.error_count - len(result.errors)} more errors.")
+        return redirect('seller:product_import')
+    return render(request, 'seller/product_import.html')
+
+
+@login_and_role_required('seller', 'product.view_product')
+def product_export_view(request):
+    # The CSV is written while the rows are read, never held in memory
+    response = StreamingHttpResponse(
+        export_rows(Product.objects.owned_by(request.user)), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="products.csv"'
+    return response
+
+
+@login_and_role_required('seller', 'product.view_product')
+def product_list_view(request):
+    # The seller's own products, newest first. One keyset page on
+    # product_seller_created_at_idx with the object permissions annotated
+    # in the same query: the query count doesn't grow with the catalog.
+    try:
+        size = min(max(int(request.GET.get('size', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return bad_request("size must be a whole number.")
+    try:
+        products, next_cursor = (
+            Product.objects.owned_by(request.user)
+            .with_permissions(request.user)
+            .page('newest', request.GET.get('cursor'), size)
+        )
+    except ValueError:
+        return bad_request("Invalid cursor.")
+    return render(request, 'seller/product_list.html', {
+        'products': products,
+        'next_cursor': next_cursor,
+        'size': size,
+    })
+
+
+@login_and_role_required('seller', 'product.change_product')
+def product_edit_view(request, pk):
+    # Someone else's product is a 404, the ownership check is part of the lookup
+    product = get_object_or_404(Product.objects.permitted(request.user, 'change'), pk=pk)
+    form = ProductForm(request.POST or None, instance=product)
+    if request.method == "POST" and form.is_valid():
+        form.save()
+        messages.success(request, f"Saved {product.name}.")
+        return redirect('seller:product_list')
+    return render(request, 'seller/product_edit.html', {'form': form, 'product': product})
@@ -43,9 +43,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',#<---
+    'student.middleware.SingleFlightUpdateCacheMiddleware',#<---
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',#<---
+    'student.middleware.SingleFlightFetchFromCacheMiddleware',#<---
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -121,11 +121,16 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CACHE_MIDDLEWARE_SECONDS = 30
+# Single-flight: after the 30 seconds one request renders the page again,
+# the others get the stale copy meanwhile (up to 30 seconds more), or for
+# up to 5 minutes while rendering fails with a server error
+CACHE_MIDDLEWARE_STALE_WHILE_REVALIDATE = 30
+CACHE_MIDDLEWARE_STALE_IF_ERROR = 300
 
 # Database Caching
 # CACHES = {
 #     'default': {
-#         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+#         'BACKEND': 'student.cache_backends.LockingDatabaseCache',
 #         'LOCATION': 'student_cache',
 #     }
 # }
@@ -133,12 +138,23 @@ CACHE_MIDDLEWARE_SECONDS = 30
 # # File Based Caching
 # CACHES = {
 #     'default': {
-#         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#         'BACKEND': 'student.cache_backends.LockingFileBasedCache',
 #         'LOCATION': 'student_cache',
 #         # 'LOCATION': 'D:\django-backend-revision\ch38\student_cache',
 #     }
 # }
 
+# # Sharded File Based Caching: student_cache/ab/cd/<md5>.djcache files,
+# # written by atomic rename, read through mmap, culled by the expiry index
+# # in student_cache/index.sqlite3 instead of listing the directory
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'student.cache_backends.ShardedFileCache',
+#         'LOCATION': 'student_cache',
+#         'OPTIONS': {'MAX_ENTRIES': 100000},
+#     }
+# }
+
 # Local Memory Caching
 CACHES = {
     'default': {
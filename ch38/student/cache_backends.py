@@ -0,0 +1,449 @@
+import base64
+import glob
+import math
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.db import IntegrityError, connections, router, transaction
+from django.utils.timezone import now as tz_now
+
+# A missing value, None is a value that can be cached
+MISSING = object()
+
+
+# Locks
+#
+# cache.lock(key, timeout) of the backends below returns a lock shared by
+# every process using the cache, e.g. so only one request renders a page
+# that has just expired:
+#
+#   lock = get_lock(cache, 'page:/student/course/', timeout=10)
+#   if lock.acquire(blocking=False):
+#       try:
+#           ...
+#       finally:
+#           lock.release()
+#
+# A lock whose holder died is taken over once timeout seconds have passed
+# (file locks are released by the operating system right away).
+
+def get_lock(cache, key, timeout=10):
+    # The backend's own lock, or one made with cache.add() for the others
+    # (LocMemCache, Memcached, Redis, where add() is atomic)
+    if hasattr(cache, 'lock'):
+        return cache.lock(key, timeout)
+    return CacheLock(cache, key, timeout)
+
+
+class CacheLock:
+    poll_interval = 0.05
+
+    def __init__(self, cache, key, timeout=10):
+        self.cache = cache
+        self.key = f'lock:{key}'
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+        self.locked = False
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        deadline = None if blocking_timeout is None else time.monotonic() + blocking_timeout
+        while not self._acquire():
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(self.poll_interval)
+        self.locked = True
+        return True
+
+    def release(self):
+        if self.locked:
+            self.locked = False
+            self._release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def _acquire(self):
+        return self.cache.add(self.key, self.token, self.timeout)
+
+    def _release(self):
+        # Not atomic, but only deletes a lock that is still ours
+        if self.cache.get(self.key) == self.token:
+            self.cache.delete(self.key)
+
+
+class DatabaseLock(CacheLock):
+    # A row of the cache table. The INSERT fails while someone else's row
+    # is there, an expired one is taken over by an UPDATE that only matches
+    # while it is still expired, so of two processes only one gets it.
+
+    def __init__(self, cache, key, timeout=10):
+        super().__init__(cache, key, timeout)
+        self.cache_key = cache.make_and_validate_key(self.key)
+        # Stored like any other value, cache.get() of the key still works
+        self.value = base64.b64encode(pickle.dumps(self.token, cache.pickle_protocol)).decode('latin1')
+
+    def _execute(self, sql, params):
+        db = router.db_for_write(self.cache.cache_model_class)
+        connection = connections[db]
+        quote_name = connection.ops.quote_name
+        sql = sql.format(table=quote_name(self.cache._table), key=quote_name('cache_key'),
+                         value=quote_name('value'), expires=quote_name('expires'))
+        params = [connection.ops.adapt_datetimefield_value(param)
+                  if isinstance(param, datetime) else param for param in params]
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def _acquire(self):
+        now = tz_now().replace(microsecond=0)
+        tz = dt_timezone.utc if settings.USE_TZ else None
+        expires = datetime.fromtimestamp(time.time() + self.timeout, tz=tz).replace(microsecond=0)
+        try:
+            self._execute('INSERT INTO {table} ({key}, {value}, {expires}) VALUES (%s, %s, %s)',
+                          [self.cache_key, self.value, expires])
+            return True
+        except IntegrityError:
+            pass
+        return self._execute('UPDATE {table} SET {value} = %s, {expires} = %s '
+                             'WHERE {key} = %s AND {expires} < %s',
+                             [self.value, expires, self.cache_key, now]) == 1
+
+    def _release(self):
+        self._execute('DELETE FROM {table} WHERE {key} = %s AND {value} = %s',
+                      [self.cache_key, self.value])
+
+
+class FileLock(CacheLock):
+    # An exclusive flock() of one of `stripes` files in <LOCATION>/locks, the
+    # key's md5 picks which. Held until released or the process exits, the
+    # timeout doesn't apply. The lock files are left in place (deleting one
+    # while another process has it open would let two processes hold "the"
+    # lock), striping keeps them to a fixed number however many keys are
+    # locked. Keys sharing a stripe wait for each other, rarely with 256.
+    stripes = 256
+
+    def __init__(self, cache, key, timeout=10):
+        super().__init__(cache, key, timeout)
+        stripe = int(md5(self.key.encode(), usedforsecurity=False).hexdigest(), 16) % self.stripes
+        self.path = os.path.join(cache._dir, 'locks', f'{stripe:03d}.lock')
+        self.file = None
+
+    def _acquire(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        file = open(self.path, 'ab')
+        if locks.lock(file, locks.LOCK_EX | locks.LOCK_NB):
+            self.file = file
+            return True
+        file.close()
+        return False
+
+    def _release(self):
+        locks.unlock(self.file)
+        self.file.close()
+        self.file = None
+
+
+class LockingDatabaseCache(DatabaseCache):
+    def lock(self, key, timeout=10):
+        return DatabaseLock(self, key, timeout)
+
+
+class LockingFileBasedCache(FileBasedCache):
+    def lock(self, key, timeout=10):
+        return FileLock(self, key, timeout)
+
+
+# Sharded file cache
+#
+# FileBasedCache keeps every entry in one directory, lists all of it on
+# every set() to decide whether to cull, and reads and unzips a whole file
+# to find out it has expired. ShardedFileCache instead:
+#
+#   - puts an entry in <LOCATION>/ab/cd/abcd....djcache (ab, cd the start
+#     of the md5 of the key), so no directory holds more than a few files
+#   - writes to a temporary file in the same directory and renames it over
+#     the entry, so a reader sees the old file or the new one, never half
+#     of one
+#   - reads the expiry from a fixed-size header, then unpickles the value
+#     from an mmap of the file (from one os.read() below MMAP_MIN_BYTES,
+#     where mapping costs more than reading)
+#   - keeps key -> expires in <LOCATION>/index.sqlite3, with the number of
+#     entries kept up to date by triggers. A set() over MAX_ENTRIES deletes
+#     the entries that expire soonest (expired ones first) by the index,
+#     never by listing directories: 1/CULL_FREQUENCY of them as in
+#     FileBasedCache, but CULL_BATCH_SIZE at most per set(). The
+#     directories of the culled entries are also swept of temporary files
+#     older than TMP_MAX_AGE seconds, left by writers that crashed.
+#   - touch() only rewrites the index row and the header, not the value
+#
+# Processes share the index through SQLite's own locking: a write renames
+# its file and updates the index in one transaction, so the files and the
+# index agree. Values are not compressed, unlike FileBasedCache.
+#
+#   CACHES = {
+#       'default': {
+#           'BACKEND': 'student.cache_backends.ShardedFileCache',
+#           'LOCATION': 'student_cache',
+#           'OPTIONS': {'MAX_ENTRIES': 100000},
+#       }
+#   }
+
+class ShardedFileCache(LockingFileBasedCache):
+    # Magic and expiry (time.time(), inf for never) of every file
+    header = struct.Struct('<4sd')
+    magic = b'DJS1'
+    index_name = 'index.sqlite3'
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get('OPTIONS', {})
+        self.mmap_min_bytes = int(options.get('MMAP_MIN_BYTES', 16 * 1024))
+        self.cull_batch_size = int(options.get('CULL_BATCH_SIZE', 500))
+        self.tmp_max_age = float(options.get('TMP_MAX_AGE', 600))
+        self._local = threading.local()
+
+    # Index
+
+    @property
+    def _index(self):
+        # A connection per thread and process
+        index = getattr(self._local, 'index', None)
+        if index is None or self._local.pid != os.getpid():
+            self._createdir()
+            index = sqlite3.connect(os.path.join(self._dir, self.index_name), timeout=30,
+                                    isolation_level=None)
+            # No fsync: a crashed process loses nothing, an OS crash at
+            # worst the last index updates, i.e. some culling of a cache
+            index.execute('PRAGMA journal_mode=WAL')
+            index.execute('PRAGMA synchronous=OFF')
+            index.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, expires REAL NOT NULL) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+                CREATE TABLE IF NOT EXISTS stats (
+                    id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL);
+                INSERT OR IGNORE INTO stats VALUES (0, 0);
+                CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries
+                    BEGIN UPDATE stats SET entries = entries + 1; END;
+                CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries
+                    BEGIN UPDATE stats SET entries = entries - 1; END;
+            """)
+            self._local.index, self._local.pid = index, os.getpid()
+        return index
+
+    @contextmanager
+    def _write_lock(self):
+        # BEGIN IMMEDIATE: one writer at a time over all processes
+        index = self._index
+        index.execute('BEGIN IMMEDIATE')
+        try:
+            yield index
+        except BaseException:
+            index.execute('ROLLBACK')
+            raise
+        index.execute('COMMIT')
+
+    # Files
+
+    def _key_to_file(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._key_file(md5(key.encode(), usedforsecurity=False).hexdigest())
+
+    def _file_to_key(self, fname):
+        # The md5 the index knows the file by
+        return os.path.basename(fname)[:-len(self.cache_suffix)]
+
+    def _key_file(self, digest):
+        # <LOCATION>/ab/cd/abcd....djcache
+        return os.path.join(self._dir, digest[:2], digest[2:4], digest + self.cache_suffix)
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return math.inf if expires is None else expires
+
+    def _write_temp(self, fname, value, expires):
+        directory = os.path.dirname(fname)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with open(fd, 'wb') as f:
+                f.write(self.header.pack(self.magic, expires))
+                f.write(pickle.dumps(value, self.pickle_protocol))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def _read(self, fname, header_only=False):
+        # The value, MISSING for a missing or expired entry. Expired files
+        # are left to culling: deleting one here could delete the fresh
+        # file another process just renamed over it.
+        try:
+            fd = os.open(fname, os.O_RDONLY)
+        except FileNotFoundError:
+            return MISSING
+        try:
+            size = os.fstat(fd).st_size
+            if size < self.header.size:
+                return MISSING
+            if header_only or size < self.mmap_min_bytes:
+                data = os.read(fd, self.header.size if header_only else size)
+                return self._load(data, header_only)
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as data:
+                return self._load(data, header_only)
+        finally:
+            os.close(fd)
+
+    def _load(self, data, header_only):
+        magic, expires = self.header.unpack_from(data)
+        if magic != self.magic or expires < time.time():
+            return MISSING
+        if header_only:
+            return True
+        with memoryview(data) as view, view[self.header.size:] as value:
+            return pickle.loads(value)
+
+    def _store(self, fname, tmp_path, expires, only_if_missing=False):
+        # Puts tmp_path in place and indexes it, in one transaction
+        key = self._file_to_key(fname)
+        try:
+            with self._write_lock() as index:
+                if only_if_missing:
+                    row = index.execute('SELECT expires FROM entries WHERE key = ?',
+                                        [key]).fetchone()
+                    if row is not None and row[0] >= time.time() and os.path.exists(fname):
+                        return False
+                index.execute('INSERT INTO entries VALUES (?, ?) ON CONFLICT (key) '
+                              'DO UPDATE SET expires = excluded.expires', [key, expires])
+                os.replace(tmp_path, fname)
+                tmp_path = None
+                self._cull_index(index)
+        finally:
+            if tmp_path is not None:
+                os.remove(tmp_path)
+        return True
+
+    def _cull_index(self, index):
+        # Caller holds the write lock, no other process can set one of the
+        # entries again before its file is gone
+        entries = index.execute('SELECT entries FROM stats').fetchone()[0]
+        if entries <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            limit = entries
+        else:
+            # Back under MAX_ENTRIES plus some room, at most CULL_BATCH_SIZE
+            # files more per set(): deleting a 1/CULL_FREQUENCY of 100k
+            # files at once takes seconds
+            limit = entries - self._max_entries + min(entries // self._cull_frequency,
+                                                      self.cull_batch_size)
+        victims = [row[0] for row in index.execute(
+            'SELECT key FROM entries ORDER BY expires LIMIT ?', [limit])]
+        index.executemany('DELETE FROM entries WHERE key = ?', [[digest] for digest in victims])
+        for digest in victims:
+            self._delete(self._key_file(digest))
+        self._sweep_temp_files({digest[:4] for digest in victims})
+
+    def _sweep_temp_files(self, shards=None):
+        # Temporary files of writers that died before the rename, old enough
+        # that no write can still be busy with them. Only in the given
+        # shards ('abcd' for <LOCATION>/ab/cd), all of them for None.
+        patterns = ([os.path.join(self._dir, '*', '*', '*.tmp')] if shards is None else
+                    [os.path.join(self._dir, shard[:2], shard[2:], '*.tmp') for shard in shards])
+        cutoff = time.time() - self.tmp_max_age
+        for pattern in patterns:
+            for path in glob.glob(pattern):
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        value = self._read(self._key_to_file(key, version))
+        return default if value is MISSING else value
+
+    def has_key(self, key, version=None):
+        return self._read(self._key_to_file(key, version), header_only=True) is not MISSING
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        expires = self._expires(timeout)
+        self._store(fname, self._write_temp(fname, value, expires), expires)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        expires = self._expires(timeout)
+        return self._store(fname, self._write_temp(fname, value, expires), expires,
+                           only_if_missing=True)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        # The value stays where it is, only the expiry in the index and in
+        # the header is written. Under the write lock no set() can rename
+        # another file over this one meanwhile. Readers see the old or the
+        # new header, one small write at the start of the file.
+        fname = self._key_to_file(key, version)
+        expires = self._expires(timeout)
+        with self._write_lock() as index:
+            if self._read(fname, header_only=True) is MISSING:
+                return False
+            with open(fname, 'r+b') as f:
+                f.write(self.header.pack(self.magic, expires))
+            index.execute('INSERT INTO entries VALUES (?, ?) ON CONFLICT (key) '
+                          'DO UPDATE SET expires = excluded.expires',
+                          [self._file_to_key(fname), expires])
+        return True
+
+    def delete(self, key, version=None):
+        fname = self._key_to_file(key, version)
+        with self._write_lock() as index:
+            index.execute('DELETE FROM entries WHERE key = ?', [self._file_to_key(fname)])
+            return self._delete(fname)
+
+    def _delete(self, fname):
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _cull(self):
+        # Done by set() through the index
+        pass
+
+    def clear(self):
+        # Also the files the index lost track of, e.g. after a crash
+        # between a rename and its commit
+        with self._write_lock() as index:
+            index.execute('DELETE FROM entries')
+            for fname in self._list_cache_files():
+                self._delete(fname)
+            self._sweep_temp_files()
+
+    def _list_cache_files(self):
+        return glob.glob(os.path.join(self._dir, '*', '*', f'*{self.cache_suffix}'))
+
+    def entries(self):
+        # Number of entries in the index, expired ones included
+        return self._index.execute('SELECT entries FROM stats').fetchone()[0]
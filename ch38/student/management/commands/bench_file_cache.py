@@ -0,0 +1,134 @@
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management.base import BaseCommand, CommandError
+from student.cache_backends import ShardedFileCache
+
+
+def measure(operation, iterations):
+    latencies = []
+    for number in range(iterations):
+        started = time.perf_counter()
+        operation(number)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.median(latencies) * 1e6, latencies[int(len(latencies) * 0.99)] * 1e6
+
+
+def checked_value(number, size):
+    # A value that tells whether it was read whole
+    payload = random.randbytes(size)
+    return {'number': number, 'payload': payload, 'md5': hashlib.md5(payload).hexdigest()}
+
+
+def worker(directory, keys, seconds, size, seed):
+    # Sets and gets overlapping keys, returns (reads, writes, bad reads)
+    random.seed(seed)
+    cache = ShardedFileCache(directory, {'OPTIONS': {'MAX_ENTRIES': keys // 2}})
+    reads = writes = bad = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        key = f'shared:{random.randrange(keys)}'
+        if random.random() < 0.3:
+            cache.set(key, checked_value(writes, random.choice((100, size))), 60)
+            writes += 1
+        else:
+            value = cache.get(key)
+            reads += 1
+            if value is not None and hashlib.md5(value['payload']).hexdigest() != value['md5']:
+                bad += 1
+    return reads, writes, bad
+
+
+class Command(BaseCommand):
+    help = ("Compare FileBasedCache and ShardedFileCache with --entries entries in throwaway "
+            "directories, then hammer ShardedFileCache from several processes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100_000)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--large', type=int, default=256 * 1024,
+                            help="Bytes of the large values")
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def handle(self, *args, **options):
+        self.entries = options['entries']
+        self.small = {'name': 'Sonam', 'roll': 101}
+        self.large = {'name': 'Sonam', 'photo': os.urandom(options['large'])}
+        root = tempfile.mkdtemp(prefix='bench_file_cache')
+        try:
+            for cache_class in (FileBasedCache, ShardedFileCache):
+                directory = os.path.join(root, cache_class.__name__)
+                # MAX_ENTRIES above the entries: no culling, only the check
+                cache = cache_class(directory, {'OPTIONS': {'MAX_ENTRIES': self.entries * 2}})
+                self.fill(cache)
+                self.compare(cache, options['iterations'])
+                self.cull(cache_class, directory)
+            self.concurrent(os.path.join(root, 'concurrent'), options)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def fill(self, cache):
+        started = time.perf_counter()
+        if isinstance(cache, ShardedFileCache):
+            for number in range(self.entries):
+                cache.set(f'bench:{number}', self.small, 3600)
+        else:
+            # Through set() every write would list the directory, write the
+            # files as set() does without it
+            for number in range(self.entries):
+                with open(cache._key_to_file(f'bench:{number}'), 'wb') as f:
+                    cache._write_content(f, 3600, self.small)
+        self.stdout.write(f"{type(cache).__name__:<17} {self.entries:,} entries in "
+                          f"{time.perf_counter() - started:.1f} s")
+
+    def compare(self, cache, iterations):
+        for number in range(iterations):
+            cache.set(f'large:{number}', self.large, 3600)
+        operations = {
+            'get': lambda number: cache.get(f'bench:{number * 7919 % self.entries}'),
+            f'get {len(self.large["photo"]) // 1024} KiB': lambda number: cache.get(
+                f'large:{number}'),
+            'has_key': lambda number: cache.has_key(f'bench:{number * 7919 % self.entries}'),
+            'set': lambda number: cache.set(f'bench:{number * 7919 % self.entries}',
+                                            self.small, 3600),
+            'add': lambda number: cache.add(f'new:{number}', self.small, 3600),
+            'delete': lambda number: cache.delete(f'new:{number}'),
+        }
+        for name, operation in operations.items():
+            p50, p99 = measure(operation, iterations)
+            self.stdout.write(f"{type(cache).__name__:<17} {name:<12} p50 {p50:10.1f} us  "
+                              f"p99 {p99:10.1f} us")
+
+    def cull(self, cache_class, directory):
+        # The set() that finds the cache full, it holds the large values of
+        # compare() on top of --entries
+        cache = cache_class(directory, {'OPTIONS': {'MAX_ENTRIES': self.entries}})
+        started = time.perf_counter()
+        cache.set('bench:cull', self.small, 3600)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{cache_class.__name__:<17} {'culling set':<12} "
+                          f"{elapsed * 1e3:10.1f} ms")
+
+    def concurrent(self, directory, options):
+        keys = 2000
+        with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+            results = pool.starmap(worker, [
+                (directory, keys, options['seconds'], options['large'], seed)
+                for seed in range(options['processes'])])
+        reads, writes, bad = (sum(column) for column in zip(*results))
+        cache = ShardedFileCache(directory, {})
+        indexed, files = cache.entries(), len(cache._list_cache_files())
+        self.stdout.write(
+            f"{options['processes']} processes: {reads:,} reads, {writes:,} writes, "
+            f"{bad} torn reads, {indexed:,} indexed entries, {files:,} files")
+        if bad or indexed != files:
+            raise CommandError("Concurrent access left the cache inconsistent")
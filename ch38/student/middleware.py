@@ -0,0 +1,238 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.middleware.cache import (
+    CacheMiddleware, FetchFromCacheMiddleware, UpdateCacheMiddleware,
+)
+from django.utils.cache import (
+    get_cache_key, get_max_age, has_vary_header, learn_cache_key,
+    patch_cache_control, patch_response_headers, patch_vary_headers,
+)
+from django.utils.http import parse_http_date_safe
+from student.cache_backends import get_lock
+
+# Single-flight page caching. With Django's cache middleware every request
+# that comes in while a page is expired renders it again. Here one request
+# (the one that gets the page's lock) renders it, the others either get the
+# stale copy or wait a little for the new one:
+#
+#   fresh                         cached page, like Django
+#   stale, within STALE_WHILE_REVALIDATE seconds
+#                                 the stale copy, one request renders
+#   stale for longer, or missing  wait up to LOCK_WAIT seconds for the
+#                                 request that renders it, then render
+#
+# A render that stores no page (a 404, a redirect, a response that sets a
+# cookie and varies on it ...) leaves an "uncacheable" marker for the URL
+# for a few seconds: the waiting requests stop waiting and render, and later
+# ones render right away, as without this middleware. When the lock is
+# released with neither a page nor a marker (the render raised), the first
+# waiter to get the lock renders.
+#
+# When rendering fails with a 5xx within STALE_IF_ERROR seconds of the page
+# going stale, the stale copy is returned instead of the error, and no
+# marker is left: the page is cacheable. Pages are kept in the cache for
+# timeout + the longer of the two windows and are fresh until their Expires
+# header. Settings (all optional):
+#
+#   CACHE_MIDDLEWARE_STALE_WHILE_REVALIDATE = 0
+#   CACHE_MIDDLEWARE_STALE_IF_ERROR = 0
+#   CACHE_MIDDLEWARE_LOCK_TIMEOUT = 10  # longest a render may hold the lock
+#   CACHE_MIDDLEWARE_LOCK_WAIT = 1
+
+
+class SingleFlightMixin:
+    poll_interval = 0.05
+    uncacheable_timeout = 10
+
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.stale_while_revalidate = getattr(settings, 'CACHE_MIDDLEWARE_STALE_WHILE_REVALIDATE', 0)
+        self.stale_if_error = getattr(settings, 'CACHE_MIDDLEWARE_STALE_IF_ERROR', 0)
+        self.lock_timeout = getattr(settings, 'CACHE_MIDDLEWARE_LOCK_TIMEOUT', 10)
+        self.lock_wait = getattr(settings, 'CACHE_MIDDLEWARE_LOCK_WAIT', 1)
+
+    def fresh_until(self, response):
+        # A page without Expires never goes stale, as in Django
+        expires = parse_http_date_safe(response.get('Expires', ''))
+        return float('inf') if expires is None else expires
+
+    def url_key(self, request, name):
+        # One lock and marker per URL, whatever the Vary headers
+        url = hashlib.md5(request.build_absolute_uri().encode('ascii'), usedforsecurity=False)
+        return f'single_flight.{name}.{self.key_prefix}.{url.hexdigest()}'
+
+    def lock_key(self, request):
+        return self.url_key(request, 'lock')
+
+    def uncacheable_key(self, request):
+        return self.url_key(request, 'uncacheable')
+
+    def release_lock(self, request):
+        lock = request.__dict__.pop('_cache_lock', None)
+        if lock is not None:
+            lock.release()
+
+    def serve(self, request, response):
+        # Age as in FetchFromCacheMiddleware, past max-age for a stale copy
+        if (max_age_seconds := get_max_age(response)) is not None and (
+            expires_timestamp := parse_http_date_safe(response['Expires'])
+        ) is not None:
+            response['Age'] = max(0, max_age_seconds - (expires_timestamp - int(time.time())))
+        request._cache_update_cache = False
+        return response
+
+    def stale_copy(self, request, window):
+        stale = getattr(request, '_cache_stale', None)
+        if stale is not None and time.time() < self.fresh_until(stale) + window:
+            return stale
+        return None
+
+
+class SingleFlightUpdateCacheMiddleware(SingleFlightMixin, UpdateCacheMiddleware):
+    def process_exception(self, request, exception):
+        # Only reached when used as a decorator, the middleware gets a 500
+        self.release_lock(request)
+        stale = self.stale_copy(request, self.stale_if_error)
+        return None if stale is None else self.serve(request, stale)
+
+    def process_response(self, request, response):
+        lock = getattr(request, '_cache_lock', None)
+        deferred = stored = served_stale = False
+        try:
+            if response.status_code >= 500:
+                stale = self.stale_copy(request, self.stale_if_error)
+                if stale is not None:
+                    served_stale = True
+                    return self.serve(request, stale)
+            if not self._should_update_cache(request, response):
+                return response
+            # From here on as UpdateCacheMiddleware.process_response(), but
+            # the page is kept past its timeout for the stale windows
+            if response.streaming or response.status_code not in (200, 304):
+                return response
+            if response.cookies and has_vary_header(response, 'Cookie'):
+                return response
+            cache_control = response.get('Cache-Control', '').lower()
+            if cache_control and any(directive in cache_control
+                                     for directive in ('private', 'no-cache', 'no-store')):
+                return response
+            if has_vary_header(response, '*'):
+                return response
+            timeout = self.page_timeout
+            if timeout is None:
+                timeout = get_max_age(response)
+                if timeout is None:
+                    timeout = self.cache_timeout
+                elif timeout == 0:
+                    return response
+            patch_response_headers(response, timeout)
+            # Let browsers and proxies use the same windows (RFC 5861)
+            if self.stale_while_revalidate:
+                patch_cache_control(response, stale_while_revalidate=self.stale_while_revalidate)
+            if self.stale_if_error:
+                patch_cache_control(response, stale_if_error=self.stale_if_error)
+            if request.headers.get('Authorization') and 'public' not in cache_control:
+                patch_vary_headers(response, ('Authorization',))
+            if timeout and response.status_code == 200:
+                kept = timeout + max(self.stale_while_revalidate, self.stale_if_error)
+                cache_key = learn_cache_key(request, response, kept, self.key_prefix,
+                                            cache=self.cache)
+                if hasattr(response, 'render') and callable(response.render):
+                    # Hold the lock until the rendered page is stored
+                    deferred = True
+
+                    def store(rendered):
+                        try:
+                            self.cache.set(cache_key, rendered, kept)
+                        finally:
+                            self.release_lock(request)
+
+                    response.add_post_render_callback(store)
+                else:
+                    self.cache.set(cache_key, response, kept)
+                    stored = True
+            return response
+        finally:
+            if lock is not None and not deferred:
+                if not stored and not served_stale:
+                    # Nothing for the waiting requests to pick up. The page
+                    # is cacheable when its render failed: without a marker
+                    # the next render still takes the lock, the others get
+                    # the stale copy meanwhile.
+                    self.cache.set(self.uncacheable_key(request), True, self.uncacheable_timeout)
+                self.release_lock(request)
+
+
+class SingleFlightFetchFromCacheMiddleware(SingleFlightMixin, FetchFromCacheMiddleware):
+    def get_cached(self, request):
+        cache_key = get_cache_key(request, self.key_prefix, 'GET', cache=self.cache)
+        if cache_key is None:
+            return None
+        response = self.cache.get(cache_key)
+        if response is None and request.method == 'HEAD':
+            cache_key = get_cache_key(request, self.key_prefix, 'HEAD', cache=self.cache)
+            response = self.cache.get(cache_key)
+        return response
+
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            request._cache_update_cache = False
+            return None
+        response = self.get_cached(request)
+        now = time.time()
+        if response is not None and now < self.fresh_until(response):
+            return self.serve(request, response)
+
+        # Stale or missing: whoever gets the lock renders the page
+        request._cache_stale = response
+        request._cache_update_cache = True
+        if self.cache.get(self.uncacheable_key(request)):
+            return None
+        lock = get_lock(self.cache, self.lock_key(request), self.lock_timeout)
+        if lock.acquire(blocking=False):
+            request._cache_lock = lock
+            return None
+        stale = self.stale_copy(request, self.stale_while_revalidate)
+        if stale is not None:
+            return self.serve(request, stale)
+
+        # Wait for the request holding the lock to store the page
+        deadline = now + self.lock_wait
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            response = self.get_cached(request)
+            if response is not None and time.time() < self.fresh_until(response):
+                return self.serve(request, response)
+            if self.cache.get(self.uncacheable_key(request)):
+                # Rendered, but nothing was stored
+                return None
+            if lock.acquire(blocking=False):
+                # Released without a page or a marker, render it here. Unless
+                # it was stored just before.
+                response = self.get_cached(request)
+                if response is not None and time.time() < self.fresh_until(response):
+                    lock.release()
+                    return self.serve(request, response)
+                request._cache_lock = lock
+                return None
+        # Taking too long, render it here as well
+        return None
+
+
+class SingleFlightCacheMiddleware(SingleFlightUpdateCacheMiddleware,
+                                  SingleFlightFetchFromCacheMiddleware, CacheMiddleware):
+    # Both halves in one, used by a cache_page() decorator
+    def __init__(self, get_response, cache_timeout=None, page_timeout=None,
+                 stale_while_revalidate=None, stale_if_error=None, lock_timeout=None,
+                 lock_wait=None, **kwargs):
+        super().__init__(get_response, cache_timeout, page_timeout, **kwargs)
+        if stale_while_revalidate is not None:
+            self.stale_while_revalidate = stale_while_revalidate
+        if stale_if_error is not None:
+            self.stale_if_error = stale_if_error
+        if lock_timeout is not None:
+            self.lock_timeout = lock_timeout
+        if lock_wait is not None:
+            self.lock_wait = lock_wait
@@ -1,3 +1,260 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, override_settings
+from django.urls import path
+from student.cache_backends import FileLock, LockingFileBasedCache, ShardedFileCache, get_lock
+from student.middleware import SingleFlightFetchFromCacheMiddleware
+
+# What the test view does next, set by the tests
+view = {'sleep': 0, 'status': 200, 'renders': 0}
+
+
+def page(request):
+    view['renders'] += 1
+    renders = view['renders']
+    time.sleep(view['sleep'])
+    return HttpResponse(f'render {renders}', status=view['status'])
+
+
+urlpatterns = [path('page/', page)]
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                        'LOCATION': 'single-flight-tests'}},
+    MIDDLEWARE=['student.middleware.SingleFlightUpdateCacheMiddleware',
+                'student.middleware.SingleFlightFetchFromCacheMiddleware'],
+    CACHE_MIDDLEWARE_SECONDS=1,
+    CACHE_MIDDLEWARE_STALE_WHILE_REVALIDATE=30,
+    CACHE_MIDDLEWARE_STALE_IF_ERROR=30,
+    CACHE_MIDDLEWARE_LOCK_WAIT=1,
+)
+class SingleFlightMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        view.update(sleep=0, status=200, renders=0)
+
+    def get_concurrently(self, count):
+        # [(seconds, response)] of count simultaneous GETs of /page/
+        results = [None] * count
+        start = threading.Barrier(count)
+
+        def get(number):
+            client = Client()
+            start.wait()
+            started = time.monotonic()
+            response = client.get('/page/')
+            results[number] = (time.monotonic() - started, response)
+
+        threads = [threading.Thread(target=get, args=(number,)) for number in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def page_lock(self):
+        middleware = SingleFlightFetchFromCacheMiddleware(lambda request: None)
+        request = RequestFactory().get('/page/')
+        return get_lock(caches['default'], middleware.lock_key(request), 10)
+
+    def make_stale(self):
+        self.assertEqual(self.client.get('/page/').content, b'render 1')
+        # Expires has whole seconds, CACHE_MIDDLEWARE_SECONDS is 1
+        time.sleep(1.1)
+
+    def test_concurrent_misses_render_once(self):
+        view['sleep'] = 0.2
+        results = self.get_concurrently(5)
+        self.assertEqual(view['renders'], 1)
+        self.assertEqual({response.content for seconds, response in results}, {b'render 1'})
+
+    def test_uncacheable_page_does_not_hold_up_the_others(self):
+        view.update(sleep=0.2, status=404)
+        results = self.get_concurrently(5)
+        # Waiters stop at the "uncacheable" marker instead of after LOCK_WAIT
+        self.assertLess(max(seconds for seconds, response in results), 0.8)
+        self.assertEqual({response.status_code for seconds, response in results}, {404})
+        # Later requests don't wait for the lock at all
+        with self.page_lock():
+            started = time.monotonic()
+            self.assertEqual(self.client.get('/page/').status_code, 404)
+            self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_lock_released_without_a_page_is_taken_over(self):
+        lock = self.page_lock()
+        self.assertTrue(lock.acquire(blocking=False))
+        threading.Timer(0.2, lock.release).start()
+        started = time.monotonic()
+        response = self.client.get('/page/')
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual((response.content, view['renders']), (b'render 1', 1))
+
+    def test_waits_at_most_lock_wait(self):
+        with self.page_lock():
+            started = time.monotonic()
+            self.assertEqual(self.client.get('/page/').content, b'render 1')
+            self.assertGreaterEqual(time.monotonic() - started, 1)
+
+    def test_stale_while_revalidate(self):
+        self.make_stale()
+        # Another request is rendering it: the stale copy at once
+        with self.page_lock():
+            response = self.client.get('/page/')
+        self.assertEqual((response.content, view['renders']), (b'render 1', 1))
+        self.assertEqual(self.client.get('/page/').content, b'render 2')
+        self.assertEqual(self.client.get('/page/').content, b'render 2')
+
+    def test_stale_if_error(self):
+        self.make_stale()
+        view['status'] = 500
+        response = self.client.get('/page/')
+        self.assertEqual((response.status_code, response.content), (200, b'render 1'))
+        view['status'] = 200
+        self.assertEqual(self.client.get('/page/').content, b'render 3')
+
+    def test_stale_if_error_renders_one_at_a_time(self):
+        # During an outage a failed render leaves no "uncacheable" marker:
+        # the next one still takes the lock, the others get the stale copy
+        self.make_stale()
+        view.update(status=500, sleep=0.2)
+        self.assertEqual(self.client.get('/page/').content, b'render 1')
+        results = self.get_concurrently(2)
+        self.assertEqual(view['renders'], 3)
+        self.assertEqual({(response.status_code, response.content)
+                          for seconds, response in results}, {(200, b'render 1')})
+
+
+class FileLockTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.cache = LockingFileBasedCache(location, {})
+
+    def test_one_holder_per_key(self):
+        first, second = self.cache.lock('page:/a/'), self.cache.lock('page:/a/')
+        self.assertTrue(first.acquire(blocking=False))
+        self.assertFalse(second.acquire(blocking=False))
+        first.release()
+        self.assertTrue(second.acquire(blocking=False))
+        second.release()
+
+    def test_lock_files_are_bounded(self):
+        for number in range(FileLock.stripes * 4):
+            with self.cache.lock(f'page:/?x={number}'):
+                pass
+        self.assertLessEqual(len(os.listdir(os.path.join(self.cache._dir, 'locks'))),
+                             FileLock.stripes)
+
+
+class ShardedFileCacheTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.cache = ShardedFileCache(location, {'OPTIONS': {
+            'MAX_ENTRIES': 20, 'CULL_FREQUENCY': 4, 'MMAP_MIN_BYTES': 1024}})
+
+    def later(self, seconds):
+        # Readers compare the header with this
+        return mock.patch('student.cache_backends.time.time',
+                          return_value=time.time() + seconds)
+
+    def test_get_set_delete_across_shards(self):
+        data = {f'key{number}': {'number': number} for number in range(15)}
+        data['big'] = b'x' * 4096  # Read through mmap
+        data['none'] = None
+        self.cache.set_many(data)
+        shards = {os.path.dirname(fname) for fname in self.cache._list_cache_files()}
+        self.assertGreater(len(shards), 1)
+        self.assertEqual(self.cache.get_many(list(data) + ['missing']), data)
+        self.assertEqual(self.cache.get('none', 'default'), None)
+        self.assertTrue(self.cache.delete('key1'))
+        self.assertFalse(self.cache.delete('key1'))
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertEqual(self.cache.entries(), 16)
+        self.assertFalse(self.cache.add('key2', 'other'))
+        self.assertTrue(self.cache.add('key1', 'again'))
+        self.assertEqual(self.cache.get('key1'), 'again')
+
+    def test_expiry(self):
+        self.cache.set('short', 1, 10)
+        self.cache.set('forever', 2, None)
+        with self.later(11):
+            self.assertIsNone(self.cache.get('short'))
+            self.assertFalse(self.cache.has_key('short'))
+            self.assertEqual(self.cache.get('forever'), 2)
+            # An expired entry can be added again
+            self.assertTrue(self.cache.add('short', 3, 100))
+        self.assertEqual(self.cache.get('short'), 3)
+
+    def test_touch_writes_the_expiry_not_the_value(self):
+        self.cache.set('a', b'v' * 4096, 10)
+        fname = self.cache._key_to_file('a')
+        inode = os.stat(fname).st_ino
+        with mock.patch('student.cache_backends.pickle.dumps') as dumps, \
+                mock.patch('student.cache_backends.pickle.loads') as loads:
+            self.assertTrue(self.cache.touch('a', 100))
+        dumps.assert_not_called()
+        loads.assert_not_called()
+        self.assertEqual(os.stat(fname).st_ino, inode)
+        with self.later(50):
+            self.assertEqual(self.cache.get('a'), b'v' * 4096)
+        expires = self.cache._index.execute('SELECT expires FROM entries').fetchone()[0]
+        self.assertAlmostEqual(expires, time.time() + 100, delta=5)
+        self.assertFalse(self.cache.touch('missing'))
+        with self.later(101):
+            self.assertFalse(self.cache.touch('a'))
+
+    def test_culling_keeps_max_entries_and_sweeps_stale_temp_files(self):
+        self.cache.set('first', 0, 10)
+        directory = os.path.dirname(self.cache._key_to_file('first'))
+        stale, fresh = os.path.join(directory, 'stale.tmp'), os.path.join(directory, 'fresh.tmp')
+        for path in (stale, fresh):
+            open(path, 'wb').close()
+        os.utime(stale, (time.time() - 3600, time.time() - 3600))
+        for number in range(25):
+            self.cache.set(f'key{number}', number, 100 + number)
+        self.assertLessEqual(self.cache.entries(), 20)
+        self.assertEqual(len(self.cache._list_cache_files()), self.cache.entries())
+        # The soonest to expire went first
+        self.assertIsNone(self.cache.get('first'))
+        self.assertEqual(self.cache.get('key24'), 24)
+        self.assertFalse(os.path.exists(stale))
+        # A write may still be busy with it
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_readers_never_see_a_torn_value(self):
+        values = [bytes([letter]) * 100_000 for letter in b'ab']
+        self.cache.set('key', values[0])
+        stop = threading.Event()
+        seen, errors = set(), []
+
+        def write():
+            for number in range(200):
+                self.cache.set('key', values[number % 2])
+                self.cache.touch('key', 300)
+            stop.set()
+
+        def read():
+            try:
+                while not stop.is_set():
+                    seen.add(self.cache.get('key'))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=write)] + [
+            threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(seen, set(values))
@@ -118,11 +118,38 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 # Database Caching
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+#         'LOCATION': 'student_cache',
+#     }
+# }
+
+# Two-tier Caching: an in-process LRU (L1) in front of the database cache
+# (L2). L1 entries live L1_TIMEOUT seconds at most, so a value changed by
+# another process is seen within that time.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'BACKEND': 'student.cache_backends.TwoTierCache',
+        # Names the L1 the threads of a process share
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'L2': 'database',
+            'L1_TIMEOUT': 5,
+            'L1_MAX_BYTES': 8 * 1024 * 1024,
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'database': {
+        # DatabaseCache with cache.lock(), for single-flight cache_page(),
+        # one statement per get_many()/set_many() and culling moved to a
+        # background sweeper every SWEEP_INTERVAL seconds
+        'BACKEND': 'student.cache_backends.BatchedDatabaseCache',
         'LOCATION': 'student_cache',
-    }
+        'OPTIONS': {
+            'SWEEP_INTERVAL': 60,
+        },
+    },
 }
 
 # File Based Caching
@@ -0,0 +1,23 @@
+import contextlib
+import os
+import shutil
+import tempfile
+
+from django.db import connection
+
+
+@contextlib.contextmanager
+def test_database():
+    # A throwaway, migrated copy of the default database with the cache
+    # tables, for the bench_* commands: db.sqlite3 is never written to
+    tempdir = tempfile.mkdtemp()
+    if connection.vendor == 'sqlite':
+        # A file, not the in-memory test database: the sweeper thread of a
+        # BatchedDatabaseCache has to see the same tables
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempdir, 'benchmark.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(tempdir, ignore_errors=True)
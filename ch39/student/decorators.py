@@ -0,0 +1,18 @@
+from django.utils.decorators import decorator_from_middleware_with_args
+from student.middleware import SingleFlightCacheMiddleware
+
+
+def cache_page(timeout, *, cache=None, key_prefix=None, stale_while_revalidate=None,
+               stale_if_error=None):
+    # django.views.decorators.cache.cache_page() in single-flight mode, with
+    # the stale windows of this view (seconds, the settings by default):
+    #
+    #   @cache_page(30, stale_while_revalidate=30, stale_if_error=300)
+    #   def course(request):
+    return decorator_from_middleware_with_args(SingleFlightCacheMiddleware)(
+        page_timeout=timeout,
+        cache_alias=cache,
+        key_prefix=key_prefix,
+        stale_while_revalidate=stale_while_revalidate,
+        stale_if_error=stale_if_error,
+    )
@@ -0,0 +1,64 @@
+import statistics
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from student.benchmark import test_database
+
+
+def measure(operation, iterations):
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return (statistics.median(latencies) * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6,
+            len(latencies) / sum(latencies))
+
+
+class Command(BaseCommand):
+    help = "Compare the hit path latency of get, get_many and get_or_set between two caches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cache', default='default', help="The cache under test")
+        parser.add_argument('--baseline', default='database', help="The cache to compare with")
+        parser.add_argument('--keys', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        # Database caches write to the tables of a throwaway database
+        with test_database():
+            self.compare(options)
+
+    def compare(self, options):
+        keys = [f'bench:{number}' for number in range(options['keys'])]
+        data = {key: {'name': 'Sonam', 'roll': number} for number, key in enumerate(keys)}
+        for alias in (options['baseline'], options['cache']):
+            cache = caches[alias]
+            cache.set_many(data, 300)
+            # Warm up, the hit path is measured
+            cache.get_many(keys)
+            counter = iter(range(10**9))
+
+            def key():
+                return keys[next(counter) % len(keys)]
+
+            def batch():
+                start = next(counter) % (len(keys) - 10)
+                return keys[start:start + 10]
+
+            operations = {
+                'get': lambda: cache.get(key()),
+                'get_many(10)': lambda: cache.get_many(batch()),
+                'get_or_set': lambda: cache.get_or_set(key(), 'unused', 300),
+            }
+            for name, operation in operations.items():
+                p50, p99, rate = measure(operation, options['iterations'])
+                self.stdout.write(
+                    f"{alias:>10} {cache.__class__.__name__:<14} {name:<13} "
+                    f"p50 {p50:8.1f} us  p99 {p99:8.1f} us  {rate:10.0f} ops/s")
+            if hasattr(cache, 'stats'):
+                self.stdout.write(f"{alias:>10} {cache.stats()}")
+            cache.delete_many(keys)
@@ -1,3 +1,346 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils.timezone import now as tz_now
+from student.cache_backends import (
+    BatchedDatabaseCache, FileLock, LockingFileBasedCache, _sweepers, get_lock,
+)
+from student.decorators import cache_page
+from student.middleware import SingleFlightFetchFromCacheMiddleware
+
+# What the test view does next, set by the tests
+view = {'sleep': 0, 'status': 200, 'renders': 0}
+
+
+@cache_page(1, stale_while_revalidate=30, stale_if_error=30)
+def page(request):
+    view['renders'] += 1
+    renders = view['renders']
+    time.sleep(view['sleep'])
+    if view['status'] == 'raise':
+        raise RuntimeError("Rendering failed")
+    return HttpResponse(f'render {renders}', status=view['status'])
+
+
+urlpatterns = [path('page/', page)]
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                        'LOCATION': 'single-flight-tests'}},
+    MIDDLEWARE=[],
+)
+class SingleFlightCachePageTests(SimpleTestCase):
+    # cache_page() makes its middleware at import, with the default
+    # CACHE_MIDDLEWARE_LOCK_WAIT of 1 second
+    def setUp(self):
+        caches['default'].clear()
+        view.update(sleep=0, status=200, renders=0)
+
+    def get_concurrently(self, count):
+        # [(seconds, response)] of count simultaneous GETs of /page/
+        results = [None] * count
+        start = threading.Barrier(count)
+
+        def get(number):
+            client = Client()
+            start.wait()
+            started = time.monotonic()
+            response = client.get('/page/')
+            results[number] = (time.monotonic() - started, response)
+
+        threads = [threading.Thread(target=get, args=(number,)) for number in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def page_lock(self):
+        middleware = SingleFlightFetchFromCacheMiddleware(lambda request: None)
+        request = RequestFactory().get('/page/')
+        return get_lock(caches['default'], middleware.lock_key(request), 10)
+
+    def make_stale(self):
+        self.assertEqual(self.client.get('/page/').content, b'render 1')
+        # Expires has whole seconds, CACHE_MIDDLEWARE_SECONDS is 1
+        time.sleep(1.1)
+
+    def test_concurrent_misses_render_once(self):
+        view['sleep'] = 0.2
+        results = self.get_concurrently(5)
+        self.assertEqual(view['renders'], 1)
+        self.assertEqual({response.content for seconds, response in results}, {b'render 1'})
+
+    def test_uncacheable_page_does_not_hold_up_the_others(self):
+        view.update(sleep=0.2, status=404)
+        results = self.get_concurrently(5)
+        # Waiters stop at the "uncacheable" marker instead of after LOCK_WAIT
+        self.assertLess(max(seconds for seconds, response in results), 0.8)
+        self.assertEqual({response.status_code for seconds, response in results}, {404})
+        # Later requests don't wait for the lock at all
+        with self.page_lock():
+            started = time.monotonic()
+            self.assertEqual(self.client.get('/page/').status_code, 404)
+            self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_lock_released_without_a_page_is_taken_over(self):
+        lock = self.page_lock()
+        self.assertTrue(lock.acquire(blocking=False))
+        threading.Timer(0.2, lock.release).start()
+        started = time.monotonic()
+        response = self.client.get('/page/')
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual((response.content, view['renders']), (b'render 1', 1))
+
+    def test_waits_at_most_lock_wait(self):
+        with self.page_lock():
+            started = time.monotonic()
+            self.assertEqual(self.client.get('/page/').content, b'render 1')
+            self.assertGreaterEqual(time.monotonic() - started, 1)
+
+    def test_stale_while_revalidate(self):
+        self.make_stale()
+        # Another request is rendering it: the stale copy at once
+        with self.page_lock():
+            response = self.client.get('/page/')
+        self.assertEqual((response.content, view['renders']), (b'render 1', 1))
+        self.assertEqual(self.client.get('/page/').content, b'render 2')
+        self.assertEqual(self.client.get('/page/').content, b'render 2')
+
+    def test_stale_if_error(self):
+        self.make_stale()
+        view['status'] = 500
+        response = self.client.get('/page/')
+        self.assertEqual((response.status_code, response.content), (200, b'render 1'))
+        view['status'] = 200
+        self.assertEqual(self.client.get('/page/').content, b'render 3')
+
+    def test_stale_if_error_renders_one_at_a_time(self):
+        # During an outage a failed render leaves no "uncacheable" marker:
+        # the next one still takes the lock, the others get the stale copy
+        self.make_stale()
+        view.update(status=500, sleep=0.2)
+        self.assertEqual(self.client.get('/page/').content, b'render 1')
+        results = self.get_concurrently(2)
+        self.assertEqual(view['renders'], 3)
+        self.assertEqual({(response.status_code, response.content)
+                          for seconds, response in results}, {(200, b'render 1')})
+
+    def test_stale_if_error_on_exception(self):
+        self.make_stale()
+        view['status'] = 'raise'
+        response = self.client.get('/page/')
+        self.assertEqual((response.status_code, response.content), (200, b'render 1'))
+        # The lock was released
+        view['status'] = 200
+        self.assertEqual(self.client.get('/page/').content, b'render 3')
+
+
+class FileLockTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.cache = LockingFileBasedCache(location, {})
+
+    def test_one_holder_per_key(self):
+        first, second = self.cache.lock('page:/a/'), self.cache.lock('page:/a/')
+        self.assertTrue(first.acquire(blocking=False))
+        self.assertFalse(second.acquire(blocking=False))
+        first.release()
+        self.assertTrue(second.acquire(blocking=False))
+        second.release()
+
+    def test_lock_files_are_bounded(self):
+        for number in range(FileLock.stripes * 4):
+            with self.cache.lock(f'page:/?x={number}'):
+                pass
+        self.assertLessEqual(len(os.listdir(os.path.join(self.cache._dir, 'locks'))),
+                             FileLock.stripes)
+
+
+class SweeperTests(SimpleTestCase):
+    def test_sweeper_survives_errors_and_deregisters_when_it_ends(self):
+        cache = BatchedDatabaseCache('sweeper_test_table', {'OPTIONS': {'SWEEP_INTERVAL': 0.01}})
+        calls = []
+
+        def sweep():
+            calls.append(None)
+            if len(calls) == 1:
+                raise RuntimeError("Not a DatabaseError")
+            # Ends the thread
+            raise SystemExit
+
+        with mock.patch.object(cache, 'sweep', side_effect=sweep), \
+                self.assertLogs('student.cache_backends', 'ERROR'):
+            cache._start_sweeper()
+            key = next(key for key in _sweepers if key[1] == 'sweeper_test_table')
+            _sweepers[key].join(timeout=5)
+        self.assertEqual(len(calls), 2)
+        self.assertNotIn(key, _sweepers)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'student.cache_backends.TwoTierCache',
+                'LOCATION': 'two-tier-tests',
+                'OPTIONS': {'L2': 'l2', 'L1_TIMEOUT': 5, 'L1_MAX_BYTES': 1000,
+                            'L1_MAX_ITEM_BYTES': 400}},
+    'l2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+           'LOCATION': 'two-tier-tests-l2'},
+})
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache, self.l2 = caches['default'], caches['l2']
+        self.cache.clear()
+
+    def test_read_through(self):
+        self.l2.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        # Served from L1 now
+        self.l2.set('a', 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get_many(['a', 'missing']), {'a': 1})
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+
+    def test_write_through(self):
+        self.cache.set('a', 1)
+        self.cache.set_many({'b': 2, 'c': 3})
+        self.assertEqual(self.l2.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+        self.l2.clear()
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+
+    def test_l1_is_shared_by_the_threads_of_a_process(self):
+        self.cache.set('a', 1)
+        self.l2.set('a', 2)
+        hits = self.cache.stats()['l1_hits']
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(
+            (caches['default'] is not self.cache, caches['default'].get('a'))))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [(True, 1)])
+        self.assertEqual(self.cache.stats()['l1_hits'], hits + 1)
+
+    def test_l1_entries_expire(self):
+        self.cache.set('a', 1)
+        self.cache.set('short', 1, timeout=2)
+        self.l2.set_many({'a': 2, 'short': 2})
+        now = time.monotonic()
+        with mock.patch('student.cache_backends.time.monotonic', return_value=now + 3):
+            # At most the key's own timeout
+            self.assertEqual(self.cache.get_many(['a', 'short']), {'a': 1, 'short': 2})
+        with mock.patch('student.cache_backends.time.monotonic', return_value=now + 6):
+            # And at most L1_TIMEOUT
+            self.assertEqual(self.cache.get('a'), 2)
+
+    def test_l1_is_bounded_by_bytes(self):
+        for key in 'abcd':
+            self.cache.set(key, key * 300)
+        stats = self.cache.stats()
+        self.assertLessEqual(stats['l1_bytes'], 1000)
+        self.assertEqual(stats['l1_entries'], 3)
+        # The least recently used went, it is still in L2
+        self.l2.set_many({key: 'changed' for key in 'abcd'})
+        self.assertEqual(self.cache.get('a'), 'changed')
+        self.assertEqual(self.cache.get('d'), 'd' * 300)
+        # Too big for L1 at all
+        self.cache.set('big', 'x' * 500)
+        self.l2.set('big', 'changed')
+        self.assertEqual(self.cache.get('big'), 'changed')
+
+    def test_delete_and_clear_reach_both_tiers(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.cache.delete('a')
+        self.cache.delete_many(['b'])
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'c': 3})
+        self.assertEqual(self.l2.get_many(['a', 'b', 'c']), {'c': 3})
+        self.cache.clear()
+        self.assertIsNone(self.l2.get('c'))
+        self.assertEqual((self.cache.get('c'), self.cache.stats()['l1_entries']), (None, 0))
+
+
+class BatchedDatabaseCacheTests(TestCase):
+    # On the cache table the test database is created with
+    def setUp(self):
+        self.cache = BatchedDatabaseCache('student_cache', {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2, 'SWEEP_INTERVAL': 0,
+            'SWEEP_BATCH_SIZE': 3}})
+        self.cache.clear()
+
+    def statements(self, function, *args, **kwargs):
+        # (result, the SQL run, savepoints left out)
+        with CaptureQueriesContext(connection) as queries:
+            result = function(*args, **kwargs)
+        return result, [query['sql'] for query in queries.captured_queries
+                        if 'SAVEPOINT' not in query['sql']]
+
+    def expire(self, *keys):
+        past = connection.ops.adapt_datetimefield_value(
+            (tz_now() - timedelta(minutes=1)).replace(microsecond=0))
+        with connection.cursor() as cursor:
+            cursor.executemany('UPDATE student_cache SET expires = %s WHERE cache_key = %s',
+                               [(past, self.cache.make_key(key)) for key in keys])
+
+    def rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT cache_key FROM student_cache ORDER BY cache_key')
+            return [key.split(':', 2)[2] for key, in cursor.fetchall()]
+
+    def test_set_many_is_one_upsert(self):
+        self.cache.set('a', 0)
+        failed, sql = self.statements(self.cache.set_many, {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(failed, [])
+        self.assertEqual(len(sql), 1)
+        self.assertIn('ON CONFLICT', sql[0])
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+
+    def test_get_many_is_one_select_without_expired_rows(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': None})
+        self.expire('b')
+        found, sql = self.statements(self.cache.get_many, ['a', 'b', 'c', 'missing'])
+        self.assertEqual(found, {'a': 1, 'c': None})
+        self.assertEqual(len(sql), 1)
+        # Skipped, not deleted: that is the sweeper's job
+        self.assertEqual(self.rows(), ['a', 'b', 'c'])
+
+    def test_add_only_replaces_expired_rows(self):
+        added, sql = self.statements(self.cache.add, 'a', 1)
+        self.assertTrue(added)
+        self.assertEqual(len(sql), 1)
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.expire('a')
+        self.assertTrue(self.cache.add('a', 3))
+        self.assertEqual(self.cache.get('a'), 3)
+
+    def test_delete_many_is_one_delete(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        _, sql = self.statements(self.cache.delete_many, ['a', 'b', 'missing'])
+        self.assertEqual(len(sql), 1)
+        self.assertEqual(self.rows(), ['c'])
+
+    def test_writes_never_cull_the_sweeper_does(self):
+        # Expiring one second apart, a* first
+        for number, key in enumerate(['a1', 'a2', 'a3', 'b1', 'b2', 'b3', 'b4', 'b5', 'b6',
+                                      'b7', 'b8', 'b9', 'c1', 'c2', 'c3']):
+            self.cache.set(key, number, 100 + number)
+        self.expire('c1', 'c2', 'c3')
+        self.assertEqual(len(self.rows()), 15)
+        # 3 expired, then 2 over MAX_ENTRIES and MAX_ENTRIES / CULL_FREQUENCY
+        # more, the soonest to expire
+        self.assertEqual(self.cache.sweep(), 10)
+        self.assertEqual(self.rows(), ['b5', 'b6', 'b7', 'b8', 'b9'])
+        # Under MAX_ENTRIES with nothing expired, nothing to do
+        self.assertEqual(self.cache.sweep(), 0)
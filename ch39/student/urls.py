@@ -1,6 +1,6 @@
 from django.urls import path
 from student.views import home, course, result
-from django.views.decorators.cache import cache_page
+from student.decorators import cache_page
 
 urlpatterns = [
     path('', home, name="home"),
@@ -8,5 +8,5 @@ urlpatterns = [
     path('index/', home, name="index"),
 
     path('course/', course, name="course"),
-    path('result/', cache_page(30)(result), name="result"),
+    path('result/', cache_page(30, stale_while_revalidate=30, stale_if_error=300)(result), name="result"),
 ]
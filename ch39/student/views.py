@@ -1,10 +1,12 @@
 from django.shortcuts import render
-from django.views.decorators.cache import cache_page
+from student.decorators import cache_page
 
 def home(request):
   return render(request, 'student/home.html')
 
-@cache_page(30)
+# One request renders the page after it expires, the others get the
+# stale copy for up to 30 seconds, or for 5 minutes while it fails
+@cache_page(30, stale_while_revalidate=30, stale_if_error=300)
 def course(request):
   return render(request, 'student/course.html')
 
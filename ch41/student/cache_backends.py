@@ -0,0 +1,448 @@
+import base64
+import logging
+import os
+import pickle
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connections, router, transaction
+from django.utils.timezone import now as tz_now
+
+# A missing value, None is a value that can be cached
+MISSING = object()
+
+# L1 state per LOCATION. Django makes a cache instance per thread, these
+# are shared by all of them, as LocMemCache does with its _caches.
+_l1_caches = {}  # key -> (expires at, pickled value), least recently used first
+_l1_counters = {}  # 'bytes' pickled, 'hits', 'misses'
+_l1_locks = {}
+
+
+class TwoTierCache(BaseCache):
+    # A small in-process LRU (L1) in front of any configured cache (L2), so
+    # repeated reads of hot keys skip the SQL round trip of DatabaseCache or
+    # the file read of FileBasedCache:
+    #
+    #   CACHES = {
+    #       'default': {
+    #           'BACKEND': 'student.cache_backends.TwoTierCache',
+    #           'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': 5, 'L1_MAX_BYTES': 8 * 1024 * 1024},
+    #       },
+    #       'shared': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    #                  'LOCATION': 'student_cache'},
+    #   }
+    #
+    # Reads go through L1 to L2 and fill L1 (read-through), writes go to L2
+    # first and then L1 (write-through). L1 is per process, shared by its
+    # threads (give each TwoTierCache alias its own LOCATION): a write by
+    # another process is seen here once the L1 entry expires, after
+    # L1_TIMEOUT seconds at most. L1 is bounded by entries (MAX_ENTRIES) and
+    # by pickled bytes (L1_MAX_BYTES), the least recently used entries go
+    # first.
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', location)
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self.l1_max_bytes = int(options.get('L1_MAX_BYTES', 8 * 1024 * 1024))
+        # Bigger values are left to L2, one must not flush the whole L1
+        self.l1_max_item_bytes = int(options.get('L1_MAX_ITEM_BYTES', self.l1_max_bytes // 16))
+        self._l1 = _l1_caches.setdefault(location, OrderedDict())
+        self._counters = _l1_counters.setdefault(location, Counter())
+        self._lock = _l1_locks.setdefault(location, threading.Lock())
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # L1
+
+    def _l1_get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return MISSING
+            expires, pickled = entry
+            if expires <= now:
+                self._l1_remove(key)
+                self._counters['misses'] += 1
+                return MISSING
+            self._l1.move_to_end(key)
+            self._counters['hits'] += 1
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        timeout = self.get_backend_timeout(timeout)
+        ttl = self.l1_timeout if timeout is None else min(timeout - time.time(), self.l1_timeout)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1_remove(key)
+            if ttl <= 0 or len(pickled) > self.l1_max_item_bytes:
+                return
+            self._l1[key] = (time.monotonic() + ttl, pickled)
+            self._counters['bytes'] += len(pickled)
+            while (self._counters['bytes'] > self.l1_max_bytes
+                   or len(self._l1) > self._max_entries):
+                self._l1_remove(next(iter(self._l1)))
+
+    def _l1_remove(self, key):
+        # Caller holds the lock
+        entry = self._l1.pop(key, None)
+        if entry is not None:
+            self._counters['bytes'] -= len(entry[1])
+
+    def _l1_delete(self, key):
+        with self._lock:
+            self._l1_remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {'l1_hits': self._counters['hits'], 'l1_misses': self._counters['misses'],
+                    'l1_entries': len(self._l1), 'l1_bytes': self._counters['bytes']}
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        value = self._l1_get(l1_key)
+        if value is not MISSING:
+            return value
+        value = self.l2.get(key, MISSING, version=version)
+        if value is MISSING:
+            return default
+        self._l1_set(l1_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, remaining = {}, {}
+        for key in keys:
+            l1_key = self.make_and_validate_key(key, version=version)
+            value = self._l1_get(l1_key)
+            if value is MISSING:
+                remaining[key] = l1_key
+            else:
+                found[key] = value
+        if remaining:
+            # One round trip for everything L1 didn't have
+            loaded = self.l2.get_many(list(remaining), version=version)
+            for key, value in loaded.items():
+                self._l1_set(remaining[key], value)
+            found.update(loaded)
+        return found
+
+    def has_key(self, key, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        return self._l1_get(l1_key) is not MISSING or self.l2.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self.l2.set(key, value, timeout=self._l2_timeout(timeout), version=version)
+        self._l1_set(l1_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        added = self.l2.add(key, value, timeout=self._l2_timeout(timeout), version=version)
+        if added:
+            self._l1_set(l1_key, value, timeout)
+        else:
+            # Someone else's value is in L2, read it from there next time
+            self._l1_delete(l1_key)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_keys = {key: self.make_and_validate_key(key, version=version) for key in data}
+        failed = self.l2.set_many(data, timeout=self._l2_timeout(timeout), version=version)
+        for key, value in data.items():
+            if key in failed:
+                self._l1_delete(l1_keys[key])
+            else:
+                self._l1_set(l1_keys[key], value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.l2.touch(key, timeout=self._l2_timeout(timeout), version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.l2.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._l1_delete(self.make_and_validate_key(key, version=version))
+        self.l2.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Atomic in L2 only, L1 rereads the result
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.l2.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.l2.decr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+            self._counters['bytes'] = 0
+        self.l2.clear()
+
+    def _l2_timeout(self, timeout):
+        # Our default timeout applies to both tiers
+        return self.default_timeout if timeout == DEFAULT_TIMEOUT else timeout
+
+
+# Set-based DatabaseCache
+#
+# DatabaseCache runs set() and set_many() as a SELECT COUNT(*) of the whole
+# table, maybe a cull, then a SELECT and an INSERT or UPDATE for every key.
+# Here:
+#
+#   get_many()     one SELECT ... WHERE cache_key IN (...), expired rows are
+#                  skipped in SQL and left to the sweeper
+#   set_many()     one multi-row INSERT ... ON CONFLICT DO UPDATE (ON
+#                  DUPLICATE KEY UPDATE on MySQL), set() is a set_many()
+#   add()          one INSERT ... ON CONFLICT DO UPDATE ... WHERE expired
+#   delete_many()  one DELETE ... WHERE cache_key IN (...), as in Django
+#
+# Nothing is culled inside a write. A background thread, one per process
+# and table, runs sweep() every SWEEP_INTERVAL seconds: it deletes expired
+# rows SWEEP_BATCH_SIZE at a time by the index on expires (createcachetable
+# makes it, `manage.py sweep_cache` adds it to older tables), then the
+# soonest to expire while the table is over MAX_ENTRIES. With
+# SWEEP_INTERVAL 0 no thread is started, run `manage.py sweep_cache` from
+# cron instead.
+#
+#   'database': {
+#       'BACKEND': 'student.cache_backends.BatchedDatabaseCache',
+#       'LOCATION': 'student_cache',
+#       'OPTIONS': {'MAX_ENTRIES': 100000, 'SWEEP_INTERVAL': 60},
+#   }
+
+logger = logging.getLogger(__name__)
+
+# (database alias, table) -> sweeper thread of this process
+_sweepers = {}
+_sweepers_lock = threading.Lock()
+# Threads don't survive a fork(), a forked worker starts its own
+os.register_at_fork(after_in_child=_sweepers.clear)
+
+
+class BatchedDatabaseCache(DatabaseCache):
+    def __init__(self, table, params):
+        super().__init__(table, params)
+        options = params.get('OPTIONS', {})
+        self.sweep_interval = float(options.get('SWEEP_INTERVAL', 60))
+        self.sweep_batch_size = int(options.get('SWEEP_BATCH_SIZE', 1000))
+
+    def _connection(self, write=True):
+        db = (router.db_for_write if write else router.db_for_read)(self.cache_model_class)
+        return db, connections[db]
+
+    def _chunks(self, connection, items, params_per_item):
+        # SQLite takes at most 999 parameters in a statement
+        size = max(1, (connection.features.max_query_params or 3000) // params_per_item - 1)
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+    def _now(self, connection):
+        return connection.ops.adapt_datetimefield_value(tz_now().replace(microsecond=0))
+
+    def _expires(self, connection, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            expires = datetime.max
+        else:
+            tz = dt_timezone.utc if settings.USE_TZ else None
+            expires = datetime.fromtimestamp(timeout, tz=tz)
+        return connection.ops.adapt_datetimefield_value(expires.replace(microsecond=0))
+
+    def _encode(self, value):
+        return base64.b64encode(pickle.dumps(value, self.pickle_protocol)).decode('latin1')
+
+    def _upsert_sql(self, connection, rows, only_expired=False):
+        quote_name = connection.ops.quote_name
+        table, key = quote_name(self._table), quote_name('cache_key')
+        value, expires = quote_name('value'), quote_name('expires')
+        sql = 'INSERT INTO %s (%s, %s, %s) VALUES %s' % (
+            table, key, value, expires, ', '.join(['(%s, %s, %s)'] * rows))
+        if connection.vendor in ('sqlite', 'postgresql'):
+            sql += ' ON CONFLICT (%s) DO UPDATE SET %s = excluded.%s, %s = excluded.%s' % (
+                key, value, value, expires, expires)
+            if only_expired:
+                sql += ' WHERE %s.%s < %%s' % (table, expires)
+            return sql
+        if connection.vendor == 'mysql' and not only_expired:
+            return sql + ' ON DUPLICATE KEY UPDATE %s = VALUES(%s), %s = VALUES(%s)' % (
+                value, value, expires, expires)
+        return None
+
+    # Cache API
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        db, connection = self._connection(write=False)
+        quote_name = connection.ops.quote_name
+        now = self._now(connection)
+        result = {}
+        with connection.cursor() as cursor:
+            for chunk in self._chunks(connection, list(key_map), 1):
+                cursor.execute(
+                    'SELECT %s, %s FROM %s WHERE %s IN (%s) AND %s >= %%s' % (
+                        quote_name('cache_key'), quote_name('value'), quote_name(self._table),
+                        quote_name('cache_key'), ', '.join(['%s'] * len(chunk)),
+                        quote_name('expires')),
+                    chunk + [now])
+                for key, value in cursor.fetchall():
+                    value = connection.ops.process_clob(value)
+                    result[key_map[key]] = pickle.loads(base64.b64decode(value.encode()))
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        db, connection = self._connection()
+        if self._upsert_sql(connection, 1) is None:
+            return super().set(key, value, timeout, version=version)
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        # Duplicate keys in one upsert are an error on PostgreSQL
+        rows = {self.make_and_validate_key(key, version=version): self._encode(value)
+                for key, value in data.items()}
+        if not rows:
+            return []
+        db, connection = self._connection()
+        if self._upsert_sql(connection, 1) is None:
+            # No upsert on this database, a set() per key as in Django
+            for key, value in data.items():
+                super().set(key, value, timeout, version=version)
+            return []
+        expires = self._expires(connection, timeout)
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            for chunk in self._chunks(connection, list(rows.items()), 3):
+                cursor.execute(self._upsert_sql(connection, len(chunk)),
+                               [param for key, value in chunk for param in (key, value, expires)])
+        self._start_sweeper()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        db, connection = self._connection()
+        sql = self._upsert_sql(connection, 1, only_expired=True)
+        if sql is None:
+            return super().add(key, value, timeout, version=version)
+        key = self.make_and_validate_key(key, version=version)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [key, self._encode(value), self._expires(connection, timeout),
+                                 self._now(connection)])
+            added = cursor.rowcount == 1
+        self._start_sweeper()
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db, connection = self._connection()
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+                quote_name(self._table), quote_name('expires'), quote_name('cache_key')),
+                [self._expires(connection, timeout), key])
+            return cursor.rowcount == 1
+
+    def _cull(self, db, cursor, now, num):
+        # Left to sweep(), only reached by the fallbacks to DatabaseCache
+        pass
+
+    # Sweeping
+
+    def _delete_batch(self, connection, limit, expired_before=None):
+        quote_name = connection.ops.quote_name
+        table, key, expires = (quote_name(self._table), quote_name('cache_key'),
+                               quote_name('expires'))
+        condition, params = '', []
+        if expired_before is not None:
+            condition, params = '%s < %%s' % expires, [expired_before]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT %s FROM %s%s ORDER BY %s %s' % (
+                key, table, ' WHERE ' + condition if condition else '', expires,
+                connection.ops.limit_offset_sql(0, limit)), params)
+            keys = [row[0] for row in cursor.fetchall()]
+            if not keys:
+                return 0
+            # Only rows still expired, one may have been set again since
+            cursor.execute('DELETE FROM %s WHERE %s IN (%s)%s' % (
+                table, key, ', '.join(['%s'] * len(keys)),
+                ' AND ' + condition if condition else ''), keys + params)
+            return cursor.rowcount
+
+    def sweep(self):
+        # Deletes expired rows, then evicts while over MAX_ENTRIES. Every
+        # batch is its own short statement, writers wait for one batch at
+        # most. Returns the number of rows deleted.
+        db, connection = self._connection()
+        batch_size = min(self.sweep_batch_size, (connection.features.max_query_params or 3000) - 1)
+        now = self._now(connection)
+        deleted = 0
+        while True:
+            count = self._delete_batch(connection, batch_size, expired_before=now)
+            deleted += count
+            if count < batch_size:
+                break
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s' % connection.ops.quote_name(self._table))
+            excess = cursor.fetchone()[0] - self._max_entries
+        if excess > 0:
+            if self._cull_frequency == 0:
+                self.clear()
+                return deleted + excess + self._max_entries
+            # Make room like DatabaseCache, a 1/CULL_FREQUENCY of the entries
+            excess += self._max_entries // self._cull_frequency
+            while excess > 0:
+                count = self._delete_batch(connection, min(batch_size, excess))
+                if not count:
+                    break
+                deleted += count
+                excess -= count
+        return deleted
+
+    def _start_sweeper(self):
+        if not self.sweep_interval:
+            return
+        db, connection = self._connection()
+        with _sweepers_lock:
+            if (db, self._table) in _sweepers:
+                return
+            thread = threading.Thread(target=self._sweep_forever, args=(db,), daemon=True,
+                                      name=f'cache-sweeper-{self._table}')
+            _sweepers[db, self._table] = thread
+        thread.start()
+
+    def _sweep_forever(self, db):
+        try:
+            while True:
+                # Processes started together don't sweep together
+                time.sleep(self.sweep_interval * random.uniform(0.5, 1.5))
+                try:
+                    self.sweep()
+                except Exception:
+                    # Whatever failed, keep sweeping: nothing else culls
+                    logger.exception("Sweeping cache table %s failed", self._table)
+                finally:
+                    connections[db].close()
+        finally:
+            # Should the thread end anyway, the next cache instance of the
+            # process starts a new one
+            with _sweepers_lock:
+                if _sweepers.get((db, self._table)) is threading.current_thread():
+                    del _sweepers[db, self._table]
@@ -0,0 +1,144 @@
+import base64
+import pickle
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import Command as CreateCacheTable
+from django.db import connection, transaction
+from django.utils.timezone import now as tz_now
+from student.benchmark import test_database
+from student.cache_backends import BatchedDatabaseCache
+
+TABLE = 'bench_db_cache'
+
+
+def measure(operation, iterations):
+    latencies = []
+    for number in range(iterations):
+        started = time.perf_counter()
+        operation(number)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.median(latencies) * 1e3, latencies[int(len(latencies) * 0.99)] * 1e3
+
+
+class Command(BaseCommand):
+    help = ("Compare DatabaseCache and BatchedDatabaseCache on a cache table of --rows rows "
+            "in a throwaway database: multi-key operations, and culling against sweeping")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--expired', type=float, default=0.1,
+                            help="Share of the rows that are expired")
+        parser.add_argument('--iterations', type=int, default=300)
+
+    def handle(self, *args, **options):
+        self.connection = connection
+        self.rows = options['rows']
+        # Dropped with the database, the table never reaches db.sqlite3
+        with test_database():
+            create = CreateCacheTable()
+            create.verbosity = 0
+            create.create_table(connection.alias, TABLE, dry_run=False)
+            self.fill(options['expired'])
+            self.compare(options['iterations'])
+            self.compare_culling(options['expired'])
+
+    def caches(self, max_entries):
+        return {
+            'DatabaseCache': DatabaseCache(TABLE, {'OPTIONS': {'MAX_ENTRIES': max_entries}}),
+            'Batched': BatchedDatabaseCache(TABLE, {'OPTIONS': {'MAX_ENTRIES': max_entries,
+                                                                'SWEEP_INTERVAL': 0}}),
+        }
+
+    def fill(self, expired):
+        started = time.perf_counter()
+        cache = DatabaseCache(TABLE, {})
+        value = base64.b64encode(pickle.dumps({'name': 'Sonam', 'roll': 101})).decode('latin1')
+        ops = self.connection.ops
+        alive = ops.adapt_datetimefield_value((tz_now() + timedelta(days=1)).replace(microsecond=0))
+        dead = ops.adapt_datetimefield_value((tz_now() - timedelta(days=1)).replace(microsecond=0))
+        every = round(1 / expired) if expired else 0
+        sql = 'INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s, %%s)' % (
+            ops.quote_name(TABLE), ops.quote_name('cache_key'), ops.quote_name('value'),
+            ops.quote_name('expires'))
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            for start in range(0, self.rows, 10_000):
+                cursor.executemany(sql, [
+                    (cache.make_key(f'bench:{number}'), value,
+                     dead if every and number % every == 0 else alive)
+                    for number in range(start, min(start + 10_000, self.rows))])
+        self.stdout.write(f"{self.rows:,} rows in {TABLE} in {time.perf_counter() - started:.1f} s")
+
+    def compare(self, iterations):
+        # MAX_ENTRIES above the row count: DatabaseCache counts the table on
+        # every write but never culls here
+        data = {'name': 'Sonam', 'roll': 101}
+        for name, cache in self.caches(self.rows * 2).items():
+            # Keys spread over the table, never expired ones (multiples of 10)
+            def keys(number, size=10):
+                base = number * 7919 % (self.rows - size * 10)
+                return [f'bench:{base + offset * 10 + 1}' for offset in range(size)]
+
+            operations = {
+                'get_many(10)': lambda number: cache.get_many(keys(number)),
+                'set': lambda number: cache.set(keys(number, 1)[0], data, 3600),
+                'set_many(10)': lambda number: cache.set_many(
+                    dict.fromkeys(keys(number), data), 3600),
+                'add': lambda number: cache.add(f'bench:new:{name}:{number}', data, 3600),
+                'delete_many(10)': lambda number: cache.delete_many(
+                    [f'bench:new:{name}:{number}'] + keys(number + iterations, 9)),
+            }
+            for operation_name, operation in operations.items():
+                p50, p99 = measure(operation, iterations)
+                self.stdout.write(f"{name:<14} {operation_name:<16} p50 {p50:8.2f} ms  "
+                                  f"p99 {p99:8.2f} ms")
+
+    def compare_culling(self, expired):
+        # What one write pays to make room when the table is over
+        # MAX_ENTRIES, against the longest batch of the sweeper
+        max_entries = self.rows // 2
+        caches = self.caches(max_entries)
+        batched = caches['Batched']
+        batches = []
+        delete_batch = batched._delete_batch
+
+        def timed_delete_batch(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return delete_batch(*args, **kwargs)
+            finally:
+                batches.append(time.perf_counter() - started)
+
+        batched._delete_batch = timed_delete_batch
+        started = time.perf_counter()
+        deleted = batched.sweep()
+        self.stdout.write(
+            f"{'Batched':<14} {'sweep':<16} {deleted:,} rows in {len(batches)} batches, "
+            f"{time.perf_counter() - started:.2f} s in the background, longest batch "
+            f"{max(batches) * 1e3:.1f} ms")
+
+        self.refill(max_entries, expired)
+        cache = caches['DatabaseCache']
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s' % self.connection.ops.quote_name(TABLE))
+            before = cursor.fetchone()[0]
+        started = time.perf_counter()
+        cache.set('bench:cull', 'x', 3600)
+        elapsed = time.perf_counter() - started
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s' % self.connection.ops.quote_name(TABLE))
+            after = cursor.fetchone()[0]
+        self.stdout.write(f"{'DatabaseCache':<14} {'set() that culls':<16} {before - after + 1:,} "
+                          f"rows in {elapsed * 1e3:.0f} ms on the request path")
+
+    def refill(self, rows, expired):
+        # Back over MAX_ENTRIES, with the same share expired, for DatabaseCache
+        self.rows = rows * 2
+        self.stdout.write("Refilling for DatabaseCache")
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % self.connection.ops.quote_name(TABLE))
+        self.fill(expired)
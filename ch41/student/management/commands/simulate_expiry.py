@@ -0,0 +1,79 @@
+import math
+import random
+import statistics
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from student.xfetch import Entry, jittered, should_recompute
+
+
+class Command(BaseCommand):
+    help = ("Simulate hot keys that were all set at once and count recomputes per second "
+            "with plain expiry, jittered timeouts and XFetch early recomputation")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--rate', type=float, default=5, help="Requests per second per key")
+        parser.add_argument('--timeout', type=float, default=60)
+        parser.add_argument('--compute', type=float, default=0.2,
+                            help="Seconds a recompute takes")
+        parser.add_argument('--seconds', type=float, default=600)
+        parser.add_argument('--beta', type=float, default=1.0)
+        parser.add_argument('--jitter', type=float, default=0.1)
+        parser.add_argument('--seed', type=int, default=41)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['keys']} keys x {options['rate']:g} req/s, timeout {options['timeout']:g} s, "
+            f"compute {options['compute']:g} s, {options['seconds']:g} s simulated")
+        self.stdout.write(f"{'policy':<14} {'recomputes':>10} {'misses':>8} {'peak/s':>7} "
+                          f"{'p99/s':>6} {'mean/s':>7} {'stdev/s':>8}")
+        beta, jitter = options['beta'], options['jitter']
+        policies = [
+            ('get_or_set', 0.0, 0.0),
+            ('jitter', 0.0, jitter),
+            ('xfetch', beta, 0.0),
+            ('xfetch+jitter', beta, jitter),
+        ]
+        for name, beta, jitter in policies:
+            rng = random.Random(options['seed'])
+            per_second, recomputes, misses = Counter(), 0, 0
+            for _ in range(options['keys']):
+                key_recomputes, key_misses = self.simulate_key(rng, beta, jitter, options, per_second)
+                recomputes += key_recomputes
+                misses += key_misses
+            counts = [per_second[second] for second in range(int(options['seconds']))]
+            ordered = sorted(counts)
+            self.stdout.write(
+                f"{name:<14} {recomputes:>10,} {misses:>8,} {max(counts):>7} "
+                f"{ordered[int(len(ordered) * 0.99)]:>6} {statistics.mean(counts):>7.1f} "
+                f"{statistics.pstdev(counts):>8.1f}")
+
+    def simulate_key(self, rng, beta, jitter, options, per_second):
+        # Requests arrive at random (Poisson). A recompute started at t is
+        # stored at t + compute, until then readers see the old entry, or
+        # nothing once it expired: those all recompute too, as in
+        # cache.get_or_set(). Everything was set at 0, e.g. by a deploy.
+        timeout, compute, rate = options['timeout'], options['compute'], options['rate']
+
+        def stored_at(now):
+            return Entry(None, compute, now + jittered(timeout, jitter, rng))
+
+        entry, pending = stored_at(0), []
+        recomputes = misses = 0
+        now = rng.expovariate(rate)
+        while now < options['seconds']:
+            # Recomputes finished by now, the last one stored wins
+            while pending and pending[0][0] <= now:
+                entry = pending.pop(0)[1]
+            if now >= entry.expires:
+                misses += 1
+                recompute = True
+            else:
+                recompute = should_recompute(entry, now, beta, rng)
+            if recompute:
+                recomputes += 1
+                per_second[math.floor(now)] += 1
+                pending.append((now + compute, stored_at(now + compute)))
+            now += rng.expovariate(rate)
+        return recomputes, misses
@@ -0,0 +1,42 @@
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+
+class Command(BaseCommand):
+    help = ("Delete the expired rows of a BatchedDatabaseCache in batches and evict while "
+            "it is over MAX_ENTRIES, once or every --interval seconds")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cache', default='database')
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Seconds between sweeps, 0 sweeps once")
+
+    def handle(self, *args, **options):
+        cache = caches[options['cache']]
+        if not hasattr(cache, 'sweep'):
+            raise CommandError(f"Cache {options['cache']!r} is not a BatchedDatabaseCache")
+        self.ensure_expires_index(cache)
+        while True:
+            started = time.perf_counter()
+            deleted = cache.sweep()
+            self.stdout.write(f"Deleted {deleted:,} rows in {time.perf_counter() - started:.2f} s")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def ensure_expires_index(self, cache):
+        # createcachetable makes it, a table created by hand may lack it
+        connection = connections[router.db_for_write(cache.cache_model_class)]
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, cache._table)
+            if any(constraint['index'] and constraint['columns'] == ['expires']
+                   for constraint in constraints.values()):
+                return
+            quote_name = connection.ops.quote_name
+            cursor.execute('CREATE INDEX %s ON %s (%s)' % (
+                quote_name(f'{cache._table}_expires'), quote_name(cache._table),
+                quote_name('expires')))
+        self.stdout.write(f"Created the index on {cache._table}.expires")
@@ -1,3 +1,286 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now as tz_now
+from student import xfetch
+from student.cache_backends import BatchedDatabaseCache, _sweepers
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'xfetch-tests'}})
+class XFetchSetManyTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def test_timeout_zero_stores_nothing(self):
+        # As cache.set_many(data, 0): expired at once
+        self.assertEqual(xfetch.set_many({'a': 1, 'b': 2}, 0, cache=self.cache), [])
+        self.assertEqual(xfetch.get_many(['a', 'b'], cache=self.cache), {})
+
+    def test_timeouts_are_jittered_whole_seconds_at_most_the_timeout(self):
+        data = {f'key{number}': number for number in range(50)}
+        now = time.time()
+        xfetch.set_many(data, 100, jitter=0.1, cache=self.cache)
+        self.assertEqual(xfetch.get_many(data, cache=self.cache), data)
+        # LocMemCache keeps time.time() + timeout per key
+        ttls = {round(self.cache._expire_info[self.cache.make_key(key)] - now) for key in data}
+        self.assertLessEqual(ttls, set(range(90, 101)))
+        self.assertGreater(len(ttls), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'xfetch-tests'}})
+class XFetchGetOrComputeTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        self.computed = 0
+        self.now = time.time()
+
+    def compute(self):
+        self.computed += 1
+        return self.computed
+
+    def get(self, at, draw, beta=1.0):
+        # A read at self.now + at, random() returning draw
+        with mock.patch('student.xfetch.time.time', return_value=self.now + at), \
+                mock.patch('student.xfetch.random.random', return_value=draw):
+            return xfetch.get_or_compute('key', self.compute, 100, beta=beta, jitter=0,
+                                         cache=self.cache)
+
+    def store(self, delta):
+        # Took delta seconds to compute, expires at self.now + 100
+        with mock.patch('student.xfetch.time.time', return_value=self.now):
+            xfetch.set_entry(self.cache, 'key', 'stored', delta, 100, 0)
+
+    def test_missing_value_is_computed_and_stored(self):
+        self.assertEqual(self.get(0, 0.5), 1)
+        entry = self.cache.get('key')
+        self.assertEqual((entry.value, entry.expires), (1, self.now + 100))
+        self.assertEqual(self.get(1, 0.5), 1)
+        self.assertEqual(self.computed, 1)
+
+    def test_recompute_gets_likelier_towards_expiry(self):
+        # With delta 10 and random() 0.5: early by 10 * -log(0.5) = 6.9 seconds
+        self.store(delta=10)
+        self.assertEqual(self.get(50, 0.5), 'stored')
+        self.assertEqual(self.get(92, 0.5), 'stored')
+        # A luckier draw recomputes earlier
+        self.assertEqual(self.get(92, 0.99), 1)
+        self.store(delta=10)
+        self.assertEqual(self.get(94, 0.5), 2)
+        # beta 0 waits for the real expiry
+        self.store(delta=10)
+        self.assertEqual(self.get(99, 0.99, beta=0), 'stored')
+        self.assertEqual(self.computed, 2)
+
+    def test_one_early_recompute_spares_the_other_readers(self):
+        # Every one of these reads would recompute, but the first pushes
+        # the expiry a full timeout ahead for the others
+        self.store(delta=10)
+        values = [self.get(95, 0.9) for _ in range(20)]
+        self.assertEqual(values, [1] * 20)
+        self.assertEqual(self.computed, 1)
+
+    def test_concurrent_readers_of_an_expired_key_all_compute(self):
+        # get_or_compute() doesn't lock: readers arriving after the key is
+        # gone all compute, before it is gone they mostly don't (above)
+        barrier = threading.Barrier(4)
+        computed = []
+
+        def compute():
+            barrier.wait(timeout=5)
+            computed.append(None)
+            return 'value'
+
+        threads = [threading.Thread(target=xfetch.get_or_compute,
+                                    args=('key', compute, 100), kwargs={'cache': self.cache})
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(computed), 4)
+        self.assertEqual(xfetch.get_many(['key'], cache=self.cache), {'key': 'value'})
+
+
+class SweeperTests(SimpleTestCase):
+    def test_sweeper_survives_errors_and_deregisters_when_it_ends(self):
+        cache = BatchedDatabaseCache('sweeper_test_table', {'OPTIONS': {'SWEEP_INTERVAL': 0.01}})
+        calls = []
+
+        def sweep():
+            calls.append(None)
+            if len(calls) == 1:
+                raise RuntimeError("Not a DatabaseError")
+            # Ends the thread
+            raise SystemExit
+
+        with mock.patch.object(cache, 'sweep', side_effect=sweep), \
+                self.assertLogs('student.cache_backends', 'ERROR'):
+            cache._start_sweeper()
+            key = next(key for key in _sweepers if key[1] == 'sweeper_test_table')
+            _sweepers[key].join(timeout=5)
+        self.assertEqual(len(calls), 2)
+        self.assertNotIn(key, _sweepers)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'student.cache_backends.TwoTierCache',
+                'LOCATION': 'two-tier-tests',
+                'OPTIONS': {'L2': 'l2', 'L1_TIMEOUT': 5, 'L1_MAX_BYTES': 1000,
+                            'L1_MAX_ITEM_BYTES': 400}},
+    'l2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+           'LOCATION': 'two-tier-tests-l2'},
+})
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache, self.l2 = caches['default'], caches['l2']
+        self.cache.clear()
+
+    def test_read_through(self):
+        self.l2.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        # Served from L1 now
+        self.l2.set('a', 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get_many(['a', 'missing']), {'a': 1})
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+
+    def test_write_through(self):
+        self.cache.set('a', 1)
+        self.cache.set_many({'b': 2, 'c': 3})
+        self.assertEqual(self.l2.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+        self.l2.clear()
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+
+    def test_l1_is_shared_by_the_threads_of_a_process(self):
+        self.cache.set('a', 1)
+        self.l2.set('a', 2)
+        hits = self.cache.stats()['l1_hits']
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(
+            (caches['default'] is not self.cache, caches['default'].get('a'))))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [(True, 1)])
+        self.assertEqual(self.cache.stats()['l1_hits'], hits + 1)
+
+    def test_l1_entries_expire(self):
+        self.cache.set('a', 1)
+        self.cache.set('short', 1, timeout=2)
+        self.l2.set_many({'a': 2, 'short': 2})
+        now = time.monotonic()
+        with mock.patch('student.cache_backends.time.monotonic', return_value=now + 3):
+            # At most the key's own timeout
+            self.assertEqual(self.cache.get_many(['a', 'short']), {'a': 1, 'short': 2})
+        with mock.patch('student.cache_backends.time.monotonic', return_value=now + 6):
+            # And at most L1_TIMEOUT
+            self.assertEqual(self.cache.get('a'), 2)
+
+    def test_l1_is_bounded_by_bytes(self):
+        for key in 'abcd':
+            self.cache.set(key, key * 300)
+        stats = self.cache.stats()
+        self.assertLessEqual(stats['l1_bytes'], 1000)
+        self.assertEqual(stats['l1_entries'], 3)
+        # The least recently used went, it is still in L2
+        self.l2.set_many({key: 'changed' for key in 'abcd'})
+        self.assertEqual(self.cache.get('a'), 'changed')
+        self.assertEqual(self.cache.get('d'), 'd' * 300)
+        # Too big for L1 at all
+        self.cache.set('big', 'x' * 500)
+        self.l2.set('big', 'changed')
+        self.assertEqual(self.cache.get('big'), 'changed')
+
+    def test_delete_and_clear_reach_both_tiers(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.cache.delete('a')
+        self.cache.delete_many(['b'])
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'c': 3})
+        self.assertEqual(self.l2.get_many(['a', 'b', 'c']), {'c': 3})
+        self.cache.clear()
+        self.assertIsNone(self.l2.get('c'))
+        self.assertEqual((self.cache.get('c'), self.cache.stats()['l1_entries']), (None, 0))
+
+
+class BatchedDatabaseCacheTests(TestCase):
+    # On the cache table the test database is created with
+    def setUp(self):
+        self.cache = BatchedDatabaseCache('student_cache', {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2, 'SWEEP_INTERVAL': 0,
+            'SWEEP_BATCH_SIZE': 3}})
+        self.cache.clear()
+
+    def statements(self, function, *args, **kwargs):
+        # (result, the SQL run, savepoints left out)
+        with CaptureQueriesContext(connection) as queries:
+            result = function(*args, **kwargs)
+        return result, [query['sql'] for query in queries.captured_queries
+                        if 'SAVEPOINT' not in query['sql']]
+
+    def expire(self, *keys):
+        past = connection.ops.adapt_datetimefield_value(
+            (tz_now() - timedelta(minutes=1)).replace(microsecond=0))
+        with connection.cursor() as cursor:
+            cursor.executemany('UPDATE student_cache SET expires = %s WHERE cache_key = %s',
+                               [(past, self.cache.make_key(key)) for key in keys])
+
+    def rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT cache_key FROM student_cache ORDER BY cache_key')
+            return [key.split(':', 2)[2] for key, in cursor.fetchall()]
+
+    def test_set_many_is_one_upsert(self):
+        self.cache.set('a', 0)
+        failed, sql = self.statements(self.cache.set_many, {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(failed, [])
+        self.assertEqual(len(sql), 1)
+        self.assertIn('ON CONFLICT', sql[0])
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+
+    def test_get_many_is_one_select_without_expired_rows(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': None})
+        self.expire('b')
+        found, sql = self.statements(self.cache.get_many, ['a', 'b', 'c', 'missing'])
+        self.assertEqual(found, {'a': 1, 'c': None})
+        self.assertEqual(len(sql), 1)
+        # Skipped, not deleted: that is the sweeper's job
+        self.assertEqual(self.rows(), ['a', 'b', 'c'])
+
+    def test_add_only_replaces_expired_rows(self):
+        added, sql = self.statements(self.cache.add, 'a', 1)
+        self.assertTrue(added)
+        self.assertEqual(len(sql), 1)
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.expire('a')
+        self.assertTrue(self.cache.add('a', 3))
+        self.assertEqual(self.cache.get('a'), 3)
+
+    def test_delete_many_is_one_delete(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        _, sql = self.statements(self.cache.delete_many, ['a', 'b', 'missing'])
+        self.assertEqual(len(sql), 1)
+        self.assertEqual(self.rows(), ['c'])
+
+    def test_writes_never_cull_the_sweeper_does(self):
+        # Expiring one second apart, a* first
+        for number, key in enumerate(['a1', 'a2', 'a3', 'b1', 'b2', 'b3', 'b4', 'b5', 'b6',
+                                      'b7', 'b8', 'b9', 'c1', 'c2', 'c3']):
+            self.cache.set(key, number, 100 + number)
+        self.expire('c1', 'c2', 'c3')
+        self.assertEqual(len(self.rows()), 15)
+        # 3 expired, then 2 over MAX_ENTRIES and MAX_ENTRIES / CULL_FREQUENCY
+        # more, the soonest to expire
+        self.assertEqual(self.cache.sweep(), 10)
+        self.assertEqual(self.rows(), ['b5', 'b6', 'b7', 'b8', 'b9'])
+        # Under MAX_ENTRIES with nothing expired, nothing to do
+        self.assertEqual(self.cache.sweep(), 0)
@@ -1,5 +1,6 @@
 from django.shortcuts import render
 from django.core.cache import cache
+from student import xfetch
 
 # def course(request):
 #   mv = cache.get('movie', 'has_expired')
@@ -14,11 +15,20 @@ from django.core.cache import cache
 #   print(mv1)
 #   return render(request, 'student/course.html', {'mv':mv})
 
+# get_or_set() and set_many() with early recomputation and jittered
+# timeouts, so hot keys don't all expire in the same second
 def course(request):
+  mv = xfetch.get_or_compute('movie', lambda: 'The One', 60)
   data = {'name':'Sonam', 'roll':101}
-  cache.set_many(data, 30)
-  # stu = cache.get_many(data)
-  return render(request, 'student/course.html')
+  xfetch.set_many(data, 30)
+  # stu = xfetch.get_many(data)
+  return render(request, 'student/course.html', {'mv':mv})
+
+# def course(request):
+#   data = {'name':'Sonam', 'roll':101}
+#   cache.set_many(data, 30)
+#   # stu = cache.get_many(data)
+#   return render(request, 'student/course.html')
 
 # def course(request):
 #   cache.delete('movie', version=2)
@@ -0,0 +1,102 @@
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Any, NamedTuple
+
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+# Probabilistic early expiration ("XFetch", Vattani et al., Optimal
+# Probabilistic Cache Stampede Prevention, VLDB 2015) for cache.get_or_set().
+#
+# Keys set together with the same timeout expire together, and then every
+# request for them recomputes at once. get_or_compute() stores how long the
+# value took to compute next to it, and each read recomputes early with a
+# probability that grows as the expiry gets closer:
+#
+#   recompute if now - delta * beta * log(random()) >= expires
+#
+# delta is the compute time, beta > 1 recomputes earlier, 0 never early.
+# One reader usually refreshes a hot key shortly before it expires while the
+# others keep getting the cached value. On top of that the timeout is
+# shortened by up to `jitter` of itself (0.1 = 10%) so keys set together
+# don't expire together:
+#
+#   mv = get_or_compute('movie', lambda: Movie.objects.latest().title, 60)
+#
+# Values are stored as Entry tuples, read them back with get_or_compute(),
+# get_many() here, or cache.get(key).value.
+
+
+class Entry(NamedTuple):
+    value: Any
+    delta: float  # seconds it took to compute
+    expires: float  # time.time() it expires at, inf for never
+
+
+def jittered(timeout, jitter, rng=random):
+    # Only ever shorter, a value is never kept past the timeout asked for
+    if timeout is None:
+        return None
+    return timeout * (1 - jitter * rng.random())
+
+
+def should_recompute(entry, now, beta=1.0, rng=random):
+    # 1 - random() is in (0, 1], log() of it is <= 0
+    return now - entry.delta * beta * math.log(1 - rng.random()) >= entry.expires
+
+
+def set_entry(cache, key, value, delta, timeout, jitter, version=None):
+    ttl = jittered(timeout, jitter)
+    expires = math.inf if ttl is None else time.time() + ttl
+    cache.set(key, Entry(value, delta, expires), ttl, version=version)
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, *, beta=1.0, jitter=0.1,
+                   cache=None, version=None):
+    # Like cache.get_or_set(key, compute, timeout), compute is a callable
+    # (or a plain value), only called when the value is missing or due
+    cache = cache or default_cache
+    if timeout is DEFAULT_TIMEOUT:
+        timeout = cache.default_timeout
+    entry = cache.get(key, version=version)
+    if isinstance(entry, Entry) and not should_recompute(entry, time.time(), beta):
+        return entry.value
+    if callable(compute):
+        started = time.perf_counter()
+        value = compute()
+        delta = time.perf_counter() - started
+    else:
+        value, delta = compute, 0.0
+    set_entry(cache, key, value, delta, timeout, jitter, version)
+    return value
+
+
+def set_many(data, timeout=DEFAULT_TIMEOUT, *, jitter=0.1, cache=None, version=None):
+    # cache.set_many() with a jittered timeout per key. Keys are grouped by
+    # whole seconds of timeout, so it is a handful of set_many() calls.
+    # Rounded down, and only from a second up: 0 (expire at once) stays 0
+    # and a shorter timeout is never stretched to a whole second.
+    # Returns the keys that failed to be set, like cache.set_many().
+    cache = cache or default_cache
+    if timeout is DEFAULT_TIMEOUT:
+        timeout = cache.default_timeout
+    now = time.time()
+    groups = defaultdict(dict)
+    for key, value in data.items():
+        ttl = jittered(timeout, jitter)
+        if ttl is not None and ttl >= 1:
+            ttl = int(ttl)
+        groups[ttl][key] = Entry(value, 0.0, math.inf if ttl is None else now + ttl)
+    failed = []
+    for ttl, entries in groups.items():
+        failed += cache.set_many(entries, ttl, version=version)
+    return failed
+
+
+def get_many(keys, *, cache=None, version=None):
+    # {key: value} of the keys stored by set_many() or get_or_compute()
+    cache = cache or default_cache
+    return {key: entry.value for key, entry in cache.get_many(keys, version=version).items()
+            if isinstance(entry, Entry)}